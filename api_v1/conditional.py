@@ -0,0 +1,78 @@
+from typing import Annotated
+
+from fastapi import Header, Response, status
+
+from core.redis.cache_repository import CacheRepository
+from core.redis.redis_helper import GlobalConfig
+from core.redis.serializers import ENCODINGS, variant_etag
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Слабое сравнение ETag с заголовком If-None-Match"""
+    if if_none_match.strip() == "*":
+        return True
+    return etag.removeprefix("W/") in (
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    )
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """Предпочтительное сжатие из тех, что принимает клиент и хранит кэш"""
+    if not accept_encoding or not GlobalConfig.cache_precompress:
+        return None
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        weight = params.strip().removeprefix("q=")
+        try:
+            if params and float(weight) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in ENCODINGS:
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+class ClientCache:
+    """Заголовки запроса, по которым ответ отдается из кэша без его тела"""
+
+    def __init__(
+        self,
+        if_none_match: Annotated[str | None, Header()] = None,
+        accept_encoding: Annotated[str | None, Header()] = None,
+    ) -> None:
+        self.if_none_match = if_none_match
+        self.encoding = choose_encoding(accept_encoding)
+
+
+async def cached_response(
+    cache_repo: CacheRepository,
+    key: str,
+    client: ClientCache | None,
+) -> Response | None:
+    """Ответ по записи кэша без чтения и обработки ее тела.
+
+    304, если у клиента та же версия записи, или заранее сжатый вариант
+    тела, если клиент его принимает. Иначе ответ собирается как обычно.
+    """
+    if client is None or (client.if_none_match is None and client.encoding is None):
+        return None
+    etag, variant = await cache_repo.get_variant(key, client.encoding)
+    if etag is None:
+        return None
+    headers = {"ETag": etag}
+    if GlobalConfig.cache_precompress:
+        headers["Vary"] = "Accept-Encoding"
+    if variant is not None and client.encoding:
+        headers["ETag"] = variant_etag(etag, client.encoding)
+    if client.if_none_match is not None and etag_matches(
+        client.if_none_match, headers["ETag"]
+    ):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if variant is None or not client.encoding:
+        return None
+    headers["Content-Encoding"] = client.encoding
+    return Response(content=variant, media_type="application/json", headers=headers)
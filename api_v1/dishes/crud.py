@@ -1,25 +1,31 @@
 import uuid
 
-from sqlalchemy import select
+from sqlalchemy import Select, select
 from sqlalchemy.engine import Result
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
 
 from api_v1.dishes.schemas import DishCreate, DishUpdate, DishUpdatePartial
-from core.models import Dish, Menu, Submenu
+from api_v1.pagination import Page, paginate
+from core.models import Dish, Submenu
+
+
+def select_dishes(menu_id: uuid.UUID, submenu_id: uuid.UUID) -> Select:
+    """Блюда подменю, отобранные по индексу dishes.submenu_id"""
+    return (
+        select(Dish)
+        .join(Dish.submenu)
+        .where(Dish.submenu_id == submenu_id)
+        .where(Submenu.menu_id == menu_id)
+    )
 
 
 async def get_dishes(
     session: AsyncSession,
     menu_id: uuid.UUID,
     submenu_id: uuid.UUID,
+    page: Page | None = None,
 ) -> list[Dish]:
-    stmt = (
-        select(Dish)
-        .join(Dish.submenu)
-        .options(joinedload(Dish.submenu))
-        .where(Submenu.id == submenu_id and Menu.id == menu_id)
-    )
+    stmt = paginate(select_dishes(menu_id=menu_id, submenu_id=submenu_id), Dish, page)
     result: Result = await session.execute(stmt)
     dishes = result.scalars().all()
     return list(dishes)
@@ -31,14 +37,8 @@ async def get_dish_by_id(
     submenu_id: uuid.UUID,
     dish_id: uuid.UUID,
 ) -> Dish | None:
-    stmt = (
-        select(Dish)
-        .join(Dish.submenu)
-        .join(Submenu.menu)
-        .options(joinedload(Dish.submenu).joinedload(Submenu.menu))
-        .where(Menu.id == menu_id)
-        .where(Submenu.id == submenu_id)
-        .where(Dish.id == dish_id)
+    stmt = select_dishes(menu_id=menu_id, submenu_id=submenu_id).where(
+        Dish.id == dish_id
     )
     result: Result = await session.execute(stmt)
     dish = result.scalar()
@@ -3,7 +3,7 @@ from decimal import Decimal
 from typing import Annotated
 
 from annotated_types import MaxLen, MinLen
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 
 
 class DishBase(BaseModel):
@@ -29,3 +29,7 @@ class Dish(DishBase):
     model_config = ConfigDict(from_attributes=True)
 
     id: uuid.UUID
+
+
+dish_adapter = TypeAdapter(Dish)
+dish_list_adapter = TypeAdapter(list[Dish])
@@ -1,17 +1,34 @@
 import uuid
 from decimal import Decimal
+from functools import partial
 
-from fastapi import BackgroundTasks, Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Response, status
 from sqlalchemy.exc import DatabaseError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.models import db_helper
-from core.redis.cache_repository import CacheRepository
+from core.redis.cache_repository import (
+    CacheRepository,
+    dish_key,
+    dishes_key,
+    page_key,
+)
+from core.redis.serializers import decode, encode, from_cache
+from core.redis.write_behind import WriteBatch
 
+from ..conditional import ClientCache, cached_response
 from ..menus.dependencies import menu_by_id_not_from_cache
+from ..menus.snapshot import patch_branches
+from ..pagination import Page
 from ..submenus.dependencies import submenu_by_id_not_from_cache
 from . import crud
-from .schemas import Dish, DishCreate, DishUpdatePartial
+from .schemas import (
+    Dish,
+    DishCreate,
+    DishUpdatePartial,
+    dish_adapter,
+    dish_list_adapter,
+)
 
 
 class DishService:
@@ -29,45 +46,72 @@ class DishService:
 
     async def get_all_dishes(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
-    ) -> list[Dish]:
-        """Возвращает список всех блюд для подменю"""
+        page: Page,
+        client: ClientCache | None = None,
+    ) -> list[Dish] | Response:
+        """Возвращает страницу списка блюд подменю"""
+        key = page_key(dishes_key(menu_id, submenu_id), page.limit, page.cursor)
+        response = await cached_response(self.cache_repo, key, client)
+        if response is not None:
+            return response
         try:
-            cached_dishes = await self.cache_repo.get_list_dishes_cache(
-                menu_id=menu_id,
-                submenu_id=submenu_id,
-            )
-            if cached_dishes:
-                return cached_dishes
-            dishes = await crud.get_dishes(
+            cached_dishes = await self.cache_repo.fetch(
+                key,
+                partial(
+                    self.load_dishes,
+                    menu_id=menu_id,
+                    submenu_id=submenu_id,
+                    page=page,
+                ),
                 session=self.session,
-                menu_id=menu_id,
-                submenu_id=submenu_id,
-            )
-
-            for dish in dishes:
-                dish_discount = await self.get_dish_discount(dish.id)
-                if dish_discount is not None:
-                    dish_discount_decimal = Decimal(dish_discount)
-                    dish.price = dish.price - (dish.price * dish_discount_decimal)
-
-            background_tasks.add_task(
-                self.cache_repo.set_list_dishes_cache,
-                menu_id=menu_id,
-                submenu_id=submenu_id,
-                dishes=dishes,
+                cache_writes=cache_writes,
             )
-            return dishes
+            return from_cache(dish_list_adapter, cached_dishes)
         except DatabaseError:
             raise HTTPException(
                 status_code=500, detail="Internal server error occurred"
             )
 
+    async def load_dishes(
+        self,
+        session: AsyncSession,
+        cache_writes: WriteBatch,
+        menu_id: uuid.UUID,
+        submenu_id: uuid.UUID,
+        page: Page,
+    ) -> bytes:
+        """Загрузка страницы блюд из БД со скидками и запись в кэш"""
+        dishes = await crud.get_dishes(
+            session=session,
+            menu_id=menu_id,
+            submenu_id=submenu_id,
+            page=page,
+        )
+
+        discounts = await self.cache_repo.get_dish_discounts_from_cache(
+            dish.id for dish in dishes
+        )
+        for dish in dishes:
+            dish_discount_decimal = Decimal(discounts[dish.id])
+            dish.price = dish.price - (dish.price * dish_discount_decimal)
+
+        dishes_json = encode(dish_list_adapter, dishes)
+        cache_writes.add_task(
+            self.cache_repo.set_list_dishes_cache,
+            menu_id=menu_id,
+            submenu_id=submenu_id,
+            dishes=dishes_json,
+            limit=page.limit,
+            cursor=page.cursor,
+        )
+        return dishes_json
+
     async def create_dish(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
         dish_in: DishCreate,
@@ -85,11 +129,13 @@ class DishService:
                 submenu_id=submenu_id,
                 dish_in=dish_in,
             )
-            background_tasks.add_task(
+            cache_writes.add_task(patch_branches, self.cache_repo, menu_id)
+            cache_writes.add_task(
                 self.cache_repo.create_dish_cache,
                 menu_id=menu_id,
                 submenu_id=submenu_id,
-                dish=dish,
+                dish_id=dish.id,
+                dish=encode(dish_adapter, dish),
             )
             return dish
         except IntegrityError:
@@ -100,42 +146,57 @@ class DishService:
 
     async def get_dish_by_id(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
         dish_id: uuid.UUID,
-    ) -> Dish | None:
+    ) -> Dish:
         """Возвращает блюдо по его id"""
-        cached_dish = await self.cache_repo.get_dish_from_cache(
-            menu_id=menu_id,
-            submenu_id=submenu_id,
-            dish_id=dish_id,
+        cached_dish = await self.cache_repo.fetch(
+            dish_key(menu_id, submenu_id, dish_id),
+            partial(
+                self.load_dish,
+                menu_id=menu_id,
+                submenu_id=submenu_id,
+                dish_id=dish_id,
+            ),
+            session=self.session,
+            cache_writes=cache_writes,
         )
-        if cached_dish:
-            dish_discount = await self.get_dish_discount(dish_id=dish_id)
-            if dish_discount is not None:
-                dish_discount_decimal = Decimal(dish_discount)
-                cached_dish.price = cached_dish.price - (
-                    cached_dish.price * dish_discount_decimal
-                )
-            return cached_dish
+        dish = decode(dish_adapter, cached_dish)
+        dish_discount = await self.get_dish_discount(dish_id=dish_id)
+        if dish_discount is not None:
+            dish_discount_decimal = Decimal(dish_discount)
+            dish.price = dish.price - (dish.price * dish_discount_decimal)
+        return dish
 
+    async def load_dish(
+        self,
+        session: AsyncSession,
+        cache_writes: WriteBatch,
+        menu_id: uuid.UUID,
+        submenu_id: uuid.UUID,
+        dish_id: uuid.UUID,
+    ) -> bytes:
+        """Загрузка блюда из БД и запись в кэш"""
         try:
             dish = await crud.get_dish_by_id(
-                session=self.session,
+                session=session,
                 menu_id=menu_id,
                 submenu_id=submenu_id,
                 dish_id=dish_id,
             )
 
             if dish and dish.id is not None:
-                background_tasks.add_task(
+                dish_json = encode(dish_adapter, dish)
+                cache_writes.add_task(
                     self.cache_repo.set_dish_to_cache,
                     menu_id=menu_id,
                     submenu_id=submenu_id,
-                    dish=dish,
+                    dish_id=dish.id,
+                    dish=dish_json,
                 )
-                return dish
+                return dish_json
 
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -149,7 +210,7 @@ class DishService:
 
     async def update_dish(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
         dish: Dish,
@@ -163,11 +224,13 @@ class DishService:
                 dish_update=dish_update,
                 partial=True,
             )
-            background_tasks.add_task(
+            cache_writes.add_task(patch_branches, self.cache_repo, menu_id)
+            cache_writes.add_task(
                 self.cache_repo.update_dish_cache,
                 menu_id=menu_id,
                 submenu_id=submenu_id,
-                dish=dish,
+                dish_id=dish.id,
+                dish=encode(dish_adapter, dish),
             )
             return dish
         except IntegrityError:
@@ -178,13 +241,16 @@ class DishService:
 
     async def delete_dish(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu_id: uuid.UUID,
         dish: Dish,
     ) -> None:
         """Удаляет блюдо по его id"""
-        background_tasks.add_task(
+        cache_writes.add_task(patch_branches, self.cache_repo, menu_id)
+        cache_writes.add_task(
             self.cache_repo.delete_dish_from_cache,
             menu_id=menu_id,
+            submenu_id=dish.submenu_id,
+            dish_id=dish.id,
         )
         await crud.delete_dish(session=self.session, dish=dish)
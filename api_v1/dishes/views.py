@@ -1,8 +1,18 @@
 import uuid
 from typing import Annotated
 
-from fastapi import APIRouter, BackgroundTasks, Depends, Path, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    Path,
+    Response,
+    status,
+)
+
+from core.redis.write_behind import CacheWrites
 
+from ..conditional import ClientCache
+from ..pagination import Page, set_next_cursor
 from .dependencies import dish_by_id, dish_by_id_not_from_cache
 from .responses import (
     delete_dish_by_id_responses,
@@ -25,16 +35,23 @@ router = APIRouter(tags=["Dishes"])
     responses=get_all_dishes_responses,
 )
 async def get_dishes(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     menu_id: Annotated[uuid.UUID, Path],
     submenu_id: Annotated[uuid.UUID, Path],
+    response: Response,
+    page: Page = Depends(),
+    client: ClientCache = Depends(),
     repo: DishService = Depends(),
-) -> list[Dish]:
-    return await repo.get_all_dishes(
-        background_tasks=background_tasks,
+) -> list[Dish] | Response:
+    dishes = await repo.get_all_dishes(
+        cache_writes=cache_writes,
         menu_id=menu_id,
         submenu_id=submenu_id,
+        page=page,
+        client=client,
     )
+    set_next_cursor(dishes, page, response)
+    return dishes
 
 
 @router.post(
@@ -45,7 +62,7 @@ async def get_dishes(
     responses=post_dishes_responses,
 )
 async def create_dish(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     menu_id: Annotated[uuid.UUID, Path],
     submenu_id: Annotated[uuid.UUID, Path],
     dish_in: DishCreate,
@@ -55,7 +72,7 @@ async def create_dish(
     dish_in_data["price"] = str(dish_in_data["price"])
 
     return await repo.create_dish(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         menu_id=menu_id,
         submenu_id=submenu_id,
         dish_in=dish_in,
@@ -83,7 +100,7 @@ async def get_dish_by_id(
     responses=patch_dish_by_id_responses,
 )
 async def update_dish_partial(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     menu_id: Annotated[uuid.UUID, Path],
     submenu_id: Annotated[uuid.UUID, Path],
     dish_update: DishUpdatePartial,
@@ -91,7 +108,7 @@ async def update_dish_partial(
     repo: DishService = Depends(),
 ) -> Dish:
     return await repo.update_dish(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         menu_id=menu_id,
         submenu_id=submenu_id,
         dish=dish,
@@ -106,13 +123,13 @@ async def update_dish_partial(
     responses=delete_dish_by_id_responses,
 )
 async def delete_dish(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     menu_id: Annotated[uuid.UUID, Path],
-    dish: Dish = Depends(dish_by_id),
+    dish: Dish = Depends(dish_by_id_not_from_cache),
     repo: DishService = Depends(),
 ) -> None:
     await repo.delete_dish(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         menu_id=menu_id,
         dish=dish,
     )
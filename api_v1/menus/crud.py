@@ -1,64 +1,174 @@
 import uuid
+from collections.abc import AsyncIterator
+from typing import Any
 
-from sqlalchemy import select
+from sqlalchemy import Select, distinct, func, select
 from sqlalchemy.engine import Result
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from core.models import Menu, Submenu
+from core.models import Dish, Menu, Submenu
 
+from ..pagination import Page, paginate
 from .schemas import MenuCreate, MenuUpdatePartial
 
 
-async def get_all_base(session: AsyncSession):
-    stmt = (
-        select(Menu)
-        .options(selectinload(Menu.submenus).selectinload(Submenu.dishes))
-        .order_by(Menu.title)
+def select_tree() -> Select:
+    return select(Menu).options(
+        selectinload(Menu.submenus).selectinload(Submenu.dishes)
     )
-    result: Result = await session.execute(stmt)
-    menus = result.scalars().fetchall()
 
-    for menu in menus:
-        menu.submenus_count = len(menu.submenus)
-        menu.dishes_count = sum(len(submenu.dishes) for submenu in menu.submenus)
 
-        for submenu in menu.submenus:
-            submenu.dishes_count = len(submenu.dishes)
+def count_tree(menu: Menu) -> None:
+    menu.submenus_count = len(menu.submenus)
+    menu.dishes_count = sum(len(submenu.dishes) for submenu in menu.submenus)
 
-    return list(menus)
+    for submenu in menu.submenus:
+        submenu.dishes_count = len(submenu.dishes)
 
 
-async def get_menus(session: AsyncSession) -> list[Menu]:
-    stmt = (
-        select(Menu)
-        .options(selectinload(Menu.submenus).selectinload(Submenu.dishes))
-        .order_by(Menu.title)
-    )
+async def get_all_base(session: AsyncSession):
+    stmt = select_tree().order_by(Menu.title, Menu.id)
     result: Result = await session.execute(stmt)
-    menus = result.scalars().all()
+    menus = result.scalars().fetchall()
 
     for menu in menus:
-        menu.submenus_count = len(menu.submenus)
-        menu.dishes_count = sum(len(submenu.dishes) for submenu in menu.submenus)
+        count_tree(menu)
 
     return list(menus)
 
 
-async def get_menu_by_id(session: AsyncSession, menu_id: uuid.UUID) -> Menu | None:
+async def get_menu_tree(session: AsyncSession, menu_id: uuid.UUID) -> Menu | None:
+    """Меню с подменю и блюдами, одна ветка дерева get_all_base"""
+    stmt = select_tree().where(Menu.id == menu_id)
+    menu = (await session.execute(stmt)).scalar_one_or_none()
+    if menu is not None:
+        count_tree(menu)
+    return menu
+
+
+async def get_menu_ids(session: AsyncSession) -> list[uuid.UUID]:
+    """id всех меню в порядке дерева get_all_base"""
+    result = await session.execute(select(Menu.id).order_by(Menu.title, Menu.id))
+    return list(result.scalars())
+
+
+async def stream_all_base(
+    session: AsyncSession,
+    batch_size: int,
+) -> AsyncIterator[dict[str, Any]]:
+    """Дерево меню по одному меню, строки читаются серверным курсором.
+
+    Строки одного меню идут подряд, поэтому в памяти держится только
+    текущее меню, а не все дерево. Меню, подменю и блюда упорядочены по
+    (title, id), как в get_all_base.
+    """
     stmt = (
-        select(Menu)
-        .filter(Menu.id == menu_id)
-        .options(selectinload(Menu.submenus).selectinload(Submenu.dishes))
+        select(
+            Menu.id.label("menu_id"),
+            Menu.title.label("menu_title"),
+            Menu.description.label("menu_description"),
+            Submenu.id.label("submenu_id"),
+            Submenu.title.label("submenu_title"),
+            Submenu.description.label("submenu_description"),
+            Dish.id.label("dish_id"),
+            Dish.title.label("dish_title"),
+            Dish.description.label("dish_description"),
+            Dish.price,
+            Dish.dish_discount,
+        )
+        .outerjoin(Menu.submenus)
+        .outerjoin(Submenu.dishes)
+        .order_by(
+            Menu.title,
+            Menu.id,
+            Submenu.title,
+            Submenu.id,
+            Dish.title,
+            Dish.id,
+        )
+        .execution_options(yield_per=batch_size)
+    )
+    result = await session.stream(stmt)
+
+    menu: dict[str, Any] | None = None
+    submenu: dict[str, Any] | None = None
+    async for row in result:
+        if menu is None or menu["id"] != row.menu_id:
+            if menu is not None:
+                yield menu
+            menu = {
+                "id": row.menu_id,
+                "title": row.menu_title,
+                "description": row.menu_description,
+                "submenus_count": 0,
+                "dishes_count": 0,
+                "submenus": [],
+            }
+            submenu = None
+        if row.submenu_id is None:
+            continue
+        if submenu is None or submenu["id"] != row.submenu_id:
+            submenu = {
+                "id": row.submenu_id,
+                "title": row.submenu_title,
+                "description": row.submenu_description,
+                "dishes_count": 0,
+                "dishes": [],
+            }
+            menu["submenus"].append(submenu)
+            menu["submenus_count"] += 1
+        if row.dish_id is None:
+            continue
+        submenu["dishes"].append(
+            {
+                "id": row.dish_id,
+                "title": row.dish_title,
+                "description": row.dish_description,
+                "price": row.price,
+                "dish_discount": row.dish_discount,
+            }
+        )
+        submenu["dishes_count"] += 1
+        menu["dishes_count"] += 1
+    if menu is not None:
+        yield menu
+
+
+def select_menus_with_counts() -> Select:
+    """Меню с количеством подменю и блюд, посчитанным в БД одним запросом"""
+    return (
+        select(
+            Menu,
+            func.count(distinct(Submenu.id)).label("submenus_count"),
+            func.count(Dish.id).label("dishes_count"),
+        )
+        .outerjoin(Menu.submenus)
+        .outerjoin(Submenu.dishes)
+        .group_by(Menu.id)
     )
+
+
+def with_counts(result: Result) -> list[Menu]:
+    menus = []
+    for menu, submenus_count, dishes_count in result:
+        menu.submenus_count = submenus_count
+        menu.dishes_count = dishes_count
+        menus.append(menu)
+    return menus
+
+
+async def get_menus(session: AsyncSession, page: Page | None = None) -> list[Menu]:
+    stmt = paginate(select_menus_with_counts(), Menu, page)
     result: Result = await session.execute(stmt)
-    menu = result.scalar()
+    return with_counts(result)
 
-    if menu:
-        menu.submenus_count = len(menu.submenus)
-        menu.dishes_count = sum(len(submenu.dishes) for submenu in menu.submenus)
 
-    return await session.get(Menu, menu_id)
+async def get_menu_by_id(session: AsyncSession, menu_id: uuid.UUID) -> Menu | None:
+    stmt = select_menus_with_counts().where(Menu.id == menu_id)
+    result: Result = await session.execute(stmt)
+    menus = with_counts(result)
+    return menus[0] if menus else None
 
 
 async def create_menu(session: AsyncSession, menu_in: MenuCreate) -> Menu:
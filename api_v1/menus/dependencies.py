@@ -1,23 +1,27 @@
 import uuid
 from typing import Annotated
 
-from fastapi import BackgroundTasks, Depends, HTTPException, Path, status
+from fastapi import Depends, HTTPException, Path, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.models import Menu, db_helper
+from core.redis.write_behind import CacheWrites
 
+from ..conditional import ClientCache
 from .crud import get_menu_by_id
 from .service_repository import MenuService
 
 
 async def menu_by_id(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     menu_id: Annotated[uuid.UUID, Path],
+    client: ClientCache = Depends(),
     repo: MenuService = Depends(),
-) -> Menu:
+) -> Menu | Response:
     menu = await repo.get_menu_by_id(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         menu_id=menu_id,
+        client=client,
     )
     if menu is not None:
         return menu
@@ -2,7 +2,7 @@ import uuid
 from typing import Annotated
 
 from annotated_types import MaxLen, MinLen
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 
 from api_v1.submenus.schemas import FullBaseSubmenu
 
@@ -34,3 +34,9 @@ class Menu(MenuBase):
 
 class FullBase(Menu):
     submenus: list[FullBaseSubmenu]
+
+
+menu_adapter = TypeAdapter(Menu)
+menu_list_adapter = TypeAdapter(list[Menu])
+full_base_adapter = TypeAdapter(FullBase)
+full_base_list_adapter = TypeAdapter(list[FullBase])
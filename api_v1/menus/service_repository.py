@@ -1,15 +1,38 @@
 import uuid
+from collections.abc import AsyncIterator
 from decimal import Decimal
+from functools import partial
 
-from fastapi import BackgroundTasks, Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Response, status
 from sqlalchemy.exc import DatabaseError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from core.config import settings
 from core.models import Menu, db_helper
-from core.redis.cache_repository import CacheRepository
+from core.redis.cache_repository import (
+    ALL_BASE_KEY,
+    MENUS_KEY,
+    CacheRepository,
+    menu_key,
+    page_key,
+)
+from core.redis.redis_helper import GlobalConfig
+from core.redis.serializers import encode, from_cache
+from core.redis.write_behind import WriteBatch
 
+from ..conditional import ClientCache, cached_response
+from ..pagination import Page
 from . import crud
-from .schemas import FullBase, MenuCreate, MenuUpdatePartial
+from .schemas import (
+    FullBase,
+    MenuCreate,
+    MenuUpdatePartial,
+    full_base_adapter,
+    full_base_list_adapter,
+    menu_adapter,
+    menu_list_adapter,
+)
+from .snapshot import apply_discounts, join_branches, patch_branches
 
 
 class MenuService:
@@ -21,64 +44,142 @@ class MenuService:
         self.session = session
         self.cache_repo = cache_repo
 
-    async def get_dish_discount(self, dish_id: uuid.UUID) -> float:
-        """Возвращает скидку для указанного блюда из кеша Redis."""
-        return await self.cache_repo.get_dish_discount_from_cache(dish_id=dish_id)
-
     async def get_all_base(
         self,
-        background_tasks: BackgroundTasks,
-    ) -> list[FullBase]:
+        cache_writes: WriteBatch,
+        client: ClientCache | None = None,
+    ) -> list[FullBase] | Response:
         """Получение списка всех меню с подменю и блюдами"""
+        response = await cached_response(self.cache_repo, ALL_BASE_KEY, client)
+        if response is not None:
+            return response
         try:
-            cached_all_base = await self.cache_repo.get_all_base_cache()
-            if cached_all_base:
-                return cached_all_base
-            all_base = await crud.get_all_base(session=self.session)
-
-            for menu in all_base:
-                for submenu in menu.submenus:
-                    for dish in submenu.dishes:
-                        dish_discount = await self.get_dish_discount(dish.id)
-                        if dish_discount is not None:
-                            dish_discount_decimal = Decimal(dish_discount)
-                            dish.price = dish.price - (
-                                dish.price * dish_discount_decimal
-                            )
-
-            background_tasks.add_task(self.cache_repo.set_all_base_cache, all_base)
-            return all_base
+            cached_all_base = await self.cache_repo.fetch(
+                ALL_BASE_KEY,
+                self.load_all_base,
+                session=self.session,
+                cache_writes=cache_writes,
+            )
+            return from_cache(full_base_list_adapter, cached_all_base)
         except DatabaseError:
             raise HTTPException(
                 status_code=500, detail="Internal server error occurred"
             )
 
+    async def load_all_base(
+        self,
+        session: AsyncSession,
+        cache_writes: WriteBatch,
+    ) -> bytes:
+        """Сборка дерева меню из снимка веток и запись в кэш.
+
+        Без полного снимка дерево загружается из БД со скидками, и по нему
+        записывается снимок.
+        """
+        generation, all_base_json = None, None
+        if GlobalConfig.cache_tree_snapshot:
+            generation, all_base_json = await self.cache_repo.get_snapshot()
+
+        if all_base_json is None:
+            all_base = await crud.get_all_base(session=session)
+            await apply_discounts(self.cache_repo, all_base)
+            branches = {menu.id: encode(full_base_adapter, menu) for menu in all_base}
+            all_base_json = join_branches(branches.values())
+            if GlobalConfig.cache_tree_snapshot:
+                cache_writes.add_task(
+                    self.cache_repo.write_snapshot,
+                    generation=generation,
+                    order=list(branches),
+                    branches=branches,
+                    full=True,
+                )
+
+        cache_writes.add_task(self.cache_repo.set_all_base_cache, all_base_json)
+        return all_base_json
+
+    async def stream_all_base(self) -> AsyncIterator[bytes]:
+        """Дерево меню JSON-массивом по одному меню, в обход кэша.
+
+        Генератор выполняется после выхода из обработчика, когда сессия
+        запроса уже закрыта, поэтому строки читаются в своей сессии.
+        """
+        yield b"["
+        async with db_helper.session_factory() as session:
+            separator = b""
+            async for menu in crud.stream_all_base(
+                session=session,
+                batch_size=settings.stream_batch_size,
+            ):
+                dishes = [
+                    dish for submenu in menu["submenus"] for dish in submenu["dishes"]
+                ]
+                discounts = await self.cache_repo.get_dish_discounts_from_cache(
+                    dish["id"] for dish in dishes
+                )
+                for dish in dishes:
+                    dish_discount_decimal = Decimal(discounts[dish["id"]])
+                    dish["price"] = dish["price"] - (
+                        dish["price"] * dish_discount_decimal
+                    )
+                yield separator + encode(full_base_adapter, menu)
+                separator = b","
+        yield b"]"
+
     async def get_all_menus(
         self,
-        background_tasks: BackgroundTasks,
-    ) -> list[Menu]:
-        """Получения списка меню"""
+        cache_writes: WriteBatch,
+        page: Page,
+        client: ClientCache | None = None,
+    ) -> list[Menu] | Response:
+        """Получения страницы списка меню"""
+        key = page_key(MENUS_KEY, page.limit, page.cursor)
+        response = await cached_response(self.cache_repo, key, client)
+        if response is not None:
+            return response
         try:
-            cached_menus = await self.cache_repo.get_list_menus_cache()
-            if cached_menus:
-                return cached_menus
-            menus = await crud.get_menus(session=self.session)
-            background_tasks.add_task(self.cache_repo.set_list_menus_cache, menus)
-            return menus
+            cached_menus = await self.cache_repo.fetch(
+                key,
+                partial(self.load_menus, page=page),
+                session=self.session,
+                cache_writes=cache_writes,
+            )
+            return from_cache(menu_list_adapter, cached_menus)
         except DatabaseError:
             raise HTTPException(
                 status_code=500, detail="Internal server error occurred"
             )
 
+    async def load_menus(
+        self,
+        session: AsyncSession,
+        cache_writes: WriteBatch,
+        page: Page,
+    ) -> bytes:
+        """Загрузка страницы меню из БД и запись в кэш"""
+        menus = await crud.get_menus(session=session, page=page)
+        menus_json = encode(menu_list_adapter, menus)
+        cache_writes.add_task(
+            self.cache_repo.set_list_menus_cache,
+            menus_json,
+            limit=page.limit,
+            cursor=page.cursor,
+        )
+        return menus_json
+
     async def create_menu(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu_in: MenuCreate,
     ) -> Menu:
         """Создание нового меню"""
         try:
             menu = await crud.create_menu(session=self.session, menu_in=menu_in)
-            background_tasks.add_task(self.cache_repo.create_menu_cache, menu)
+            cache_writes.add_task(patch_branches, self.cache_repo, menu.id)
+            cache_writes.add_task(
+                self.cache_repo.create_menu_cache,
+                menu_id=menu.id,
+                menu=encode(menu_adapter, menu),
+            )
             return menu
         except IntegrityError:
             raise HTTPException(
@@ -88,18 +189,38 @@ class MenuService:
 
     async def get_menu_by_id(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu_id: uuid.UUID,
-    ) -> Menu | None:
+        client: ClientCache | None = None,
+    ) -> Menu | Response:
         """Получение меню по id"""
-        cached_menu = await self.cache_repo.get_menu_from_cache(menu_id=menu_id)
-        if cached_menu:
-            return cached_menu
+        response = await cached_response(self.cache_repo, menu_key(menu_id), client)
+        if response is not None:
+            return response
+        cached_menu = await self.cache_repo.fetch(
+            menu_key(menu_id),
+            partial(self.load_menu, menu_id=menu_id),
+            session=self.session,
+            cache_writes=cache_writes,
+        )
+        return from_cache(menu_adapter, cached_menu)
 
-        menu = await crud.get_menu_by_id(session=self.session, menu_id=menu_id)
+    async def load_menu(
+        self,
+        session: AsyncSession,
+        cache_writes: WriteBatch,
+        menu_id: uuid.UUID,
+    ) -> bytes:
+        """Загрузка меню из БД и запись в кэш"""
+        menu = await crud.get_menu_by_id(session=session, menu_id=menu_id)
         if menu and menu.id:
-            background_tasks.add_task(self.cache_repo.set_menu_to_cache, menu)
-            return menu
+            menu_json = encode(menu_adapter, menu)
+            cache_writes.add_task(
+                self.cache_repo.set_menu_to_cache,
+                menu_id=menu.id,
+                menu=menu_json,
+            )
+            return menu_json
 
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -108,7 +229,7 @@ class MenuService:
 
     async def update_menu(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu: Menu,
         menu_update: MenuUpdatePartial,
     ) -> Menu:
@@ -120,7 +241,12 @@ class MenuService:
                 menu_update=menu_update,
                 partial=True,
             )
-            background_tasks.add_task(self.cache_repo.update_menu_cache, updated_menu)
+            cache_writes.add_task(patch_branches, self.cache_repo, updated_menu.id)
+            cache_writes.add_task(
+                self.cache_repo.update_menu_cache,
+                menu_id=updated_menu.id,
+                menu=encode(menu_adapter, updated_menu),
+            )
             return updated_menu
         except IntegrityError:
             raise HTTPException(
@@ -130,9 +256,10 @@ class MenuService:
 
     async def delete_menu(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu: Menu,
     ) -> None:
         """Удаление меню по id"""
-        background_tasks.add_task(self.cache_repo.delete_menu_from_cache, menu.id)
+        cache_writes.add_task(patch_branches, self.cache_repo, menu.id)
+        cache_writes.add_task(self.cache_repo.delete_menu_from_cache, menu.id)
         await crud.delete_menu(session=self.session, menu=menu)
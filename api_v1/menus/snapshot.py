@@ -0,0 +1,78 @@
+import logging
+import uuid
+from collections.abc import Iterable
+from decimal import Decimal
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models import Menu, db_helper
+from core.redis.cache_repository import CacheRepository
+from core.redis.redis_helper import GlobalConfig
+from core.redis.serializers import encode
+
+from . import crud
+from .schemas import full_base_adapter
+
+# сколько раз перечитывать ветки, если снимок изменили параллельно
+PATCH_ATTEMPTS = 3
+
+
+async def apply_discounts(cache_repo: CacheRepository, menus: Iterable[Menu]) -> None:
+    """Цены блюд со скидками из кэша Redis"""
+    dishes = [
+        dish for menu in menus for submenu in menu.submenus for dish in submenu.dishes
+    ]
+    discounts = await cache_repo.get_dish_discounts_from_cache(
+        dish.id for dish in dishes
+    )
+    for dish in dishes:
+        dish_discount_decimal = Decimal(discounts[dish.id])
+        dish.price = dish.price - (dish.price * dish_discount_decimal)
+
+
+def join_branches(branches: Iterable[bytes]) -> bytes:
+    """JSON-массив дерева из JSON веток"""
+    return b"[" + b",".join(branches) + b"]"
+
+
+async def load_branches(
+    session: AsyncSession,
+    cache_repo: CacheRepository,
+    menu_ids: Iterable[uuid.UUID],
+) -> dict[uuid.UUID, bytes | None]:
+    """Ветки меню из БД, None - меню удалено"""
+    branches: dict[uuid.UUID, bytes | None] = {}
+    for menu_id in menu_ids:
+        menu = await crud.get_menu_tree(session=session, menu_id=menu_id)
+        if menu is None:
+            branches[menu_id] = None
+        else:
+            await apply_discounts(cache_repo, [menu])
+            branches[menu_id] = encode(full_base_adapter, menu)
+    return branches
+
+
+async def patch_branches(cache_repo: CacheRepository, *menu_ids: uuid.UUID) -> None:
+    """Обновление веток снимка дерева после записи в меню.
+
+    Перечитывает из БД только ветки указанных меню. Выполняется после
+    коммита в своей сессии, до инвалидации дерева в кэше, чтобы следующее
+    чтение собрало дерево уже из новых веток. Пока полного снимка нет,
+    только отмечает запись, чтобы параллельная полная загрузка не
+    сохранила снимок, прочитанный до нее.
+    """
+    if not GlobalConfig.cache_tree_snapshot:
+        return
+    for _ in range(PATCH_ATTEMPTS):
+        generation, complete = await cache_repo.get_snapshot_generation()
+        if not complete:
+            await cache_repo.touch_snapshot()
+            return
+        async with db_helper.session_factory() as session:
+            order = await crud.get_menu_ids(session=session)
+            branches = await load_branches(session, cache_repo, menu_ids)
+        if await cache_repo.write_snapshot(generation, order, branches):
+            return
+    # ветки все время меняются параллельно, дерево соберется из БД заново
+    logging.warning("menu tree snapshot dropped after %s attempts", PATCH_ATTEMPTS)
+    await cache_repo.delete_snapshot()
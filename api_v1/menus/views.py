@@ -1,5 +1,10 @@
-from fastapi import APIRouter, BackgroundTasks, Depends, status
+from fastapi import APIRouter, Depends, Response, status
+from fastapi.responses import StreamingResponse
 
+from core.redis.write_behind import CacheWrites
+
+from ..conditional import ClientCache
+from ..pagination import Page, set_next_cursor
 from .dependencies import menu_by_id, menu_by_id_not_from_cache
 from .responses import (
     delete_menu_by_id_responses,
@@ -22,10 +27,21 @@ router = APIRouter(tags=["Menus"])
     responses=get_all_menus_responses,
 )
 async def get_all_base(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
+    stream: bool = False,
+    client: ClientCache = Depends(),
     repo: MenuService = Depends(),
-) -> list[Menu]:
-    return await repo.get_all_base(background_tasks=background_tasks)
+) -> list[FullBase] | Response:
+    if stream:
+        # большой каталог отдается по частям без кэша и без дерева в памяти
+        return StreamingResponse(
+            repo.stream_all_base(),
+            media_type="application/json",
+        )
+    return await repo.get_all_base(
+        cache_writes=cache_writes,
+        client=client,
+    )
 
 
 @router.get(
@@ -36,10 +52,19 @@ async def get_all_base(
     responses=get_all_menus_responses,
 )
 async def get_menus(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
+    response: Response,
+    page: Page = Depends(),
+    client: ClientCache = Depends(),
     repo: MenuService = Depends(),
-) -> list[Menu]:
-    return await repo.get_all_menus(background_tasks=background_tasks)
+) -> list[Menu] | Response:
+    menus = await repo.get_all_menus(
+        cache_writes=cache_writes,
+        page=page,
+        client=client,
+    )
+    set_next_cursor(menus, page, response)
+    return menus
 
 
 @router.post(
@@ -50,12 +75,12 @@ async def get_menus(
     responses=post_menu_responses,
 )
 async def create_menu(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     menu_in: MenuCreate,
     repo: MenuService = Depends(),
 ) -> Menu:
     return await repo.create_menu(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         menu_in=menu_in,
     )
 
@@ -68,8 +93,8 @@ async def create_menu(
     responses=get_menu_by_id_responses,
 )
 async def get_menu_by_id(
-    menu: Menu = Depends(menu_by_id_not_from_cache),
-) -> Menu:
+    menu: Menu | Response = Depends(menu_by_id),
+) -> Menu | Response:
     return menu
 
 
@@ -81,13 +106,13 @@ async def get_menu_by_id(
     responses=patch_menu_by_id_responses,
 )
 async def update_menu_partial(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     menu_update: MenuUpdatePartial,
     menu: Menu = Depends(menu_by_id_not_from_cache),
     repo: MenuService = Depends(),
 ) -> Menu:
     return await repo.update_menu(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         menu=menu,
         menu_update=menu_update,
     )
@@ -100,11 +125,11 @@ async def update_menu_partial(
     responses=delete_menu_by_id_responses,
 )
 async def delete_menu(
-    background_tasks: BackgroundTasks,
-    menu: Menu = Depends(menu_by_id),
+    cache_writes: CacheWrites,
+    menu: Menu = Depends(menu_by_id_not_from_cache),
     repo: MenuService = Depends(),
 ) -> None:
     return await repo.delete_menu(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         menu=menu,
     )
@@ -0,0 +1,89 @@
+import base64
+import binascii
+import json
+import uuid
+from typing import Annotated, Any
+
+from fastapi import HTTPException, Query, Response, status
+from sqlalchemy import Select, tuple_
+
+from core.config import settings
+from core.models import Base
+from core.redis.serializers import decompress
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(title: str, item_id: uuid.UUID | str) -> str:
+    """Курсор на позицию после элемента в порядке (title, id)"""
+    raw = json.dumps([title, str(item_id)], ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[str, uuid.UUID]:
+    try:
+        title, item_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return str(title), uuid.UUID(item_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="invalid cursor",
+        )
+
+
+class Page:
+    """Параметры страницы списка: размер и курсор предыдущей страницы.
+
+    Без limit и cursor отдается весь список, как до постраничной выдачи;
+    курсор без limit отдает страницу размера по умолчанию.
+    """
+
+    def __init__(
+        self,
+        limit: Annotated[int | None, Query(ge=1, le=settings.max_page_size)] = None,
+        cursor: Annotated[str | None, Query()] = None,
+    ) -> None:
+        if limit is None and cursor:
+            limit = settings.page_size
+        self.limit = limit
+        self.cursor = cursor
+        self.after = decode_cursor(cursor) if cursor else None
+
+
+def paginate(stmt: Select, model: type[Base], page: Page | None) -> Select:
+    """Сортировка по (title, id) и отбор страницы по ключу, а не через OFFSET"""
+    stmt = stmt.order_by(model.title, model.id)
+    if page is None:
+        return stmt
+    if page.after is not None:
+        stmt = stmt.where(tuple_(model.title, model.id) > page.after)
+    if page.limit is None:
+        return stmt
+    return stmt.limit(page.limit)
+
+
+def set_next_cursor(
+    items: list[Any] | Response, page: Page, response: Response
+) -> None:
+    """Курсор следующей страницы в заголовке, если страница заполнена"""
+    if page.limit is None:
+        return
+    if isinstance(items, Response):
+        if items.status_code == status.HTTP_304_NOT_MODIFIED:
+            return
+        response = items
+        body = items.body
+        if encoding := items.headers.get("Content-Encoding"):
+            # страница ограничена max_page_size, распаковка дешевле сжатия
+            body = decompress(body, encoding)
+        rows: list[Any] = json.loads(body)
+    else:
+        rows = items
+    if len(rows) < page.limit:
+        return
+    last = rows[-1]
+    if isinstance(last, dict):
+        title, item_id = last["title"], last["id"]
+    else:
+        title, item_id = last.title, last.id
+    response.headers[NEXT_CURSOR_HEADER] = encode_cursor(title, item_id)
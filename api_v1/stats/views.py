@@ -0,0 +1,25 @@
+from typing import Any
+
+from fastapi import APIRouter, status
+
+from core.redis.local_cache import local_cache, redis_stats
+from core.redis.redis_helper import redis_helper
+from core.redis.write_behind import write_behind
+
+router = APIRouter(tags=["Stats"])
+
+
+@router.get(
+    "/",
+    status_code=status.HTTP_200_OK,
+    summary="Возвращает метрики пула Redis, уровней кэша и очереди записей",
+)
+async def get_stats() -> dict[str, Any]:
+    return {
+        "redis_pool": redis_helper.stats(),
+        "cache": {
+            "local": local_cache.stats(),
+            "redis": redis_stats.stats(),
+        },
+        "write_behind": write_behind.stats(),
+    }
@@ -1,23 +1,26 @@
 import uuid
 
-from sqlalchemy import select
+from sqlalchemy import Select, func, select
 from sqlalchemy.engine import Result
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload, selectinload
 
-from core.models import Menu, Submenu
+from core.models import Dish, Submenu
 
+from ..pagination import Page, paginate
 from .schemas import SubmenuCreate, SubmenuUpdate, SubmenuUpdatePartial
 
 
-async def get_submenus(session: AsyncSession, menu_id: uuid.UUID) -> list[Submenu]:
-    stmt = (
-        select(Submenu)
-        .join(Submenu.menu)
-        .options(joinedload(Submenu.menu))
-        .where(Menu.id == menu_id)
-        .order_by(Submenu.title)
-    )
+def select_submenus(menu_id: uuid.UUID, page: Page | None = None) -> Select:
+    """Подменю меню, отобранные по индексу submenus.menu_id"""
+    return paginate(select(Submenu).where(Submenu.menu_id == menu_id), Submenu, page)
+
+
+async def get_submenus(
+    session: AsyncSession,
+    menu_id: uuid.UUID,
+    page: Page | None = None,
+) -> list[Submenu]:
+    stmt = select_submenus(menu_id=menu_id, page=page)
     result: Result = await session.execute(stmt)
     submenus = result.scalars().all()
 
@@ -30,18 +33,18 @@ async def get_submenu_by_id(
     submenu_id: uuid.UUID,
 ) -> Submenu | None:
     stmt = (
-        select(Submenu)
-        .options(selectinload(Submenu.dishes))
-        .join(Submenu.menu)
-        .where(Menu.id == menu_id)
+        select(Submenu, func.count(Dish.id))
+        .outerjoin(Submenu.dishes)
+        .where(Submenu.menu_id == menu_id)
         .where(Submenu.id == submenu_id)
+        .group_by(Submenu.id)
     )
     result: Result = await session.execute(stmt)
-    submenu = result.scalar()
-
-    if submenu:
-        submenu.dishes_count = len(submenu.dishes)
+    row = result.first()
+    if row is None:
+        return None
 
+    submenu, submenu.dishes_count = row
     return submenu
 
 
@@ -1,25 +1,29 @@
 import uuid
 from typing import Annotated
 
-from fastapi import BackgroundTasks, Depends, HTTPException, Path, status
+from fastapi import Depends, HTTPException, Path, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.models import Submenu, db_helper
+from core.redis.write_behind import CacheWrites
 
+from ..conditional import ClientCache
 from .crud import get_submenu_by_id
 from .service_repository import SubmenuService
 
 
 async def submenu_by_id(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     menu_id: Annotated[uuid.UUID, Path],
     submenu_id: Annotated[uuid.UUID, Path],
+    client: ClientCache = Depends(),
     repo: SubmenuService = Depends(),
-) -> Submenu:
+) -> Submenu | Response:
     submenu = await repo.get_submenu_by_id(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         menu_id=menu_id,
         submenu_id=submenu_id,
+        client=client,
     )
     if submenu is not None:
         return submenu
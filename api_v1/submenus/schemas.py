@@ -2,7 +2,7 @@ import uuid
 from typing import Annotated
 
 from annotated_types import MaxLen, MinLen
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, TypeAdapter
 
 from api_v1.dishes.schemas import Dish
 
@@ -33,3 +33,7 @@ class Submenu(SubmenuBase):
 
 class FullBaseSubmenu(Submenu):
     dishes: list[Dish]
+
+
+submenu_adapter = TypeAdapter(Submenu)
+submenu_list_adapter = TypeAdapter(list[Submenu])
@@ -1,15 +1,32 @@
 import uuid
+from functools import partial
 
-from fastapi import BackgroundTasks, Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Response, status
 from sqlalchemy.exc import DatabaseError, IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.models import db_helper
-from core.redis.cache_repository import CacheRepository
+from core.redis.cache_repository import (
+    CacheRepository,
+    page_key,
+    submenu_key,
+    submenus_key,
+)
+from core.redis.serializers import encode, from_cache
+from core.redis.write_behind import WriteBatch
 
+from ..conditional import ClientCache, cached_response
 from ..menus.dependencies import menu_by_id_not_from_cache
+from ..menus.snapshot import patch_branches
+from ..pagination import Page
 from . import crud
-from .schemas import Submenu, SubmenuCreate, SubmenuUpdatePartial
+from .schemas import (
+    Submenu,
+    SubmenuCreate,
+    SubmenuUpdatePartial,
+    submenu_adapter,
+    submenu_list_adapter,
+)
 
 
 class SubmenuService:
@@ -23,29 +40,51 @@ class SubmenuService:
 
     async def get_all_submenus(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu_id: uuid.UUID,
-    ) -> list[Submenu]:
-        """Возвращает список всех подменю для блюда"""
+        page: Page,
+        client: ClientCache | None = None,
+    ) -> list[Submenu] | Response:
+        """Возвращает страницу списка подменю меню"""
+        key = page_key(submenus_key(menu_id), page.limit, page.cursor)
+        response = await cached_response(self.cache_repo, key, client)
+        if response is not None:
+            return response
         try:
-            cached_submenus = await self.cache_repo.get_list_submenus_cache(menu_id)
-            if cached_submenus:
-                return cached_submenus
-            submenus = await crud.get_submenus(session=self.session, menu_id=menu_id)
-            background_tasks.add_task(
-                self.cache_repo.set_list_submenus_cache,
-                menu_id=menu_id,
-                submenus=submenus,
+            cached_submenus = await self.cache_repo.fetch(
+                key,
+                partial(self.load_submenus, menu_id=menu_id, page=page),
+                session=self.session,
+                cache_writes=cache_writes,
             )
-            return submenus
+            return from_cache(submenu_list_adapter, cached_submenus)
         except DatabaseError:
             raise HTTPException(
                 status_code=500, detail="Internal server error occurred"
             )
 
+    async def load_submenus(
+        self,
+        session: AsyncSession,
+        cache_writes: WriteBatch,
+        menu_id: uuid.UUID,
+        page: Page,
+    ) -> bytes:
+        """Загрузка страницы подменю из БД и запись в кэш"""
+        submenus = await crud.get_submenus(session=session, menu_id=menu_id, page=page)
+        submenus_json = encode(submenu_list_adapter, submenus)
+        cache_writes.add_task(
+            self.cache_repo.set_list_submenus_cache,
+            menu_id=menu_id,
+            submenus=submenus_json,
+            limit=page.limit,
+            cursor=page.cursor,
+        )
+        return submenus_json
+
     async def create_submenu(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu_id: uuid.UUID,
         submenu_in: SubmenuCreate,
     ) -> Submenu:
@@ -57,10 +96,12 @@ class SubmenuService:
                 menu_id=menu_id,
                 submenu_in=submenu_in,
             )
-            background_tasks.add_task(
+            cache_writes.add_task(patch_branches, self.cache_repo, menu_id)
+            cache_writes.add_task(
                 self.cache_repo.create_submenu_cache,
                 menu_id=menu_id,
-                submenu=submenu,
+                submenu_id=submenu.id,
+                submenu=encode(submenu_adapter, submenu),
             )
             return submenu
         except IntegrityError:
@@ -71,31 +112,52 @@ class SubmenuService:
 
     async def get_submenu_by_id(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
-    ) -> Submenu | None:
+        client: ClientCache | None = None,
+    ) -> Submenu | Response:
         """Возвращает подменю по его id"""
-        cached_submenu = await self.cache_repo.get_submenu_from_cache(
-            menu_id=menu_id,
-            submenu_id=submenu_id,
+        key = submenu_key(menu_id, submenu_id)
+        response = await cached_response(self.cache_repo, key, client)
+        if response is not None:
+            return response
+        cached_submenu = await self.cache_repo.fetch(
+            key,
+            partial(
+                self.load_submenu,
+                menu_id=menu_id,
+                submenu_id=submenu_id,
+            ),
+            session=self.session,
+            cache_writes=cache_writes,
         )
-        if cached_submenu:
-            return cached_submenu
+        return from_cache(submenu_adapter, cached_submenu)
+
+    async def load_submenu(
+        self,
+        session: AsyncSession,
+        cache_writes: WriteBatch,
+        menu_id: uuid.UUID,
+        submenu_id: uuid.UUID,
+    ) -> bytes:
+        """Загрузка подменю из БД и запись в кэш"""
         try:
             submenu = await crud.get_submenu_by_id(
-                session=self.session,
+                session=session,
                 menu_id=menu_id,
                 submenu_id=submenu_id,
             )
 
             if submenu and submenu.id is not None:
-                background_tasks.add_task(
+                submenu_json = encode(submenu_adapter, submenu)
+                cache_writes.add_task(
                     self.cache_repo.set_submenu_to_cache,
                     menu_id=menu_id,
-                    submenu=submenu,
+                    submenu_id=submenu.id,
+                    submenu=submenu_json,
                 )
-                return submenu
+                return submenu_json
 
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -109,7 +171,7 @@ class SubmenuService:
 
     async def update_submenu(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         submenu: Submenu,
         submenu_update: SubmenuUpdatePartial,
     ) -> Submenu:
@@ -121,10 +183,12 @@ class SubmenuService:
                 submenu_update=submenu_update,
                 partial=True,
             )
-            background_tasks.add_task(
+            cache_writes.add_task(patch_branches, self.cache_repo, submenu.menu_id)
+            cache_writes.add_task(
                 self.cache_repo.update_submenu_cache,
                 menu_id=submenu.menu_id,
-                submenu=submenu,
+                submenu_id=submenu.id,
+                submenu=encode(submenu_adapter, submenu),
             )
             return submenu
         except IntegrityError:
@@ -135,11 +199,12 @@ class SubmenuService:
 
     async def delete_submenu(
         self,
-        background_tasks: BackgroundTasks,
+        cache_writes: WriteBatch,
         submenu: Submenu,
     ) -> None:
         """Удаляет подменю по его id"""
-        background_tasks.add_task(
+        cache_writes.add_task(patch_branches, self.cache_repo, submenu.menu_id)
+        cache_writes.add_task(
             self.cache_repo.delete_submenu_from_cache,
             submenu=submenu,
         )
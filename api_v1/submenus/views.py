@@ -1,8 +1,18 @@
 import uuid
 from typing import Annotated
 
-from fastapi import APIRouter, BackgroundTasks, Depends, Path, status
+from fastapi import (
+    APIRouter,
+    Depends,
+    Path,
+    Response,
+    status,
+)
+
+from core.redis.write_behind import CacheWrites
 
+from ..conditional import ClientCache
+from ..pagination import Page, set_next_cursor
 from .dependencies import submenu_by_id, submenu_by_id_not_from_cache
 from .responses import (
     delete_submenu_by_id_responses,
@@ -25,14 +35,21 @@ router = APIRouter(tags=["Submenus"])
     responses=get_all_submenus_responses,
 )
 async def get_submenus(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     menu_id: Annotated[uuid.UUID, Path],
+    response: Response,
+    page: Page = Depends(),
+    client: ClientCache = Depends(),
     repo: SubmenuService = Depends(),
-) -> list[Submenu]:
-    return await repo.get_all_submenus(
-        background_tasks=background_tasks,
+) -> list[Submenu] | Response:
+    submenus = await repo.get_all_submenus(
+        cache_writes=cache_writes,
         menu_id=menu_id,
+        page=page,
+        client=client,
     )
+    set_next_cursor(submenus, page, response)
+    return submenus
 
 
 @router.post(
@@ -43,13 +60,13 @@ async def get_submenus(
     responses=post_submenu_responses,
 )
 async def create_submenu(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     menu_id: Annotated[uuid.UUID, Path],
     submenu_in: SubmenuCreate,
     repo: SubmenuService = Depends(),
 ) -> Submenu:
     return await repo.create_submenu(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         menu_id=menu_id,
         submenu_in=submenu_in,
     )
@@ -63,8 +80,8 @@ async def create_submenu(
     responses=get_submenu_by_id_responses,
 )
 async def get_submenu_bu_id(
-    submenu: Submenu = Depends(submenu_by_id),
-) -> Submenu:
+    submenu: Submenu | Response = Depends(submenu_by_id),
+) -> Submenu | Response:
     return submenu
 
 
@@ -76,13 +93,13 @@ async def get_submenu_bu_id(
     responses=patch_submenu_by_id_responses,
 )
 async def update_submenu_partial(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     submenu_update: SubmenuUpdatePartial,
     submenu: Submenu = Depends(submenu_by_id_not_from_cache),
     repo: SubmenuService = Depends(),
 ) -> Submenu:
     return await repo.update_submenu(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         submenu=submenu,
         submenu_update=submenu_update,
     )
@@ -95,11 +112,11 @@ async def update_submenu_partial(
     responses=delete_submenu_by_id_responses,
 )
 async def delete_submenu(
-    background_tasks: BackgroundTasks,
+    cache_writes: CacheWrites,
     submenu: Submenu = Depends(submenu_by_id_not_from_cache),
     repo: SubmenuService = Depends(),
 ) -> None:
     return await repo.delete_submenu(
-        background_tasks=background_tasks,
+        cache_writes=cache_writes,
         submenu=submenu,
     )
@@ -0,0 +1,81 @@
+"""Пиковая память при выдаче /menus/all/: дерево ORM против потока.
+
+Каталог заполняется в отдельной схеме PostgreSQL (BENCH_SCHEMA) так же, как
+в benchmarks.menu_counts. Каждый способ выполняется в своем процессе,
+чтобы пиковый RSS одного не влиял на другой. Скидки из Redis не
+применяются, Redis не нужен. Запуск (нужна доступная БД из .env):
+
+    python -m benchmarks.all_base_stream
+"""
+
+import asyncio
+import resource
+import subprocess
+import sys
+import time
+
+from api_v1.menus import crud
+from api_v1.menus.schemas import full_base_adapter, full_base_list_adapter
+from benchmarks.menu_counts import bench_session_factory, drop_schema, prepare
+from core.config import settings
+from core.models import db_helper
+from core.redis.serializers import encode
+
+# блюд в каждом из 10 x 10 подменю
+DISHES = (100, 1000, 3000)
+MODES = ("tree", "stream")
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def render(mode: str) -> int:
+    """Размер тела ответа, собранного указанным способом"""
+    async with bench_session_factory()() as session:
+        if mode == "tree":
+            return len(encode(full_base_list_adapter, await crud.get_all_base(session)))
+        size = len(b"]")
+        async for menu in crud.stream_all_base(
+            session=session,
+            batch_size=settings.stream_batch_size,
+        ):
+            # части уходят клиенту сразу и в памяти не копятся,
+            # к каждой добавляется "[" или ","
+            size += len(encode(full_base_adapter, menu)) + 1
+        return size
+
+
+async def child(mode: str) -> None:
+    before = max_rss_mb()
+    started = time.perf_counter()
+    size = await render(mode)
+    elapsed = time.perf_counter() - started
+    await db_helper.engine.dispose()
+    print(f"{size} {max_rss_mb() - before:.1f} {elapsed * 1000:.0f}")
+
+
+async def main() -> None:
+    for dishes in DISHES:
+        await prepare(dishes)
+        for mode in MODES:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.all_base_stream", mode],
+                capture_output=True,
+                check=True,
+                text=True,
+            ).stdout
+            size, rss, elapsed = output.split()
+            print(
+                f"{dishes * 100:>7} dishes | {mode:<6} | {int(size):>10} B | "
+                f"peak RSS +{rss:>7} MB | {elapsed:>6} ms"
+            )
+    await drop_schema()
+    await db_helper.engine.dispose()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        asyncio.run(child(sys.argv[1]))
+    else:
+        asyncio.run(main())
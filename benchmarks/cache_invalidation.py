@@ -0,0 +1,72 @@
+"""Замер задержки инвалидации кэша меню: KEYS+DELETE против тегов.
+
+Работает в отдельной базе Redis (BENCH_DB), которая очищается перед каждым
+замером. Запуск (нужен доступный Redis из .env):
+
+    python -m benchmarks.cache_invalidation
+"""
+
+import asyncio
+import time
+import uuid
+
+import redis.asyncio as redis
+
+from core.redis.cache_repository import CacheRepository, menu_tag
+from core.redis.redis_helper import GlobalConfig
+
+SIZES = (10_000, 100_000)
+# сколько ключей из общего объема относится к инвалидируемому меню
+MENU_KEYS = 200
+BENCH_DB = 15
+
+
+async def fill(repo: CacheRepository, size: int, menu_id: uuid.UUID) -> None:
+    await repo.cacher.flushdb()
+    async with repo.cacher.pipeline(transaction=False) as pipe:
+        for i in range(size - MENU_KEYS):
+            pipe.set(f"/menus/{uuid.uuid4()}/submenus/{i}/", b"x")
+        for i in range(MENU_KEYS):
+            key = f"/menus/{menu_id}/submenus/{i}/"
+            pipe.set(key, b"x")
+            pipe.sadd(menu_tag(menu_id), key)
+        await pipe.execute()
+
+
+async def keys_and_delete(repo: CacheRepository, pattern: str) -> None:
+    """Прежняя реализация clear_cache_by_mask"""
+    for key in await repo.cacher.keys(pattern + "*"):
+        await repo.cacher.delete(key)
+
+
+async def measure(size: int) -> None:
+    repo = CacheRepository(
+        redis.Redis(
+            host=GlobalConfig.redis_server,
+            port=int(GlobalConfig.redis_port),
+            db=BENCH_DB,
+        )
+    )
+    menu_id = uuid.uuid4()
+    cases = {
+        "KEYS + DELETE": lambda: keys_and_delete(repo, f"/menus/{menu_id}/"),
+        "SCAN + UNLINK": lambda: repo.clear_cache_by_mask(f"/menus/{menu_id}/"),
+        "tag set": lambda: repo.invalidate(tags=[menu_tag(menu_id)]),
+    }
+    for name, case in cases.items():
+        await fill(repo, size, menu_id)
+        started = time.perf_counter()
+        await case()
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{size:>7} keys | {name:<13} | {elapsed:9.2f} ms")
+    await repo.cacher.flushdb()
+    await repo.cacher.aclose()
+
+
+async def main() -> None:
+    for size in SIZES:
+        await measure(size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""Размер и скорость сериализации дерева /menus/all/: pickle ORM против JSON схем.
+
+Дерево собирается в памяти, Redis и БД не нужны. Запуск:
+
+    python -m benchmarks.cache_serialization
+"""
+
+import pickle
+import timeit
+import uuid
+from decimal import Decimal
+
+from api_v1.menus.schemas import full_base_list_adapter
+from core.models import Dish, Menu, Submenu
+from core.redis.serializers import decode, encode
+
+# (меню, подменю в меню, блюд в подменю)
+TREES = ((5, 5, 10), (10, 10, 50), (20, 20, 100))
+REPEAT = 5
+
+
+def build_tree(menus: int, submenus: int, dishes: int) -> list[Menu]:
+    tree = []
+    for i in range(menus):
+        menu = Menu(id=uuid.uuid4(), title=f"menu {i}", description="описание меню")
+        for j in range(submenus):
+            submenu = Submenu(
+                id=uuid.uuid4(), title=f"submenu {j}", description="описание"
+            )
+            for k in range(dishes):
+                submenu.dishes.append(
+                    Dish(
+                        id=uuid.uuid4(),
+                        title=f"dish {k}",
+                        description="описание блюда",
+                        price=Decimal("123.45"),
+                        dish_discount=Decimal("0.10"),
+                    )
+                )
+            submenu.dishes_count = dishes
+            menu.submenus.append(submenu)
+        menu.submenus_count = submenus
+        menu.dishes_count = submenus * dishes
+        tree.append(menu)
+    return tree
+
+
+def best_ms(func) -> float:
+    return min(timeit.repeat(func, number=1, repeat=REPEAT)) * 1000
+
+
+def measure(menus: int, submenus: int, dishes: int) -> None:
+    tree = build_tree(menus, submenus, dishes)
+    pickled = pickle.dumps(tree)
+    encoded = encode(full_base_list_adapter, tree)
+    total = menus * submenus * dishes
+    print(f"{total:>6} dishes | pickle ORM  | {len(pickled):>9} B", end=" | ")
+    print(
+        f"dump {best_ms(lambda: pickle.dumps(tree)):8.2f} ms | "
+        f"load {best_ms(lambda: pickle.loads(pickled)):8.2f} ms"
+    )
+    print(f"{total:>6} dishes | JSON schema | {len(encoded):>9} B", end=" | ")
+    print(
+        f"dump {best_ms(lambda: encode(full_base_list_adapter, tree)):8.2f} ms | "
+        f"load {best_ms(lambda: decode(full_base_list_adapter, encoded)):8.2f} ms"
+    )
+
+
+def main() -> None:
+    for tree in TREES:
+        measure(*tree)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Замер загрузки каталога из excel: SELECT на строку против синхронизации пачками.
+
+Каталог - синтетический файл из MENUS меню по SUBMENUS подменю, всего
+DISHES блюд. Замеряются первая загрузка, повторная без изменений и
+повторная с новой ценой у каждого десятого блюда. Для сравнения - поиск
+каждой строки отдельным SELECT, как делала прежняя реализация до записи.
+Работает в отдельной схеме PostgreSQL (BENCH_SCHEMA), скидки пишутся в
+Redis и удаляются в конце. Запуск (нужны БД и Redis из .env):
+
+    python -m benchmarks.db_updater
+"""
+
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import event, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from core.models import Base, Dish, Menu, Submenu, db_helper
+from core.redis.redis_helper import GlobalConfig, get_async_redis_client
+from tasks.db_updater import DatabaseUpdater
+
+from .menu_counts import BENCH_SCHEMA, bench_session_factory, drop_schema
+
+MENUS = 10
+SUBMENUS = 10
+DISHES = (1_000, 10_000, 100_000)
+
+
+def workbook(dishes: int) -> list[dict]:
+    """Данные файла в формате MenuParser.parse"""
+    per_submenu = dishes // (MENUS * SUBMENUS)
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "title": f"menu {i}",
+            "description": "",
+            "submenus": [
+                {
+                    "id": str(uuid.uuid4()),
+                    "title": f"submenu {i} {j}",
+                    "description": "",
+                    "dishes": [
+                        {
+                            "id": str(uuid.uuid4()),
+                            "title": f"dish {i} {j} {k}",
+                            "description": "",
+                            "price": "100.00",
+                            "dish_discount": 0.1,
+                        }
+                        for k in range(per_submenu)
+                    ],
+                }
+                for j in range(SUBMENUS)
+            ],
+        }
+        for i in range(MENUS)
+    ]
+
+
+def change_prices(full_base: list[dict]) -> None:
+    for menu in full_base:
+        for submenu in menu["submenus"]:
+            for dish in submenu["dishes"][::10]:
+                dish["price"] = "120.00"
+
+
+async def create_schema() -> async_sessionmaker[AsyncSession]:
+    """Пустые таблицы в пересозданной схеме BENCH_SCHEMA"""
+    session_factory = bench_session_factory()
+    async with session_factory() as session:
+        await session.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+        await session.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+        await session.run_sync(
+            lambda sync_session: Base.metadata.create_all(sync_session.connection())
+        )
+        await session.commit()
+    return session_factory
+
+
+async def per_row_lookups(session: AsyncSession, full_base: list[dict]) -> None:
+    """Прежний поиск существующих строк: SELECT на меню, подменю и блюдо"""
+    for menu in full_base:
+        await session.scalar(select(Menu).filter_by(id=menu["id"]))
+        for submenu in menu["submenus"]:
+            await session.scalar(select(Submenu).filter_by(id=submenu["id"]))
+            for dish in submenu["dishes"]:
+                await session.scalar(select(Dish).filter_by(id=dish["id"]))
+
+
+async def measure(
+    session_factory: async_sessionmaker[AsyncSession],
+    name: str,
+    dishes: int,
+    run,
+) -> None:
+    statements = 0
+
+    def count(*args) -> None:
+        nonlocal statements
+        statements += 1
+
+    engine = db_helper.engine.sync_engine
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        async with session_factory() as session:
+            started = time.perf_counter()
+            await run(session)
+            elapsed = time.perf_counter() - started
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    print(
+        f"{dishes:>7} dishes | {name:<17} | "
+        f"{statements:>7} statements | {elapsed * 1000:10.2f} ms"
+    )
+
+
+async def main() -> None:
+    # ветки снимка читаются из основной схемы, в замере они не нужны
+    GlobalConfig.cache_tree_snapshot = False
+    redis_client = await get_async_redis_client()
+    for dishes in DISHES:
+        session_factory = await create_schema()
+        full_base = workbook(dishes)
+
+        async def update(session: AsyncSession) -> None:
+            updater = DatabaseUpdater(full_base, session, redis_client)
+            await updater.add_menu_items(full_base)
+
+        async def lookups(session: AsyncSession) -> None:
+            await per_row_lookups(session, full_base)
+
+        await measure(session_factory, "first import", dishes, update)
+        await measure(session_factory, "per-row SELECT", dishes, lookups)
+        await measure(session_factory, "unchanged", dishes, update)
+        change_prices(full_base)
+        await measure(session_factory, "10% prices", dishes, update)
+
+        keys = [
+            f"dish_discount_{dish['id']}"
+            for menu in full_base
+            for submenu in menu["submenus"]
+            for dish in submenu["dishes"]
+        ]
+        batch_size = GlobalConfig.discount_batch_size
+        for start in range(0, len(keys), batch_size):
+            await redis_client.delete(*keys[start:start + batch_size])
+    await drop_schema()
+    await redis_client.aclose()
+    await db_helper.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
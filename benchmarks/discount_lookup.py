@@ -0,0 +1,63 @@
+"""Замер получения скидок: GET на каждое блюдо против пачек MGET.
+
+Работает в отдельной базе Redis (BENCH_DB), которая очищается перед каждым
+замером. Запуск (нужен доступный Redis из .env):
+
+    python -m benchmarks.discount_lookup
+"""
+
+import asyncio
+import time
+import uuid
+
+import redis.asyncio as redis
+
+from core.redis.cache_repository import CacheRepository
+from core.redis.redis_helper import GlobalConfig
+
+SIZES = (100, 1_000, 10_000)
+BENCH_DB = 15
+
+
+async def sequential(repo: CacheRepository, dish_ids: list[uuid.UUID]) -> None:
+    """Прежний путь: по одному запросу на блюдо"""
+    for dish_id in dish_ids:
+        await repo.get_dish_discount_from_cache(dish_id=dish_id)
+
+
+async def measure(size: int) -> None:
+    repo = CacheRepository(
+        redis.Redis(
+            host=GlobalConfig.redis_server,
+            port=int(GlobalConfig.redis_port),
+            db=BENCH_DB,
+        )
+    )
+    await repo.cacher.flushdb()
+    dish_ids = [uuid.uuid4() for _ in range(size)]
+    async with repo.cacher.pipeline(transaction=False) as pipe:
+        # у половины блюд скидки нет
+        for dish_id in dish_ids[::2]:
+            pipe.set(f"dish_discount_{dish_id}", 0.1)
+        await pipe.execute()
+
+    cases = {
+        "GET per dish": lambda: sequential(repo, dish_ids),
+        "batched MGET": lambda: repo.get_dish_discounts_from_cache(dish_ids),
+    }
+    for name, case in cases.items():
+        started = time.perf_counter()
+        await case()
+        elapsed = (time.perf_counter() - started) * 1000
+        print(f"{size:>6} dishes | {name:<12} | {elapsed:9.2f} ms")
+    await repo.cacher.flushdb()
+    await repo.cacher.aclose()
+
+
+async def main() -> None:
+    for size in SIZES:
+        await measure(size)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,135 @@
+"""Замер подсчета подменю и блюд: загрузка дерева против агрегатного запроса.
+
+Работает в отдельной схеме PostgreSQL (BENCH_SCHEMA), которая создается
+заново для каждого замера и удаляется в конце. Запуск (нужна доступная
+БД из .env):
+
+    python -m benchmarks.menu_counts
+"""
+
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import insert, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import selectinload
+
+from api_v1.menus import crud
+from core.models import Base, Dish, Menu, Submenu, db_helper
+
+# меню, подменю в каждом меню и блюд в каждом подменю
+MENUS = 10
+SUBMENUS = 10
+DISHES = (10, 100, 1000)
+REPEAT = 5
+BENCH_SCHEMA = "bench"
+
+
+async def fill(session: AsyncSession, dishes: int) -> None:
+    for i in range(MENUS):
+        menu_id = uuid.uuid4()
+        await session.execute(
+            insert(Menu).values(id=menu_id, title=f"menu {i}", description="")
+        )
+        submenu_ids = [uuid.uuid4() for _ in range(SUBMENUS)]
+        await session.execute(
+            insert(Submenu),
+            [
+                {"id": submenu_id, "title": f"submenu {i} {j}", "menu_id": menu_id}
+                for j, submenu_id in enumerate(submenu_ids)
+            ],
+        )
+        await session.execute(
+            insert(Dish),
+            [
+                {
+                    "title": f"dish {i} {j} {k}",
+                    "description": "",
+                    "price": 100,
+                    "dish_discount": 0,
+                    "submenu_id": submenu_id,
+                }
+                for j, submenu_id in enumerate(submenu_ids)
+                for k in range(dishes)
+            ],
+        )
+    await session.commit()
+
+
+async def tree_counts(session: AsyncSession) -> int:
+    """Прежняя реализация get_menus: дерево целиком, подсчет в Python"""
+    stmt = (
+        select(Menu)
+        .options(selectinload(Menu.submenus).selectinload(Submenu.dishes))
+        .order_by(Menu.title)
+    )
+    menus = (await session.execute(stmt)).scalars().all()
+    rows = len(menus)
+    for menu in menus:
+        menu.submenus_count = len(menu.submenus)
+        menu.dishes_count = sum(len(submenu.dishes) for submenu in menu.submenus)
+        rows += len(menu.submenus) + menu.dishes_count
+    return rows
+
+
+async def aggregated_counts(session: AsyncSession) -> int:
+    return len(await crud.get_menus(session=session))
+
+
+def bench_session_factory() -> async_sessionmaker[AsyncSession]:
+    """Сессии, работающие с таблицами схемы BENCH_SCHEMA"""
+    engine = db_helper.engine.execution_options(
+        schema_translate_map={None: BENCH_SCHEMA}
+    )
+    return async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
+async def prepare(dishes: int) -> async_sessionmaker[AsyncSession]:
+    """Пересоздание схемы BENCH_SCHEMA и заполнение каталога"""
+    session_factory = bench_session_factory()
+    async with session_factory() as session:
+        await session.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+        await session.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+        await session.run_sync(
+            lambda sync_session: Base.metadata.create_all(sync_session.connection())
+        )
+        await fill(session, dishes)
+    return session_factory
+
+
+async def drop_schema() -> None:
+    async with db_helper.engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+
+
+async def measure(dishes: int) -> None:
+    session_factory = await prepare(dishes)
+
+    cases = {
+        "selectinload tree": tree_counts,
+        "COUNT aggregate": aggregated_counts,
+    }
+    for name, case in cases.items():
+        timings = []
+        for _ in range(REPEAT):
+            # новая сессия, чтобы не отдавать объекты из identity map
+            async with session_factory() as session:
+                started = time.perf_counter()
+                rows = await case(session)
+                timings.append(time.perf_counter() - started)
+        print(
+            f"{dishes:>5} dishes/submenu | {name:<17} | "
+            f"{rows:>7} rows | {min(timings) * 1000:9.2f} ms"
+        )
+
+
+async def main() -> None:
+    for dishes in DISHES:
+        await measure(dishes)
+    await drop_schema()
+    await db_helper.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+"""Замер чтения файла меню: форматы xlsx, CSV и JSON Lines.
+
+Одни и те же ROWS строк (меню, подменю и блюда) записываются во временной
+папке в каждом формате. Замеряются время чтения, строки в секунду и пик
+памяти (tracemalloc) при разборе всех меню; xlsx - и с моделью книги в
+памяти (parse()), и потоком. БД и Redis не нужны. Запуск:
+
+    python -m benchmarks.menu_parser
+"""
+
+import csv
+import json
+import tempfile
+import time
+import tracemalloc
+import uuid
+from collections.abc import Callable
+from pathlib import Path
+
+import openpyxl
+
+from tasks.parser import PARSERS, XlsxMenuParser, get_parser, records_from_rows
+
+ROWS = (5_000, 50_000)
+MENUS = 10
+SUBMENUS = 10
+
+
+def generate(rows: int) -> list[list]:
+    """Строки таблицы в формате admin/Menu.xlsx, примерно rows штук"""
+    dishes = rows // (MENUS * SUBMENUS)
+    table = []
+    for i in range(MENUS):
+        table.append([str(uuid.uuid4()), f"menu {i}", "description"])
+        for j in range(SUBMENUS):
+            table.append([None, str(uuid.uuid4()), f"submenu {i} {j}", "description"])
+            for k in range(dishes):
+                table.append(
+                    [
+                        None,
+                        None,
+                        str(uuid.uuid4()),
+                        f"dish {i} {j} {k}",
+                        "description",
+                        100.5,
+                        0.1,
+                    ]
+                )
+    return table
+
+
+def save(directory: Path, table: list[list]) -> dict[str, Path]:
+    """Файлы с одними и теми же строками во всех форматах"""
+    files = {suffix: directory / f"Menu{suffix}" for suffix in PARSERS}
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    for row in table:
+        sheet.append(row)
+    workbook.save(files[".xlsx"])
+    with open(files[".csv"], "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows(table)
+    with open(files[".jsonl"], "w", encoding="utf-8") as file:
+        for _, kind, record in records_from_rows(table):
+            file.write(json.dumps({"type": kind, **record}) + "\n")
+    return files
+
+
+def whole_workbook(file_path: Path) -> int:
+    return len(XlsxMenuParser(file_path, read_only=False).parse())
+
+
+def streaming(file_path: Path) -> int:
+    # меню не накапливаются, как при передаче генератора в DatabaseUpdater
+    return sum(1 for _ in get_parser(file_path).iter_menus())
+
+
+def measure(rows: int, file_path: Path, name: str, case: Callable) -> None:
+    started = time.perf_counter()
+    case(file_path)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    case(file_path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(
+        f"{rows:>6} rows | {name:<16} | {elapsed * 1000:10.2f} ms | "
+        f"{rows / elapsed:>9.0f} rows/s | {peak / 2**20:8.2f} MiB peak"
+    )
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in ROWS:
+            table = generate(rows)
+            files = save(Path(directory), table)
+            cases = {
+                "xlsx model": (files[".xlsx"], whole_workbook),
+                "xlsx read_only": (files[".xlsx"], streaming),
+                "csv": (files[".csv"], streaming),
+                "jsonl": (files[".jsonl"], streaming),
+            }
+            for name, (file_path, case) in cases.items():
+                measure(len(table), file_path, name, case)
+
+
+if __name__ == "__main__":
+    main()
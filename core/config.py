@@ -43,6 +43,12 @@ class DbSettings(BaseSettings):
 class Settings(BaseSettings):
     api_v1_prefix: str = "/api/v1"
 
+    # размер страницы списков по умолчанию и наибольший допустимый
+    page_size: int = 100
+    max_page_size: int = 1000
+    # сколько строк дерева меню читать из серверного курсора за раз
+    stream_batch_size: int = 1000
+
     db: DbSettings = DbSettings()
 
 
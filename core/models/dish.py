@@ -18,6 +18,7 @@ class Dish(Base):
     dish_discount: Mapped[DECIMAL] = mapped_column(DECIMAL(precision=4, scale=2))
     submenu_id: Mapped[uuid.UUID] = mapped_column(
         ForeignKey("submenus.id"),
+        index=True,
     )
     submenu: Mapped["Submenu"] = relationship(back_populates="dishes")
 
@@ -12,9 +12,11 @@ if TYPE_CHECKING:
 class Menu(Base):
     __tablename__ = "menus"  # type: ignore
 
+    # порядок как в постраничных списках и потоковой выдаче дерева
     submenus: Mapped[list["Submenu"]] = relationship(
         back_populates="menu",
         cascade="all, delete-orphan",
+        order_by="(Submenu.title, Submenu.id)",
     )
 
     def __str__(self):
@@ -17,11 +17,14 @@ class Submenu(Base):
 
     menu_id: Mapped[uuid.UUID] = mapped_column(
         ForeignKey("menus.id"),
+        index=True,
     )
     menu: Mapped["Menu"] = relationship(back_populates="submenus")
+    # порядок как в постраничных списках и потоковой выдаче дерева
     dishes: Mapped[list["Dish"]] = relationship(
         back_populates="submenu",
         cascade="all, delete-orphan",
+        order_by="(Dish.title, Dish.id)",
     )
 
     def __str__(self):
@@ -1,3 +1,3 @@
-__all__ = "cache"
+__all__ = ("redis_helper",)
 
-from .redis_helper import cache
+from .redis_helper import redis_helper
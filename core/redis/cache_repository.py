@@ -1,191 +1,710 @@
-import pickle
+import asyncio
+import logging
+import random
+import time
 import uuid
+from collections.abc import Awaitable, Callable, Iterable
 
 import redis.asyncio as redis
 from fastapi import Depends
+from redis.exceptions import ResponseError, WatchError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.models import Dish, Menu, Submenu
-from core.redis.redis_helper import get_async_redis_client
+from core.models import Submenu, db_helper
+from core.redis.local_cache import encode_invalidation, local_cache, redis_stats
+from core.redis.redis_helper import GlobalConfig, get_async_redis_client
+from core.redis.serializers import CACHE_SCHEMA_VERSION, compress, etag_of
+from core.redis.single_flight import single_flight
+from core.redis.write_behind import WriteBatch, pending_fills
+
+MENUS_KEY = "/menus/"
+ALL_BASE_KEY = "/menus/all/"
+# хэш веток дерева /menus/all/ по id меню, поле order - порядок меню в дереве
+SNAPSHOT_KEY = "snapshot:/menus/all/"
+
+# загрузка значения ключа из БД с планированием записи в кэш
+Loader = Callable[[AsyncSession, WriteBatch], Awaitable[bytes]]
+
+# фоновые обновления устаревших записей, запущенные этим процессом
+refreshes: dict[str, asyncio.Task] = {}
+
+
+def menu_key(menu_id: uuid.UUID) -> str:
+    return f"/menus/{menu_id}/"
+
+
+def submenus_key(menu_id: uuid.UUID) -> str:
+    return f"/menus/{menu_id}/submenus/"
+
+
+def submenu_key(menu_id: uuid.UUID, submenu_id: uuid.UUID) -> str:
+    return f"/menus/{menu_id}/submenus/{submenu_id}/"
+
+
+def dishes_key(menu_id: uuid.UUID, submenu_id: uuid.UUID) -> str:
+    return f"/menus/{menu_id}/submenus/{submenu_id}/dishes/"
+
+
+def dish_key(menu_id: uuid.UUID, submenu_id: uuid.UUID, dish_id: uuid.UUID) -> str:
+    return f"/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}/"
+
+
+def page_key(key: str, limit: int | None, cursor: str | None) -> str:
+    """Ключ страницы списка, без limit - всего списка"""
+    return f"{key}?limit={limit or ''}&cursor={cursor or ''}"
+
+
+def key_path(key: str) -> str:
+    """Ключ без поколений и параметров страницы"""
+    return key.partition("#")[0].partition("?")[0]
+
+
+def is_list_key(key: str) -> bool:
+    """Ключ списка или страницы списка"""
+    path = key_path(key)
+    return path == MENUS_KEY or path.endswith(("/submenus/", "/dishes/"))
+
+
+def jittered(ttl: int) -> int:
+    """Время жизни со случайной добавкой, чтобы ключи не истекали разом"""
+    return ttl + int(ttl * GlobalConfig.cache_ttl_jitter * random.random())
+
+
+def key_ttl(key: str) -> int:
+    """Время жизни записи кэша по семейству ключа, 0 - без срока"""
+    path = key_path(key)
+    if path in (ALL_BASE_KEY, SNAPSHOT_KEY):
+        ttl = GlobalConfig.cache_ttl_tree
+    elif is_list_key(path):
+        ttl = GlobalConfig.cache_ttl_lists
+    else:
+        ttl = GlobalConfig.cache_ttl_items
+    if not ttl and GlobalConfig.cache_generations:
+        # записи старых поколений должны истекать
+        ttl = GlobalConfig.cache_generation_ttl
+    return jittered(ttl)
+
+
+async def drain_refreshes() -> None:
+    """Ожидание запущенных фоновых обновлений, например при остановке"""
+    await asyncio.gather(*refreshes.values(), return_exceptions=True)
+
+
+def stale_ttl(key: str) -> int:
+    """Сколько секунд отдавать инвалидированную запись, 0 - удалять сразу"""
+    if not GlobalConfig.cache_stale_while_revalidate:
+        return 0
+    if key_path(key) == ALL_BASE_KEY:
+        return GlobalConfig.cache_stale_ttl_tree
+    if is_list_key(key):
+        return GlobalConfig.cache_stale_ttl_lists
+    return GlobalConfig.cache_stale_ttl_items
+
+
+def fill_lock(key: str) -> str:
+    """Блокировка пересчета ключа, снимается записью ключа в кэш"""
+    return f"lock:{key}"
+
+
+def menu_tag(menu_id: uuid.UUID) -> str:
+    """Множество ключей кэша, относящихся к меню"""
+    return f"tag:/menus/{menu_id}/"
+
+
+def submenu_tag(menu_id: uuid.UUID, submenu_id: uuid.UUID) -> str:
+    """Множество ключей кэша, относящихся к подменю"""
+    return f"tag:/menus/{menu_id}/submenus/{submenu_id}/"
+
+
+def pages_tag(key: str) -> str:
+    """Множество ключей страниц списка"""
+    return f"tag:{key}?"
+
+
+def generation_key(scope: str) -> str:
+    """Счетчик поколений области кэша: дерева, списка меню, меню или подменю"""
+    return f"gen:{scope}"
+
+
+def key_scopes(key: str) -> list[str]:
+    """Области, от поколений которых зависит ключ, от внешней к внутренней"""
+    path = key_path(key)
+    if path in (MENUS_KEY, ALL_BASE_KEY):
+        return [path]
+    parts = path.strip("/").split("/")
+    scopes = [f"/menus/{parts[1]}/"]
+    if len(parts) >= 4:
+        scopes.append(f"/menus/{parts[1]}/submenus/{parts[3]}/")
+    return scopes
 
 
 class CacheRepository:
     def __init__(self, cacher: redis.Redis = Depends(get_async_redis_client)) -> None:
         self.cacher = cacher
+        # ключи с поколениями, прочитанными до загрузки значения из БД
+        self.pinned: dict[str, str] = {}
 
     async def clear_cache_by_mask(self, pattern: str) -> None:
-        """Чистит кэш по шаблону"""
-        for key in await self.cacher.keys(pattern + "*"):
-            await self.cacher.delete(key)
+        """Чистит кэш по шаблону через SCAN, не блокируя Redis"""
+        batch: list[bytes] = []
+        async for key in self.cacher.scan_iter(
+            match=pattern + "*",
+            count=GlobalConfig.cache_scan_count,
+        ):
+            batch.append(key)
+            if len(batch) >= GlobalConfig.cache_scan_count:
+                await self.unlink_keys(batch)
+                batch = []
+        if batch:
+            await self.unlink_keys(batch)
+
+    async def unlink_keys(
+        self,
+        keys: Iterable[str | bytes],
+        deleted: Iterable[str | bytes] = (),
+        stale: Iterable[str] = (),
+    ) -> None:
+        """Удаление ключей из Redis и из кэшей в памяти всех воркеров.
+
+        deleted - ключи, уже удаленные из Redis, их нужно только разослать.
+        stale - ключи, которые помечаются устаревшими и доживают stale_ttl.
+        """
+        keys = list(keys)
+        stale = list(stale)
+        evicted = [*keys, *deleted, *stale]
+        async with self.cacher.pipeline(transaction=False) as pipe:
+            if keys:
+                pipe.unlink(*keys)
+            for key in stale:
+                # у отсутствующего ключа появится хэш без версии, он промах
+                pipe.hset(key, "stale", 1)
+                pipe.expire(key, stale_ttl(key))
+            pipe.publish(
+                GlobalConfig.cache_invalidation_channel,
+                encode_invalidation(evicted),
+            )
+            await pipe.execute()
+        local_cache.evict(evicted)
+
+    async def set_entry(self, key: str, body: bytes, *tags: str) -> None:
+        """Запись значения в кэш с регистрацией ключа в множествах тегов.
+
+        Значение хранится в хэше вместе с версией формата записи, ETag тела
+        и, с CACHE_PRECOMPRESS, его сжатыми вариантами. Другие воркеры
+        получают сообщение об инвалидации, чтобы не отдавать прежнее
+        значение ключа из своих кэшей в памяти.
+
+        Теги перечисляются от внешнего к внутреннему: внутренние множества
+        регистрируются во внешних и удаляются вместе с ними. Запись истекает
+        по времени жизни семейства ключа, а множества тегов - без срока:
+        при политике volatile-* Redis не вытеснит тег раньше его записей,
+        и инвалидация по тегу их не пропустит.
+
+        С CACHE_GENERATIONS запись идет по ключу с поколениями, прочитанными
+        до загрузки значения, без тегов и с временем жизни: если за время
+        загрузки была запись в БД, значение попадет в недостижимый ключ.
+        """
+        if GlobalConfig.cache_generations:
+            pinned = self.pinned.pop(key, None)
+            key = pinned or await self.versioned(key)
+            tags = ()
+        entry = {"v": CACHE_SCHEMA_VERSION, "body": body, "etag": etag_of(body)}
+        min_size = GlobalConfig.cache_precompress_min_size
+        if GlobalConfig.cache_precompress and len(body) >= min_size:
+            # сжатие один раз на запись, в потоке, чтобы не держать event loop
+            entry.update(await asyncio.to_thread(compress, body))
+
+        def write(pipe) -> None:
+            pipe.unlink(key)
+            pipe.hset(key, mapping=entry)
+            if ttl := key_ttl(key):
+                pipe.expire(key, ttl)
+            for i, tag in enumerate(tags):
+                pipe.sadd(tag, key, *tags[i + 1:])
+            if GlobalConfig.cache_fill_lock:
+                pipe.unlink(fill_lock(key))
+            pipe.publish(
+                GlobalConfig.cache_invalidation_channel,
+                encode_invalidation([key]),
+            )
 
-    async def set_list_menus_cache(self, menus: list[Menu]) -> None:
-        """Запись всех меню в кэш"""
-        await self.cacher.set("/menus/", pickle.dumps(menus))
+        fills = pending_fills.get()
+        if fills is not None:
+            # команды выполнит очередь одним pipeline с другими заполнениями
+            fills.append(write)
+        else:
+            async with self.cacher.pipeline(transaction=True) as pipe:
+                write(pipe)
+                await pipe.execute()
+        local_cache.set(key, body)
+
+    async def read_entry(self, key: str) -> tuple[bytes | None, bool]:
+        """Получение значения из кэша и признака, что оно устарело.
+
+        Записи другой версии считаются промахом.
+        """
+        epoch = local_cache.epoch
+        body = local_cache.get(key)
+        if body is not None:
+            return body, False
+        try:
+            version, body, stale = await self.cacher.hmget(key, "v", "body", "stale")
+        except ResponseError:
+            # значение в старом формате (pickle строкой)
+            version = None
+        if version != CACHE_SCHEMA_VERSION or body is None:
+            redis_stats.miss()
+            return None, False
+        if stale is not None:
+            redis_stats.stale_hit()
+            return body, True
+        redis_stats.hit()
+        local_cache.set(key, body, epoch)
+        return body, False
+
+    async def get_variant(
+        self,
+        key: str,
+        encoding: str | None = None,
+    ) -> tuple[str | None, bytes | None]:
+        """ETag актуальной записи и ее сжатый вариант без чтения тела"""
+        key = await self.versioned(key)
+        fields = ["v", "etag", "stale"]
+        if encoding is not None:
+            fields.append(encoding)
+        try:
+            version, etag, stale, *variant = await self.cacher.hmget(key, *fields)
+        except ResponseError:
+            return None, None
+        if version != CACHE_SCHEMA_VERSION or etag is None or stale is not None:
+            return None, None
+        return etag.decode(), variant[0] if variant else None
+
+    async def get_entry(self, key: str) -> bytes | None:
+        """Получение актуального значения из кэша"""
+        body, stale = await self.read_entry(await self.versioned(key))
+        return None if stale else body
+
+    async def fetch(
+        self,
+        key: str,
+        load: Loader,
+        session: AsyncSession,
+        cache_writes: WriteBatch,
+    ) -> bytes:
+        """Значение ключа из кэша, при промахе загруженное из БД.
+
+        Устаревшая запись отдается сразу, а обновляется в фоне.
+        """
+        key = await self.pin(key)
+        body, stale = await self.read_entry(key)
+        if body is None:
+            epoch = local_cache.epoch
+            body = await self.recompute(key, lambda: load(session, cache_writes))
+            # пока запись ждет в очереди, чтения воркера берут значение из
+            # памяти, а не загружают его снова, если не было инвалидации
+            local_cache.set(key, body, epoch)
+            return body
+        if stale and key not in refreshes:
+            refreshes[key] = asyncio.create_task(self.refresh(key, load))
+            refreshes[key].add_done_callback(lambda _: refreshes.pop(key, None))
+        return body
+
+    async def refresh(self, key: str, load: Loader) -> None:
+        """Фоновое обновление устаревшей записи, одно на все воркеры.
+
+        Запрос, отдавший устаревшую запись, уже завершен, поэтому загрузка
+        идет в своей сессии.
+        """
+        lock, token = fill_lock(key), uuid.uuid4().hex
+        ttl = GlobalConfig.cache_fill_lock_ttl
+        if not await self.cacher.set(lock, token, nx=True, px=ttl):
+            return
+        try:
+            async with db_helper.session_factory() as session:
+                cache_writes = WriteBatch()
+                await load(session, cache_writes)
+                await cache_writes()
+        except Exception as error:
+            # устаревшая запись доживет до конца stale_ttl
+            logging.error(error)
+        finally:
+            await self.release_fill_lock(lock, token)
+
+    async def recompute(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[bytes]],
+    ) -> bytes:
+        """Пересчет значения ключа после промаха.
+
+        В процессе ключ пересчитывает одна корутина, остальные ждут ее
+        результат. С CACHE_FILL_LOCK пересчет идет в одном процессе на все
+        воркеры, остальные ждут появления записи в кэше.
+        """
+        if not GlobalConfig.cache_fill_lock:
+            return await single_flight.do(key, load)
+        return await single_flight.do(key, lambda: self.recompute_locked(key, load))
+
+    async def recompute_locked(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[bytes]],
+    ) -> bytes:
+        """Пересчет под блокировкой Redis, общей для всех воркеров"""
+        lock = fill_lock(key)
+        ttl = GlobalConfig.cache_fill_lock_ttl
+        while True:
+            token = uuid.uuid4().hex
+            if await self.cacher.set(lock, token, nx=True, px=ttl):
+                try:
+                    return await load()
+                except BaseException:
+                    await self.release_fill_lock(lock, token)
+                    raise
+
+            # блокировку держит другой воркер, ждем его запись в кэше
+            deadline = time.monotonic() + ttl / 1000
+            while time.monotonic() < deadline:
+                await asyncio.sleep(GlobalConfig.cache_fill_lock_poll / 1000)
+                # запись и снятие блокировки атомарны, поэтому блокировку
+                # проверяем до чтения записи
+                locked = await self.cacher.exists(lock)
+                body = await self.get_entry(key)
+                if body is not None:
+                    return body
+                if not locked:
+                    # пересчет завершился ошибкой, пробуем сами
+                    break
+
+    async def release_fill_lock(self, lock: str, token: str) -> None:
+        """Снятие блокировки, только если она еще принадлежит нам"""
+        async with self.cacher.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(lock)
+                if await pipe.get(lock) == token.encode():
+                    pipe.multi()
+                    pipe.unlink(lock)
+                    await pipe.execute()
+            except WatchError:
+                # блокировка истекла и перехвачена другим воркером
+                pass
+
+    async def versioned(self, key: str) -> str:
+        """Ключ записи с текущими поколениями ее областей.
+
+        Поколения кэшируются в памяти воркера на LOCAL_CACHE_GENERATION_TTL
+        и вытесняются оттуда тем же сообщением об инвалидации, что и записи.
+        Без CACHE_GENERATIONS
+        ключ не меняется.
+        """
+        if not GlobalConfig.cache_generations or "#" in key:
+            return key
+        epoch = local_cache.epoch
+        counters = [generation_key(scope) for scope in key_scopes(key)]
+        generations = {counter: local_cache.get(counter) for counter in counters}
+        missing = [counter for counter, value in generations.items() if value is None]
+        if missing:
+            for counter, value in zip(missing, await self.cacher.mget(missing)):
+                generations[counter] = value = value or b"0"
+                local_cache.set(
+                    counter,
+                    value,
+                    epoch,
+                    ttl=GlobalConfig.local_cache_generation_ttl,
+                )
+        values = [value or b"0" for value in generations.values()]
+        return f"{key}#{b'.'.join(values).decode()}"
+
+    async def pin(self, key: str) -> str:
+        """Ключ с поколениями на момент чтения, по нему же пойдет запись"""
+        versioned = await self.versioned(key)
+        if versioned != key:
+            self.pinned[key] = versioned
+        return versioned
+
+    async def bump_generations(self, scopes: Iterable[str]) -> None:
+        """Новые поколения областей, их прежние записи становятся недостижимы"""
+        counters = [generation_key(scope) for scope in scopes]
+        async with self.cacher.pipeline(transaction=True) as pipe:
+            for counter in counters:
+                pipe.incr(counter)
+            pipe.publish(
+                GlobalConfig.cache_invalidation_channel,
+                encode_invalidation(counters),
+            )
+            await pipe.execute()
+        local_cache.evict(counters)
 
-    async def get_list_menus_cache(self) -> list[Menu] | None:
-        """Получение всех меню из кэша"""
-        if (cached_menus := await self.cacher.get("/menus/")) is not None:
-            return pickle.loads(cached_menus)
-        return None
+    async def invalidate(
+        self,
+        tags: Iterable[str] = (),
+        keys: Iterable[str] = (),
+    ) -> None:
+        """Удаление ключей по тегам и явно перечисленных ключей.
+
+        Множества тегов читаются и удаляются атомарно в одной транзакции,
+        затем все найденные ключи удаляются одним UNLINK, а удаленные ключи
+        рассылаются воркерам для чистки их кэшей в памяти. Вместе с ключом
+        списка удаляются все его страницы. В режиме stale-while-revalidate
+        ключи с ненулевым stale_ttl не удаляются, а помечаются устаревшими.
+
+        С CACHE_GENERATIONS ключи не удаляются: одной транзакцией INCR
+        увеличиваются поколения затронутых каталога, меню и подменю.
+        """
+        tags = list(tags)
+        keys = list(keys)
+        if not tags and not keys:
+            return
+
+        if GlobalConfig.cache_generations:
+            # тег меню или подменю - это его область, ключ - его внутренняя
+            await self.bump_generations(
+                {
+                    *(tag.removeprefix("tag:") for tag in tags),
+                    *(key_scopes(key)[-1] for key in keys),
+                }
+            )
+            return
+
+        all_tags = [*tags, *(pages_tag(key) for key in keys if is_list_key(key))]
+        deleted = [key for key in keys if not stale_ttl(key)]
+        async with self.cacher.pipeline(transaction=True) as pipe:
+            for tag in all_tags:
+                pipe.smembers(tag)
+            if all_tags or deleted:
+                pipe.unlink(*all_tags, *deleted)
+            members = (await pipe.execute())[: len(all_tags)]
+
+        tagged_keys = {key.decode() for key in set().union(*members)}
+        # вложенные множества тегов удаляются вместе с внешними
+        stale = [
+            key
+            for key in {*keys, *tagged_keys}
+            if not key.startswith("tag:") and stale_ttl(key)
+        ]
+        await self.unlink_keys(
+            [key for key in tagged_keys if key not in stale],
+            deleted=deleted,
+            stale=stale,
+        )
+
+        if GlobalConfig.cache_legacy_scan:
+            for tag in tags:
+                await self.clear_cache_by_mask(tag.removeprefix("tag:"))
 
-    async def create_menu_cache(self, menu: Menu) -> None:
+    async def invalidate_menu(self, menu_id: uuid.UUID, *keys: str) -> None:
+        """Инвалидация всего, что закэшировано для меню, и общих списков"""
+        await self.invalidate(
+            tags=[menu_tag(menu_id)],
+            keys=[MENUS_KEY, ALL_BASE_KEY, *keys],
+        )
+
+    async def invalidate_submenu(
+        self,
+        menu_id: uuid.UUID,
+        submenu_id: uuid.UUID,
+        *keys: str,
+    ) -> None:
+        """Инвалидация всего, что закэшировано для подменю, и общих списков"""
+        await self.invalidate(
+            tags=[submenu_tag(menu_id, submenu_id)],
+            keys=[ALL_BASE_KEY, *keys],
+        )
+
+    async def set_list_menus_cache(
+        self,
+        menus: bytes,
+        limit: int | None,
+        cursor: str | None,
+    ) -> None:
+        """Запись страницы меню в кэш"""
+        await self.set_entry(
+            page_key(MENUS_KEY, limit, cursor),
+            menus,
+            pages_tag(MENUS_KEY),
+        )
+
+    async def get_list_menus_cache(
+        self,
+        limit: int | None,
+        cursor: str | None,
+    ) -> bytes | None:
+        """Получение страницы меню из кэша"""
+        return await self.get_entry(page_key(MENUS_KEY, limit, cursor))
+
+    async def create_menu_cache(self, menu_id: uuid.UUID, menu: bytes) -> None:
         """Работа с кэшем при создании меню"""
         await self.delete_all_menus_from_cache()
-        await self.cacher.set(f"/menus/{menu.id}/", pickle.dumps(menu))
-        await self.delete_all_base_cache()
+        await self.set_menu_to_cache(menu_id=menu_id, menu=menu)
 
-    async def update_menu_cache(self, menu: Menu) -> None:
+    async def update_menu_cache(self, menu_id: uuid.UUID, menu: bytes) -> None:
         """Работа с кэшем при обновлении меню"""
-        await self.delete_all_menus_from_cache()
-        await self.cacher.set(f"/menus/{menu.id}/", pickle.dumps(menu))
-        await self.delete_all_base_cache()
+        await self.invalidate(keys=[MENUS_KEY, ALL_BASE_KEY, menu_key(menu_id)])
+        await self.set_menu_to_cache(menu_id=menu_id, menu=menu)
 
-    async def set_menu_to_cache(self, menu: Menu) -> None:
+    async def set_menu_to_cache(self, menu_id: uuid.UUID, menu: bytes) -> None:
         """Запись меню в кеш"""
-        await self.cacher.set(f"/menus/{menu.id}/", pickle.dumps(menu))
+        await self.set_entry(menu_key(menu_id), menu, menu_tag(menu_id))
 
-    async def get_menu_from_cache(self, menu_id: uuid.UUID) -> Menu | None:
+    async def get_menu_from_cache(self, menu_id: uuid.UUID) -> bytes | None:
         """Получение меню по id из кэша"""
-        if (cached_menu := await self.cacher.get(f"/menus/{menu_id}/")) is not None:
-            return pickle.loads(cached_menu)
-        return None
+        return await self.get_entry(menu_key(menu_id))
 
     async def delete_all_menus_from_cache(self) -> None:
-        """Удаление всех меню из кэша"""
-        await self.clear_cache_by_mask("/menus/")
+        """Удаление списка меню и дерева меню из кэша"""
+        await self.invalidate(keys=[MENUS_KEY, ALL_BASE_KEY])
 
     async def delete_menu_from_cache(self, menu_id: uuid.UUID) -> None:
         """Работа с кэшем при удалении меню"""
-        await self.clear_cache_by_mask(f"/menus/{menu_id}/")
-        await self.delete_all_menus_from_cache()
-        await self.delete_all_base_cache()
+        await self.invalidate_menu(menu_id)
 
     async def set_list_submenus_cache(
         self,
         menu_id: uuid.UUID,
-        submenus: list[Submenu],
+        submenus: bytes,
+        limit: int | None,
+        cursor: str | None,
     ) -> None:
-        """Запись всех подменю в кэш"""
-        await self.cacher.set(
-            f"/menus/{menu_id}/submenus/",
-            pickle.dumps(submenus),
+        """Запись страницы подменю в кэш"""
+        await self.set_entry(
+            page_key(submenus_key(menu_id), limit, cursor),
+            submenus,
+            menu_tag(menu_id),
+            pages_tag(submenus_key(menu_id)),
         )
 
     async def get_list_submenus_cache(
         self,
         menu_id: uuid.UUID,
-    ) -> list[Submenu] | None:
-        """Получение всех подменю из кэша"""
-        if (
-            cached_submenus := await self.cacher.get(f"/menus/{menu_id}/submenus/")
-        ) is not None:
-            return pickle.loads(cached_submenus)
-        return None
+        limit: int | None,
+        cursor: str | None,
+    ) -> bytes | None:
+        """Получение страницы подменю из кэша"""
+        return await self.get_entry(page_key(submenus_key(menu_id), limit, cursor))
 
     async def create_submenu_cache(
         self,
         menu_id: uuid.UUID,
-        submenu: Submenu,
+        submenu_id: uuid.UUID,
+        submenu: bytes,
     ) -> None:
         """Работа с кэшем при создании нового подменю"""
-        await self.clear_cache_by_mask(f"/menus/{menu_id}/")
-        await self.delete_all_menus_from_cache()
-        await self.set_submenu_to_cache(menu_id=menu_id, submenu=submenu)
-        await self.delete_all_base_cache()
+        await self.invalidate_menu(menu_id)
+        await self.set_submenu_to_cache(
+            menu_id=menu_id,
+            submenu_id=submenu_id,
+            submenu=submenu,
+        )
 
     async def set_submenu_to_cache(
         self,
         menu_id: uuid.UUID,
-        submenu: Submenu,
+        submenu_id: uuid.UUID,
+        submenu: bytes,
     ) -> None:
         """Запись подменю в кеш"""
-        await self.cacher.set(
-            f"/menus/{menu_id}/submenus/{submenu.id}/", pickle.dumps(submenu)
+        await self.set_entry(
+            submenu_key(menu_id, submenu_id),
+            submenu,
+            menu_tag(menu_id),
+            submenu_tag(menu_id, submenu_id),
         )
 
     async def get_submenu_from_cache(
         self,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
-    ) -> Submenu | None:
+    ) -> bytes | None:
         """Получение подменю по id из кэша"""
-        if (
-            cached_submenu := await self.cacher.get(
-                f"/menus/{menu_id}/submenus/{submenu_id}/"
-            )
-        ) is not None:
-            return pickle.loads(cached_submenu)
-        return None
+        return await self.get_entry(submenu_key(menu_id, submenu_id))
 
     async def update_submenu_cache(
         self,
         menu_id: uuid.UUID,
-        submenu: Submenu,
+        submenu_id: uuid.UUID,
+        submenu: bytes,
     ) -> None:
         """Работа с кэшем при обновлении подменю"""
-        await self.delete_all_submenus_from_cache(submenu.menu_id)
-        await self.delete_all_menus_from_cache()
-        await self.set_submenu_to_cache(submenu=submenu, menu_id=menu_id)
-        await self.delete_all_base_cache()
+        await self.delete_all_submenus_from_cache(menu_id)
+        await self.set_submenu_to_cache(
+            menu_id=menu_id,
+            submenu_id=submenu_id,
+            submenu=submenu,
+        )
 
     async def delete_all_submenus_from_cache(self, menu_id: uuid.UUID) -> None:
         """Удаление всех подменю из кэша"""
-        await self.cacher.delete(f"/menus/{menu_id}/submenus/")
-        await self.delete_all_base_cache()
+        await self.invalidate(keys=[submenus_key(menu_id), ALL_BASE_KEY])
 
     async def delete_submenu_from_cache(self, submenu: Submenu) -> None:
         """Работа с кэшем при удалении подменю"""
-        await self.clear_cache_by_mask(f"/menus/{submenu.menu_id}/")
-        await self.delete_all_menus_from_cache()
-        await self.delete_all_base_cache()
+        await self.invalidate_menu(submenu.menu_id)
 
     async def set_list_dishes_cache(
         self,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
-        dishes: list[Dish],
+        dishes: bytes,
+        limit: int | None,
+        cursor: str | None,
     ) -> None:
-        """Запись всех блюд в кэш"""
-        await self.cacher.set(
-            f"/menus/{menu_id}/submenus/{submenu_id}/dishes/",
-            pickle.dumps(dishes),
+        """Запись страницы блюд в кэш"""
+        await self.set_entry(
+            page_key(dishes_key(menu_id, submenu_id), limit, cursor),
+            dishes,
+            menu_tag(menu_id),
+            submenu_tag(menu_id, submenu_id),
+            pages_tag(dishes_key(menu_id, submenu_id)),
         )
 
     async def get_list_dishes_cache(
         self,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
-    ) -> list[Dish] | None:
-        """Получение всех блюд из кэша"""
-        if (
-            cached_dishes := await self.cacher.get(
-                f"/menus/{menu_id}/submenus/{submenu_id}/dishes/"
-            )
-        ) is not None:
-            return pickle.loads(cached_dishes)
-        return None
+        limit: int | None,
+        cursor: str | None,
+    ) -> bytes | None:
+        """Получение страницы блюд из кэша"""
+        return await self.get_entry(
+            page_key(dishes_key(menu_id, submenu_id), limit, cursor)
+        )
 
     async def create_dish_cache(
         self,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
-        dish: Dish,
+        dish_id: uuid.UUID,
+        dish: bytes,
     ) -> None:
         """Работа с кэшем при создании нового блюда"""
-        await self.delete_all_menus_from_cache()
-        await self.clear_cache_by_mask(f"/menus/{menu_id}/")
-        await self.set_dish_to_cache(menu_id=menu_id, submenu_id=submenu_id, dish=dish)
-        await self.delete_all_base_cache()
+        await self.invalidate_submenu(
+            menu_id,
+            submenu_id,
+            MENUS_KEY,
+            menu_key(menu_id),
+            submenus_key(menu_id),
+        )
+        await self.set_dish_to_cache(
+            menu_id=menu_id,
+            submenu_id=submenu_id,
+            dish_id=dish_id,
+            dish=dish,
+        )
 
     async def set_dish_to_cache(
         self,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
-        dish: Dish,
+        dish_id: uuid.UUID,
+        dish: bytes,
     ) -> None:
         """Запись блюда в кеш"""
-        await self.cacher.set(
-            f"/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish.id}/",
-            pickle.dumps(dish),
+        await self.set_entry(
+            dish_key(menu_id, submenu_id, dish_id),
+            dish,
+            menu_tag(menu_id),
+            submenu_tag(menu_id, submenu_id),
         )
 
     async def get_dish_from_cache(
@@ -193,27 +712,25 @@ class CacheRepository:
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
         dish_id: uuid.UUID,
-    ) -> Dish | None:
+    ) -> bytes | None:
         """Получение подменю по id из кэша"""
-        if (
-            cached_dish := await self.cacher.get(
-                f"/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}/"
-            )
-        ) is not None:
-            return pickle.loads(cached_dish)
-        return None
+        return await self.get_entry(dish_key(menu_id, submenu_id, dish_id))
 
     async def update_dish_cache(
         self,
         menu_id: uuid.UUID,
         submenu_id: uuid.UUID,
-        dish: Dish,
+        dish_id: uuid.UUID,
+        dish: bytes,
     ) -> None:
         """Работа с кэшем при обновлении блюда"""
-        await self.delete_all_menus_from_cache()
-        await self.clear_cache_by_mask(f"/menus/{menu_id}/")
-        await self.set_dish_to_cache(menu_id=menu_id, submenu_id=submenu_id, dish=dish)
-        await self.delete_all_base_cache()
+        await self.invalidate_submenu(menu_id, submenu_id)
+        await self.set_dish_to_cache(
+            menu_id=menu_id,
+            submenu_id=submenu_id,
+            dish_id=dish_id,
+            dish=dish,
+        )
 
     async def delete_all_dishes_from_cache(
         self,
@@ -221,31 +738,128 @@ class CacheRepository:
         submenu_id: uuid.UUID,
     ) -> None:
         """Удаление всех блюд из кэша"""
-        await self.cacher.delete(f"/menus/{menu_id}/submenus/{submenu_id}/dishes/")
-        await self.delete_all_base_cache()
+        await self.invalidate(keys=[dishes_key(menu_id, submenu_id), ALL_BASE_KEY])
 
-    async def delete_dish_from_cache(self, menu_id: uuid.UUID) -> None:
+    async def delete_dish_from_cache(
+        self,
+        menu_id: uuid.UUID,
+        submenu_id: uuid.UUID,
+        dish_id: uuid.UUID | None = None,
+    ) -> None:
         """Работа с кэшем при удалении блюда"""
-        await self.clear_cache_by_mask(f"/menu/{menu_id}/")
-        await self.delete_all_menus_from_cache()
-        await self.delete_all_base_cache()
+        if dish_id is not None:
+            await self.delete_dish_discounts([dish_id])
+        await self.invalidate_submenu(
+            menu_id,
+            submenu_id,
+            MENUS_KEY,
+            menu_key(menu_id),
+            submenus_key(menu_id),
+        )
 
-    async def set_all_base_cache(self, menus: list[Menu]) -> None:
+    async def set_all_base_cache(self, menus: bytes) -> None:
         """Запись всех меню в кэш с подменю и блюдами"""
-        await self.cacher.set("/menus/all/", pickle.dumps(menus))
+        await self.set_entry(ALL_BASE_KEY, menus)
 
-    async def get_all_base_cache(self) -> list[Menu] | None:
+    async def get_all_base_cache(self) -> bytes | None:
         """Получение всейх меню из кэша с подменю и блюдами"""
-        if (cached_menus_all := await self.cacher.get("/menus/all/")) is not None:
-            return pickle.loads(cached_menus_all)
-        return None
+        return await self.get_entry(ALL_BASE_KEY)
 
     async def delete_all_base_cache(self) -> None:
         """Удаление всех меню из кэша с подменю и блюдами"""
-        await self.clear_cache_by_mask("/menus/all/")
+        await self.delete_snapshot()
+        await self.invalidate(keys=[ALL_BASE_KEY])
+
+    async def get_snapshot(self) -> tuple[bytes | None, bytes | None]:
+        """Поколение снимка дерева и дерево, собранное из веток.
+
+        Дерево None, если полного снимка нет.
+        """
+        snapshot = await self.cacher.hgetall(SNAPSHOT_KEY)
+        generation = snapshot.get(b"gen")
+        if snapshot.get(b"v") != CACHE_SCHEMA_VERSION:
+            return generation, None
+        order = snapshot[b"order"].split(b",") if snapshot[b"order"] else []
+        if any(key not in snapshot for key in order):
+            # меню создано, а его ветку еще не записали
+            return generation, None
+        return generation, b"[" + b",".join(snapshot[key] for key in order) + b"]"
+
+    async def get_snapshot_generation(self) -> tuple[bytes | None, bool]:
+        """Поколение снимка дерева и признак, что снимок полный"""
+        version, generation = await self.cacher.hmget(SNAPSHOT_KEY, "v", "gen")
+        return generation, version == CACHE_SCHEMA_VERSION
+
+    async def write_snapshot(
+        self,
+        generation: bytes | None,
+        order: list[uuid.UUID],
+        branches: dict[uuid.UUID, bytes | None],
+        full: bool = False,
+    ) -> bool:
+        """Запись веток в снимок дерева, если он не менялся с generation.
+
+        Иначе ветки могли быть прочитаны из БД до параллельной записи, и
+        запись пропускается. full заменяет снимок целиком, без него ветки
+        обновляются только в полном снимке, а None удаляет ветку.
+        """
+        async with self.cacher.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(SNAPSHOT_KEY)
+                version, current = await pipe.hmget(SNAPSHOT_KEY, "v", "gen")
+                if current != generation or (
+                    not full and version != CACHE_SCHEMA_VERSION
+                ):
+                    return False
+                pipe.multi()
+                if full:
+                    pipe.unlink(SNAPSHOT_KEY)
+                deleted = [str(key) for key, body in branches.items() if body is None]
+                if deleted and not full:
+                    pipe.hdel(SNAPSHOT_KEY, *deleted)
+                entry = {
+                    "v": CACHE_SCHEMA_VERSION,
+                    "gen": int(current or 0) + 1,
+                    "order": ",".join(str(menu_id) for menu_id in order),
+                }
+                for key, body in branches.items():
+                    if body is not None:
+                        entry[str(key)] = body
+                pipe.hset(SNAPSHOT_KEY, mapping=entry)
+                if ttl := key_ttl(SNAPSHOT_KEY):
+                    pipe.expire(SNAPSHOT_KEY, ttl)
+                await pipe.execute()
+            except WatchError:
+                return False
+        return True
+
+    async def touch_snapshot(self) -> None:
+        """Отметка записи в меню, пока полного снимка нет"""
+        await self.cacher.hincrby(SNAPSHOT_KEY, "gen", 1)
+
+    async def delete_snapshot(self) -> None:
+        """Удаление снимка, дерево заново загрузится из БД"""
+        async with self.cacher.pipeline(transaction=True) as pipe:
+            pipe.hdel(SNAPSHOT_KEY, "v")
+            pipe.hincrby(SNAPSHOT_KEY, "gen", 1)
+            await pipe.execute()
+
+    async def set_discount_to_cache(
+        self,
+        dish_id: uuid.UUID,
+        discount: float,
+    ) -> None:
+        await self.cacher.set(
+            "dish_discount_" + str(dish_id),
+            discount,
+            ex=jittered(GlobalConfig.cache_ttl_discounts) or None,
+        )
 
-    async def set_discount_to_cache(self, dish_id: int, discount: float) -> None:
-        await self.cacher.set("dish_discount_" + str(dish_id), discount)
+    async def delete_dish_discounts(self, dish_ids: Iterable[uuid.UUID]) -> None:
+        """Удаление скидок удаленных блюд"""
+        keys = [f"dish_discount_{dish_id}" for dish_id in dish_ids]
+        if keys:
+            await self.cacher.unlink(*keys)
 
     async def get_dish_discount_from_cache(self, dish_id: uuid.UUID) -> float:
         """Возвращает скидку для указанного блюда из кеша Redis."""
@@ -255,3 +869,22 @@ class CacheRepository:
             return float(raw_discount)
         else:
             return 0.0  # Если скидка не найдена, возвращаем 0
+
+    async def get_dish_discounts_from_cache(
+        self,
+        dish_ids: Iterable[uuid.UUID],
+    ) -> dict[uuid.UUID, float]:
+        """Возвращает скидки для набора блюд пачками MGET"""
+        dish_ids = list(dish_ids)
+        discounts: dict[uuid.UUID, float] = {}
+        batch_size = GlobalConfig.discount_batch_size
+        for start in range(0, len(dish_ids), batch_size):
+            chunk = dish_ids[start:start + batch_size]
+            raw_discounts = await self.cacher.mget(
+                [f"dish_discount_{dish_id}" for dish_id in chunk]
+            )
+            for dish_id, raw_discount in zip(chunk, raw_discounts):
+                discounts[dish_id] = (
+                    float(raw_discount) if raw_discount is not None else 0.0
+                )
+        return discounts
@@ -0,0 +1,168 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Iterable
+from typing import Any
+
+from redis.exceptions import RedisError
+
+from core.redis.redis_helper import GlobalConfig, redis_helper
+
+
+class LayerStats:
+    """Счетчики попаданий и промахов одного уровня кэша"""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    def hit(self) -> None:
+        self.hits += 1
+
+    def stale_hit(self) -> None:
+        self.hits += 1
+        self.stale_hits += 1
+
+    def miss(self) -> None:
+        self.misses += 1
+
+    def stats(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_hits": self.stale_hits,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+
+class LocalCache:
+    """Ограниченный по размеру LRU-кэш записей в памяти процесса с TTL.
+
+    epoch увеличивается при каждой инвалидации: значение, прочитанное из
+    Redis до инвалидации, не попадает в кэш после нее.
+    """
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self.epoch = 0
+        self.layer_stats = LayerStats()
+
+    def get(self, key: str) -> bytes | None:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.layer_stats.miss()
+            return None
+        self.entries.move_to_end(key)
+        self.layer_stats.hit()
+        return entry[1]
+
+    def set(
+        self,
+        key: str,
+        value: bytes,
+        epoch: int | None = None,
+        ttl: float | None = None,
+    ) -> None:
+        """Запись в кэш, пропускается, если с epoch была инвалидация"""
+        if self.max_entries <= 0 or (epoch is not None and epoch != self.epoch):
+            return
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def evict(self, keys: Iterable[str | bytes]) -> None:
+        self.epoch += 1
+        for key in keys:
+            if isinstance(key, bytes):
+                key = key.decode()
+            self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.epoch += 1
+        self.entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            **self.layer_stats.stats(),
+            "size": len(self.entries),
+            "max_entries": self.max_entries,
+        }
+
+
+local_cache = LocalCache(
+    max_entries=GlobalConfig.local_cache_max_entries,
+    ttl=GlobalConfig.local_cache_ttl,
+)
+redis_stats = LayerStats()
+
+# отличает сообщения этого процесса от сообщений других воркеров
+PROCESS_ID = uuid.uuid4().hex
+
+
+def encode_invalidation(keys: Iterable[str | bytes]) -> str:
+    """Сообщение об инвалидации: отправитель и список удаленных ключей"""
+    return json.dumps(
+        {
+            "sender": PROCESS_ID,
+            "keys": [key.decode() if isinstance(key, bytes) else key for key in keys],
+        }
+    )
+
+
+def handle_invalidation(data: bytes | str) -> None:
+    """Чистит local_cache по сообщению другого воркера"""
+    message = json.loads(data)
+    if message["sender"] != PROCESS_ID:
+        local_cache.evict(message["keys"])
+
+
+class InvalidationListener:
+    """Слушает сообщения об инвалидации других воркеров и чистит local_cache"""
+
+    def __init__(self, channel: str) -> None:
+        self.channel = channel
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.task is None and local_cache.max_entries > 0:
+            self.task = asyncio.create_task(self.listen())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            task, self.task = self.task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def listen(self) -> None:
+        while True:
+            try:
+                async with redis_helper.get_client().pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    # пока не было подписки, сообщения могли потеряться
+                    local_cache.clear()
+                    while True:
+                        message = await pubsub.get_message(
+                            ignore_subscribe_messages=True,
+                            timeout=1.0,
+                        )
+                        if message is not None:
+                            handle_invalidation(message["data"])
+            except RedisError:
+                local_cache.clear()
+                await asyncio.sleep(1)
+
+
+invalidation_listener = InvalidationListener(GlobalConfig.cache_invalidation_channel)
@@ -0,0 +1,199 @@
+"""Отчет о ключах кэша Redis и чистка ключей-сирот.
+
+Проходит ключи через SCAN пачками по CACHE_SCAN_COUNT и считает по
+семействам: сколько ключей, сколько без времени жизни и сколько сирот,
+то есть ключей, которые приложение уже никогда не прочитает. С --reclaim
+сироты удаляются, записям без срока назначается время жизни их семейства,
+а со множеств тегов срок снимается, чтобы Redis их не вытеснял. Счетчики поколений, снимок дерева и чужие ключи
+(например, celery) не удаляются. Запуск (нужны Redis и БД из .env):
+
+    python -m core.redis.maintenance [--reclaim]
+"""
+
+import argparse
+import asyncio
+from collections import Counter
+from collections.abc import Iterable
+
+import redis.asyncio as redis
+from sqlalchemy import select
+
+from core.models import Dish, db_helper
+from core.redis.cache_repository import CacheRepository, key_ttl
+from core.redis.redis_helper import GlobalConfig, get_async_redis_client
+from core.redis.serializers import CACHE_SCHEMA_VERSION
+
+DISCOUNT_PREFIX = "dish_discount_"
+# семейства ключей по префиксу, первое совпадение
+FAMILIES = {
+    "/menus/": "entries",
+    "tag:": "tags",
+    "gen:": "generations",
+    "lock:": "locks",
+    "snapshot:": "snapshot",
+    DISCOUNT_PREFIX: "discounts",
+    # ключи до исправления префикса /menu/ -> /menus/
+    "/menu/": "legacy",
+}
+
+
+def key_family(key: str) -> str:
+    for prefix, family in FAMILIES.items():
+        if key.startswith(prefix):
+            return family
+    return "other"
+
+
+class KeyspaceReport:
+    """Счетчики ключей, ключей без срока и сирот по семействам"""
+
+    def __init__(self) -> None:
+        self.keys: Counter[str] = Counter()
+        self.no_ttl: Counter[str] = Counter()
+        self.orphans: Counter[str] = Counter()
+        self.expired: Counter[str] = Counter()
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {
+            family: {
+                "keys": self.keys[family],
+                "no_ttl": self.no_ttl[family],
+                "orphans": self.orphans[family],
+                "expired": self.expired[family],
+            }
+            for family in sorted(self.keys)
+        }
+
+
+class KeyspaceMaintenance:
+    """Поиск и, с reclaim, чистка ключей-сирот в кэше"""
+
+    def __init__(self, cacher: redis.Redis, reclaim: bool = False) -> None:
+        self.cache_repo = CacheRepository(cacher)
+        self.cacher = cacher
+        self.reclaim = reclaim
+        self.report = KeyspaceReport()
+        self.dish_ids: set[str] | None = None
+
+    async def run(self) -> KeyspaceReport:
+        batch: list[str] = []
+        async for key in self.cacher.scan_iter(count=GlobalConfig.cache_scan_count):
+            batch.append(key.decode())
+            if len(batch) >= GlobalConfig.cache_scan_count:
+                await self.check(batch)
+                batch = []
+        if batch:
+            await self.check(batch)
+        return self.report
+
+    async def check(self, keys: list[str]) -> None:
+        async with self.cacher.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.type(key)
+                pipe.ttl(key)
+            replies = await pipe.execute()
+        orphans: list[str] = []
+        expire: dict[str, int] = {}
+        persist: list[str] = []
+        for key, key_type, ttl in zip(keys, replies[::2], replies[1::2]):
+            family = key_family(key)
+            if ttl == -2:
+                # ключ истек между SCAN и TYPE
+                continue
+            self.report.keys[family] += 1
+            if ttl == -1:
+                self.report.no_ttl[family] += 1
+            if await self.is_orphan(key, family, key_type.decode(), ttl):
+                self.report.orphans[family] += 1
+                orphans.append(key)
+            elif ttl == -1 and (new_ttl := self.family_ttl(key, family)):
+                expire[key] = new_ttl
+            elif ttl >= 0 and family == "tags":
+                # срок остался от прежних версий, такой тег можно вытеснить
+                persist.append(key)
+        if family_tags := [
+            key for key in keys if key_family(key) == "tags" and key not in orphans
+        ]:
+            orphans.extend(await self.prune_tags(family_tags))
+        if not self.reclaim:
+            return
+        if orphans:
+            await self.cache_repo.unlink_keys(orphans)
+        async with self.cacher.pipeline(transaction=False) as pipe:
+            for key, new_ttl in expire.items():
+                # ключ мог быть перезаписан со сроком, NX его не трогает
+                pipe.expire(key, new_ttl, nx=True)
+                self.report.expired[key_family(key)] += 1
+            for key in persist:
+                pipe.persist(key)
+            await pipe.execute()
+
+    @staticmethod
+    def family_ttl(key: str, family: str) -> int:
+        if family == "entries":
+            return key_ttl(key)
+        return 0
+
+    async def is_orphan(self, key: str, family: str, key_type: str, ttl: int) -> bool:
+        if family == "legacy":
+            return True
+        if family == "locks":
+            # блокировки ставятся со сроком, без него - остались от сбоя
+            return ttl == -1
+        if family == "discounts":
+            return key.removeprefix(DISCOUNT_PREFIX) not in await self.get_dish_ids()
+        if family != "entries":
+            return False
+        if key_type != "hash":
+            return True
+        if await self.cacher.hget(key, "v") != CACHE_SCHEMA_VERSION:
+            return True
+        path, _, generations = key.partition("#")
+        if not generations:
+            return GlobalConfig.cache_generations
+        # запись прежнего поколения или оставшаяся после выключения режима
+        return await self.cache_repo.versioned(path) != key
+
+    async def prune_tags(self, tags: Iterable[str]) -> list[str]:
+        """Удаляет из множеств тегов отсутствующие ключи, пустые - сироты"""
+        empty: list[str] = []
+        for tag in tags:
+            members = [member.decode() for member in await self.cacher.smembers(tag)]
+            exists = [await self.cacher.exists(member) for member in members]
+            missing = [member for member, found in zip(members, exists) if not found]
+            if len(missing) == len(members):
+                self.report.orphans["tags"] += 1
+                empty.append(tag)
+            elif missing and self.reclaim:
+                await self.cacher.srem(tag, *missing)
+        return empty
+
+    async def get_dish_ids(self) -> set[str]:
+        if self.dish_ids is None:
+            async with db_helper.session_factory() as session:
+                dish_ids = await session.scalars(select(Dish.id))
+                self.dish_ids = {str(dish_id) for dish_id in dish_ids}
+        return self.dish_ids
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--reclaim",
+        action="store_true",
+        help="удалить сироты и назначить срок ключам без него",
+    )
+    args = parser.parse_args()
+    cacher = await get_async_redis_client()
+    report = await KeyspaceMaintenance(cacher, reclaim=args.reclaim).run()
+    for family, stats in report.stats().items():
+        print(
+            f"{family:<12} | {stats['keys']:>8} keys | {stats['no_ttl']:>8} no ttl | "
+            f"{stats['orphans']:>8} orphans | {stats['expired']:>8} expired"
+        )
+    await cacher.aclose()
+    await db_helper.engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
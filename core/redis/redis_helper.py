@@ -1,4 +1,5 @@
 import os
+import time
 from typing import cast
 
 import redis.asyncio as redis
@@ -11,6 +12,81 @@ load_dotenv()
 class GlobalConfig(BaseConfig):
     redis_server: str = cast(str, os.environ.get("REDIS_HOST"))
     redis_port: int = cast(int, os.environ.get("REDIS_PORT"))
+    # размер пачки для SCAN/UNLINK при чистке кэша по шаблону
+    cache_scan_count: int = int(os.environ.get("CACHE_SCAN_COUNT", 1000))
+    # дочищать по SCAN ключи, записанные до появления тегов
+    cache_legacy_scan: bool = os.environ.get("CACHE_LEGACY_SCAN", "false") == "true"
+    # отдавать попадания в кэш готовыми байтами, без повторной валидации
+    cache_raw_response: bool = os.environ.get("CACHE_RAW_RESPONSE", "true") == "true"
+    # кэш записей в памяти процесса перед Redis, 0 отключает его
+    local_cache_max_entries: int = int(os.environ.get("LOCAL_CACHE_MAX_ENTRIES", 1024))
+    local_cache_ttl: float = float(os.environ.get("LOCAL_CACHE_TTL", 60))
+    # счетчики поколений живут в памяти недолго: потерянное сообщение об
+    # инвалидации отдает старые поколения не дольше этого времени, сек
+    local_cache_generation_ttl: float = float(
+        os.environ.get("LOCAL_CACHE_GENERATION_TTL", 1)
+    )
+    # канал pub/sub для сообщений об инвалидации между воркерами
+    cache_invalidation_channel: str = os.environ.get(
+        "CACHE_INVALIDATION_CHANNEL", "cache:invalidate"
+    )
+    # пересчет промаха одним процессом на все воркеры через блокировку Redis
+    cache_fill_lock: bool = os.environ.get("CACHE_FILL_LOCK", "false") == "true"
+    cache_fill_lock_ttl: int = int(os.environ.get("CACHE_FILL_LOCK_TTL", 3000))
+    cache_fill_lock_poll: int = int(os.environ.get("CACHE_FILL_LOCK_POLL", 50))
+    # отдавать инвалидированные записи, пока фоновая задача их обновляет;
+    # сколько секунд устаревшая запись живет для дерева, списков и объектов
+    cache_stale_while_revalidate: bool = (
+        os.environ.get("CACHE_STALE_WHILE_REVALIDATE", "false") == "true"
+    )
+    cache_stale_ttl_tree: int = int(os.environ.get("CACHE_STALE_TTL_TREE", 30))
+    cache_stale_ttl_lists: int = int(os.environ.get("CACHE_STALE_TTL_LISTS", 30))
+    cache_stale_ttl_items: int = int(os.environ.get("CACHE_STALE_TTL_ITEMS", 0))
+    # хранить рядом с записью сжатые gzip и brotli варианты тела, если оно
+    # не меньше cache_precompress_min_size байт
+    cache_precompress: bool = os.environ.get("CACHE_PRECOMPRESS", "false") == "true"
+    cache_precompress_min_size: int = int(
+        os.environ.get("CACHE_PRECOMPRESS_MIN_SIZE", 1024)
+    )
+    # инвалидация счетчиками поколений дерева, списка меню, меню и подменю
+    # вместо удаления ключей, записи старых поколений истекают через ttl, сек
+    cache_generations: bool = os.environ.get("CACHE_GENERATIONS", "false") == "true"
+    cache_generation_ttl: int = int(os.environ.get("CACHE_GENERATION_TTL", 3600))
+    # время жизни записей кэша по семействам ключей, сек, 0 - без срока;
+    # скидки блюд - данные из admin/Menu.xlsx, по умолчанию не истекают
+    cache_ttl_tree: int = int(os.environ.get("CACHE_TTL_TREE", 3600))
+    cache_ttl_lists: int = int(os.environ.get("CACHE_TTL_LISTS", 3600))
+    cache_ttl_items: int = int(os.environ.get("CACHE_TTL_ITEMS", 3600))
+    cache_ttl_discounts: int = int(os.environ.get("CACHE_TTL_DISCOUNTS", 0))
+    # случайная добавка к времени жизни, доля от него
+    cache_ttl_jitter: float = float(os.environ.get("CACHE_TTL_JITTER", 0.1))
+    # записи в кэш через очередь процесса, а не фоновыми задачами запроса:
+    # размер очереди, сколько запросов записывать за раз, повторы при
+    # ошибке Redis с задержкой, сек, и ожидание записи очереди при остановке
+    cache_write_behind: bool = os.environ.get("CACHE_WRITE_BEHIND", "true") == "true"
+    cache_write_queue_size: int = int(os.environ.get("CACHE_WRITE_QUEUE_SIZE", 1000))
+    cache_write_batch_size: int = int(os.environ.get("CACHE_WRITE_BATCH_SIZE", 100))
+    cache_write_retries: int = int(os.environ.get("CACHE_WRITE_RETRIES", 3))
+    cache_write_retry_delay: float = float(
+        os.environ.get("CACHE_WRITE_RETRY_DELAY", 0.1)
+    )
+    cache_write_drain_timeout: float = float(
+        os.environ.get("CACHE_WRITE_DRAIN_TIMEOUT", 10)
+    )
+    # собирать дерево /menus/all/ из веток меню, которые обновляются записями
+    cache_tree_snapshot: bool = os.environ.get("CACHE_TREE_SNAPSHOT", "true") == "true"
+    # сколько скидок запрашивать одним MGET
+    discount_batch_size: int = int(os.environ.get("DISCOUNT_BATCH_SIZE", 1000))
+    # параметры общего пула соединений
+    redis_max_connections: int = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))
+    redis_pool_timeout: float = float(os.environ.get("REDIS_POOL_TIMEOUT", 5))
+    redis_health_check_interval: int = int(
+        os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30)
+    )
+    redis_socket_timeout: float = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 5))
+    redis_socket_connect_timeout: float = float(
+        os.environ.get("REDIS_SOCKET_CONNECT_TIMEOUT", 5)
+    )
 
 
 settings = GlobalConfig()
@@ -18,15 +94,104 @@ settings = GlobalConfig()
 REDIS_URL = f"redis://{GlobalConfig.redis_server}:{GlobalConfig.redis_port}"
 
 
-async def cache():
-    async with redis.from_url(REDIS_URL) as client:
-        try:
-            yield client
-        finally:
-            await client.aclose()
+class MeteredConnectionPool(redis.BlockingConnectionPool):
+    """Пул соединений, считающий время ожидания свободного соединения"""
 
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.acquired = 0
+        self.created = 0
+        self.in_use = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
 
-async def get_async_redis_client():
-    return redis.Redis(
-        host=f"{GlobalConfig.redis_server}", port=int(f"{GlobalConfig.redis_port}")
-    )
+    async def get_connection(self, command_name, *keys, **options):
+        started = time.perf_counter()
+        connection = await super().get_connection(command_name, *keys, **options)
+        waited = time.perf_counter() - started
+        self.acquired += 1
+        self.in_use += 1
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        return connection
+
+    async def release(self, connection) -> None:
+        await super().release(connection)
+        self.in_use -= 1
+
+    def make_connection(self):
+        # пул не закрывает соединения по одному: все созданные, кроме
+        # занятых, простаивают
+        self.created += 1
+        return super().make_connection()
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "max_connections": self.max_connections,
+            "in_use": self.in_use,
+            "idle": self.created - self.in_use,
+            "acquired": self.acquired,
+            "wait_time_avg_ms": (
+                self.wait_time_total / self.acquired * 1000 if self.acquired else 0.0
+            ),
+            "wait_time_max_ms": self.wait_time_max * 1000,
+        }
+
+
+class RedisHelper:
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_connections: int,
+        timeout: float,
+        health_check_interval: int,
+        socket_timeout: float,
+        socket_connect_timeout: float,
+    ):
+        self.pool_kwargs = dict(
+            host=host,
+            port=port,
+            max_connections=max_connections,
+            timeout=timeout,
+            health_check_interval=health_check_interval,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout,
+        )
+        self.pool: MeteredConnectionPool | None = None
+
+    def connect(self) -> MeteredConnectionPool:
+        """Создает пул соединений на время жизни приложения"""
+        if self.pool is None:
+            self.pool = MeteredConnectionPool(**self.pool_kwargs)
+        return self.pool
+
+    async def disconnect(self) -> None:
+        """Закрывает соединения пула"""
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            await pool.disconnect()
+
+    def get_client(self) -> redis.Redis:
+        # клиент не владеет пулом, поэтому его закрытие не рвет соединения
+        return redis.Redis(connection_pool=self.connect())
+
+    def stats(self) -> dict[str, int | float]:
+        if self.pool is None:
+            return {}
+        return self.pool.stats()
+
+
+redis_helper = RedisHelper(
+    host=GlobalConfig.redis_server,
+    port=int(GlobalConfig.redis_port),
+    max_connections=GlobalConfig.redis_max_connections,
+    timeout=GlobalConfig.redis_pool_timeout,
+    health_check_interval=GlobalConfig.redis_health_check_interval,
+    socket_timeout=GlobalConfig.redis_socket_timeout,
+    socket_connect_timeout=GlobalConfig.redis_socket_connect_timeout,
+)
+
+
+async def get_async_redis_client() -> redis.Redis:
+    return redis_helper.get_client()
@@ -0,0 +1,67 @@
+import gzip
+import hashlib
+from typing import Any, TypeVar
+
+import brotli
+from fastapi import Response
+from pydantic import TypeAdapter
+
+from core.redis.redis_helper import GlobalConfig
+
+T = TypeVar("T")
+
+# сжатия вариантов тела в порядке предпочтения
+ENCODINGS = ("br", "gzip")
+
+# Версия формата записей кэша. Увеличивать при изменении схем ответа:
+# записи со старой версией считаются промахом и перезаписываются.
+CACHE_SCHEMA_VERSION = b"1"
+
+
+def encode(adapter: TypeAdapter[T], value: Any) -> bytes:
+    """Приводит ORM-объекты к схеме ответа и сериализует в JSON"""
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+
+def decode(adapter: TypeAdapter[T], raw: bytes) -> T:
+    """Восстанавливает схему ответа из JSON"""
+    return adapter.validate_json(raw)
+
+
+def etag_of(raw: bytes) -> str:
+    """ETag тела ответа: хэш содержимого в кавычках"""
+    return f'"{hashlib.blake2b(raw, digest_size=16).hexdigest()}"'
+
+
+def compress(raw: bytes) -> dict[str, bytes]:
+    """Сжатые варианты тела для хранения рядом с записью кэша"""
+    return {
+        "br": brotli.compress(raw, quality=9),
+        "gzip": gzip.compress(raw, compresslevel=9),
+    }
+
+
+def decompress(raw: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.decompress(raw)
+    return gzip.decompress(raw)
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    """ETag сжатого варианта отличается от ETag исходного тела"""
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def from_cache(adapter: TypeAdapter[T], raw: bytes) -> T | Response:
+    """Ответ из записи кэша: готовое тело JSON или восстановленная схема.
+
+    Тело записано тем же сериализатором, что использует FastAPI для
+    response_model, поэтому ответ побайтно совпадает с ответом из БД.
+    Готовое тело отдается с ETag для условных запросов клиентов.
+    """
+    if GlobalConfig.cache_raw_response:
+        headers = {"ETag": etag_of(raw)}
+        if GlobalConfig.cache_precompress:
+            headers["Vary"] = "Accept-Encoding"
+        return Response(content=raw, media_type="application/json", headers=headers)
+    return decode(adapter, raw)
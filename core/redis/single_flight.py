@@ -0,0 +1,46 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Объединяет одновременные вычисления одного ключа в процессе.
+
+    Первая корутина вычисляет значение, остальные ждут ее результат или
+    получают то же исключение.
+    """
+
+    def __init__(self) -> None:
+        self.calls: dict[str, asyncio.Future[T]] = {}
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        while (call := self.calls.get(key)) is not None:
+            try:
+                return await asyncio.shield(call)
+            except asyncio.CancelledError:
+                # отменен запрос, который вычислял значение, а не текущий
+                if not call.cancelled():
+                    raise
+
+        call = asyncio.get_running_loop().create_future()
+        self.calls[key] = call
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            call.cancel()
+            raise
+        except BaseException as exc:
+            call.set_exception(exc)
+            # ожидающих может не быть, исключение уже выброшено выше
+            call.exception()
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            del self.calls[key]
+
+
+single_flight: SingleFlight[bytes] = SingleFlight()
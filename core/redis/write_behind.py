@@ -0,0 +1,254 @@
+import asyncio
+import logging
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextvars import ContextVar
+from typing import Annotated, Any
+
+from fastapi import BackgroundTasks, Depends, Request
+from redis.exceptions import RedisError
+
+from core.redis.redis_helper import GlobalConfig, redis_helper
+
+# команды заполнений кэша, собираемые очередью в один pipeline: пока
+# переменная задана, запись в кэш добавляет в список свои команды, а не
+# выполняет их сама
+pending_fills: ContextVar[list[Callable[[Any], Any]] | None] = ContextVar(
+    "pending_fills", default=None
+)
+
+
+class WriteBatch:
+    """Записи в кэш одного запроса, выполняются по порядку.
+
+    Повторяет интерфейс add_task у BackgroundTasks: сервисы планируют
+    запись, не зная, выполнит ли ее очередь или сам запрос.
+    """
+
+    def __init__(self, changes_data: bool = False) -> None:
+        self.calls: list[tuple[Callable[..., Awaitable[Any]], tuple, dict]] = []
+        # записи запроса, менявшего данные: инвалидации, а не заполнения
+        self.changes_data = changes_data
+        # выставляется, когда очередь выполнила записи
+        self.flushed = asyncio.Event()
+
+    def add_task(
+        self, func: Callable[..., Awaitable[Any]], *args: Any, **kwargs: Any
+    ) -> None:
+        self.calls.append((func, args, kwargs))
+
+    async def __call__(self) -> None:
+        for func, args, kwargs in self.calls:
+            await func(*args, **kwargs)
+
+
+class WriteBehindQueue:
+    """Ограниченная очередь записей в кэш, общая для процесса.
+
+    Фоновая задача забирает из очереди до batch_size запросов. Заполнения
+    кэша чтениями уходят в Redis одним pipeline на все запросы, а не
+    запрос за запросом. Записи запросов, менявших данные, выполняются по
+    порядку после заполнений, поставленных раньше них: заполнение не может
+    лечь после более поздней инвалидации и вернуть устаревшие данные, а
+    инвалидация ждет один pipeline, а не каждое заполнение очереди.
+    Запрос, менявший данные, отпускается сразу после своих записей. Вызов,
+    упавший с ошибкой Redis, повторяется; остальные ошибки пишутся в лог и
+    считаются в метриках. Заполненная очередь задерживает запросы, а не
+    теряет записи.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        batch_size: int,
+        retries: int,
+        retry_delay: float,
+    ) -> None:
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.queue: asyncio.Queue[WriteBatch] | None = None
+        self.task: asyncio.Task | None = None
+        self.max_depth = 0
+        self.flushed = 0
+        self.retried = 0
+        self.failed = 0
+        self.merged = 0
+        self.flush_time = 0.0
+        self.max_flush_time = 0.0
+        self.flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None
+
+    def start(self) -> None:
+        if self.task is None and GlobalConfig.cache_write_behind:
+            self.queue = asyncio.Queue(maxsize=self.max_size)
+            self.task = asyncio.create_task(self.drain())
+
+    async def stop(self, timeout: float) -> None:
+        """Дожидается записи накопленного в очереди и останавливает задачу"""
+        if self.task is None or self.queue is None:
+            return
+        task, self.task = self.task, None
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(
+                "cache write-behind queue stopped with %s pending requests",
+                self.queue.qsize(),
+            )
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+    async def submit(self, batch: WriteBatch, wait: bool = False) -> None:
+        """Ставит записи в очередь, с wait - дожидается их выполнения"""
+        if self.queue is None:
+            raise RuntimeError("write-behind queue is not started")
+        await self.queue.put(batch)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        if wait:
+            await batch.flushed.wait()
+
+    async def drain(self) -> None:
+        assert self.queue is not None
+        while True:
+            batches = [await self.queue.get()]
+            while len(batches) < self.batch_size and not self.queue.empty():
+                batches.append(self.queue.get_nowait())
+            started = time.perf_counter()
+            try:
+                await self.flush_all(batches)
+            finally:
+                for batch in batches:
+                    batch.flushed.set()
+                    self.queue.task_done()
+            elapsed = time.perf_counter() - started
+            self.flushes += 1
+            self.flush_time += elapsed
+            self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    async def flush_all(self, batches: list[WriteBatch]) -> None:
+        last_change = max(
+            (i for i, batch in enumerate(batches) if batch.changes_data), default=-1
+        )
+        changes = batches[:last_change + 1]
+        # заполнения, поставленные раньше изменения, ложатся до его инвалидации
+        await self.flush_fills([batch for batch in changes if not batch.changes_data])
+        for batch in changes:
+            if batch.changes_data:
+                await self.flush(batch)
+                batch.flushed.set()
+        await self.flush_fills(batches[last_change + 1:])
+
+    async def flush_fills(self, batches: list[WriteBatch]) -> None:
+        """Заполнения кэша запросов одним pipeline"""
+        if not batches:
+            return
+        commands: list[Callable[[Any], Any]] = []
+        token = pending_fills.set(commands)
+        try:
+            for batch in batches:
+                await self.flush(batch)
+        finally:
+            pending_fills.reset(token)
+        if commands:
+            await self.execute(commands)
+            self.merged += len(commands)
+
+    async def execute(self, commands: list[Callable[[Any], Any]]) -> None:
+        """Накопленные заполнения одним pipeline, с повтором при ошибке Redis"""
+        client = redis_helper.get_client()
+        for attempt in range(self.retries + 1):
+            try:
+                async with client.pipeline(transaction=True) as pipe:
+                    for command in commands:
+                        command(pipe)
+                    await pipe.execute()
+                return
+            except RedisError as error:
+                if attempt == self.retries:
+                    self.failed += 1
+                    logging.error("cache write failed: %r", error)
+                    return
+                self.retried += 1
+                await asyncio.sleep(self.retry_delay * 2**attempt)
+
+    async def flush(self, batch: WriteBatch) -> None:
+        for func, args, kwargs in batch.calls:
+            for attempt in range(self.retries + 1):
+                try:
+                    await func(*args, **kwargs)
+                    break
+                except RedisError as error:
+                    if attempt == self.retries:
+                        self.failed += 1
+                        logging.error("cache write failed: %r", error)
+                        break
+                    self.retried += 1
+                    await asyncio.sleep(self.retry_delay * 2**attempt)
+                except Exception:
+                    # следующие записи запроса, например инвалидация, нужнее
+                    self.failed += 1
+                    logging.exception("cache write failed")
+                    break
+        self.flushed += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "running": self.running,
+            "depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_depth": self.max_depth,
+            "max_size": self.max_size,
+            "flushed": self.flushed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "merged": self.merged,
+            "flushes": self.flushes,
+            "flush_avg_ms": (
+                self.flush_time / self.flushes * 1000 if self.flushes else 0.0
+            ),
+            "flush_max_ms": self.max_flush_time * 1000,
+        }
+
+
+write_behind = WriteBehindQueue(
+    max_size=GlobalConfig.cache_write_queue_size,
+    batch_size=GlobalConfig.cache_write_batch_size,
+    retries=GlobalConfig.cache_write_retries,
+    retry_delay=GlobalConfig.cache_write_retry_delay,
+)
+
+
+async def get_cache_writes(
+    request: Request,
+    background_tasks: BackgroundTasks,
+) -> AsyncIterator[WriteBatch]:
+    """Записи в кэш запроса: в очередь, а без нее - фоновой задачей ответа.
+
+    Запрос, меняющий данные, отвечает только после своих записей, чтобы
+    следующее чтение не получило из кэша данные до изменения.
+    """
+    changes_data = request.method not in ("GET", "HEAD")
+    batch = WriteBatch(changes_data)
+    yield batch
+    if not batch.calls:
+        return
+    if write_behind.running:
+        await write_behind.submit(batch, wait=changes_data)
+    elif changes_data:
+        try:
+            await batch()
+        except RedisError as error:
+            # изменение уже в БД, запрос не должен падать из-за кэша
+            logging.error("cache write failed: %r", error)
+    else:
+        background_tasks.add_task(batch)
+
+
+CacheWrites = Annotated[WriteBatch, Depends(get_cache_writes)]
@@ -5,14 +5,22 @@ from fastapi import FastAPI
 
 from api_v1 import router as router_v1
 from core.config import settings
-from tasks.tasks import CELERY_STATUS, update_db
+from core.redis.cache_repository import drain_refreshes
+from core.redis.local_cache import invalidation_listener
+from core.redis.redis_helper import GlobalConfig, redis_helper
+from core.redis.write_behind import write_behind
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    if CELERY_STATUS:
-        update_db.delay()
+    redis_helper.connect()
+    invalidation_listener.start()
+    write_behind.start()
     yield
+    await drain_refreshes()
+    await write_behind.stop(GlobalConfig.cache_write_drain_timeout)
+    await invalidation_listener.stop()
+    await redis_helper.disconnect()
 
 
 app = FastAPI(lifespan=lifespan)
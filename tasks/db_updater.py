@@ -1,212 +1,240 @@
-from typing import Any, Dict, List, Union
+import uuid
+from collections.abc import Iterable
+from decimal import Decimal
+from typing import Any
 
 import redis
-from sqlalchemy import select
+from sqlalchemy import ARRAY, Select, any_, delete, literal, select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from core.models import Dish, Menu, Submenu
+from api_v1.menus.snapshot import patch_branches
+from core.models import Base, Dish, Menu, Submenu
+from core.redis.cache_repository import (
+    ALL_BASE_KEY,
+    MENUS_KEY,
+    CacheRepository,
+    jittered,
+    menu_tag,
+)
+from core.redis.redis_helper import GlobalConfig
+from tasks.import_state import record_hash
+
+# сколько строк записывать одним INSERT ... ON CONFLICT и удалять одним DELETE
+WRITE_BATCH_SIZE = 1000
+
+Rows = dict[uuid.UUID, dict[str, Any]]
 
 
 class DatabaseUpdater:
-    """Добавление в БД данных из excel файла"""
+    """Синхронизация БД с данными из excel файла.
+
+    Существующие меню, подменю и блюда читаются одним запросом на уровень,
+    новые и измененные строки находятся сравнением с файлом и пишутся
+    пачками INSERT ... ON CONFLICT DO UPDATE, строки, которых нет в файле,
+    удаляются пачками DELETE ... WHERE id = ANY(...).
+
+    Меню читаются из файла по одному. Хэш каждой ветки меню сохраняется в
+    branch_hashes, ветки с тем же хэшем в applied_branches не изменились с
+    прошлой загрузки и не сравниваются.
+    """
 
     def __init__(
         self,
-        parser_data: list[dict],
+        parser_data: Iterable[dict],
         session: AsyncSession,
         redis_client: redis.Redis,
+        applied_branches: dict[str, str] | None = None,
     ):
         self.parser_data = parser_data
         self.session = session
         self.redis_client = redis_client
-
-    async def add_menu_items(self, full_base: list[dict]) -> None:
-        for menu in full_base:
-            existing_menu = await self.get_existing_menu(menu["id"])
-            if existing_menu:
-                await self.update_menu(existing_menu, menu)
-            else:
-                await self.add_new_menu(menu)
-
-        await self.remove_menu_if_not_in_data(full_base)
-        await self.session.commit()
-
-    async def get_existing_menu(self, menu_id: str) -> Menu:
-        existing_menu_query = select(Menu).filter_by(id=menu_id)
-        result = await self.session.execute(existing_menu_query)
-        return result.scalar()
-
-    async def update_menu(
-        self, existing_menu: Menu, new_menu_data: dict[str, str | Any]
-    ) -> None:
-        existing_menu.title = new_menu_data["title"]
-        existing_menu.description = new_menu_data["description"]
-
-        for submenu in new_menu_data["submenus"]:
-            existing_submenu = await self.get_existing_submenu(submenu["id"])  # type: ignore
-            if existing_submenu:
-                await self.update_submenu(existing_submenu, submenu, existing_menu)  # type: ignore
-            else:
-                await self.add_new_submenu(submenu, existing_menu)  # type: ignore
-
-        await self.remove_submenu_if_not_in_data(
-            existing_menu, new_menu_data["submenus"]  # type: ignore
+        self.applied_branches = applied_branches or {}
+        self.branch_hashes: dict[str, str] = {}
+        self.unchanged_menu_ids: set[uuid.UUID] = set()
+        # меню, в которых что-то изменилось
+        self.changed_menu_ids: set[uuid.UUID] = set()
+
+    async def add_menu_items(self, full_base: Iterable[dict]) -> None:
+        menus, submenus, dishes, discounts = self.flatten(full_base)
+        old_menus = await self.load_rows(select(Menu.id, Menu.title, Menu.description))
+        for menu_id in self.unchanged_menu_ids:
+            old_menus.pop(menu_id, None)
+        # подменю и блюда только измененных, новых и удаленных меню
+        in_scope = Submenu.menu_id == any_(
+            literal(list(old_menus), ARRAY(Submenu.menu_id.type))
         )
-
-    async def get_existing_submenu(self, submenu_id: str) -> Submenu:
-        existing_submenu_query = select(Submenu).filter_by(id=submenu_id)
-        result = await self.session.execute(existing_submenu_query)
-        return result.scalar()
-
-    async def update_submenu(
-        self,
-        existing_submenu: Submenu,
-        new_submenu_data: dict[str, str | list[Any]],
-        menu: Menu,
-    ) -> None:
-        existing_submenu.title = new_submenu_data["title"]
-        existing_submenu.description = new_submenu_data["description"]
-
-        for dish in new_submenu_data["dishes"]:
-            existing_dish = await self.get_existing_dish(dish["id"])  # type: ignore
-            if existing_dish:
-                await self.update_dish(
-                    existing_dish,
-                    dish,  # type: ignore
-                    existing_submenu,
-                    self.redis_client,
-                )
-            else:
-                await self.add_new_dish(dish, existing_submenu, self.redis_client)  # type: ignore
-
-        await self.remove_dish_if_not_in_data(
-            existing_submenu, new_submenu_data["dishes"]  # type: ignore
-        )
-
-    async def get_existing_dish(self, dish_id: str) -> Dish:
-        existing_dish_query = select(Dish).filter_by(id=dish_id)
-        result = await self.session.execute(existing_dish_query)
-        return result.scalar()
-
-    async def update_dish(
-        self,
-        existing_dish: Dish,
-        new_dish_data: dict[str, str | Any],
-        submenu: Submenu,
-        redis_client: redis.Redis,
-    ) -> None:
-        existing_dish.title = new_dish_data["title"]
-        existing_dish.description = new_dish_data["description"]
-        existing_dish.price = new_dish_data["price"]
-
-        await self.delete_dish_discount(existing_dish.id, redis_client)
-
-        await self.save_dish_discount(
-            existing_dish.id, new_dish_data.get("dish_discount"), redis_client
+        old_submenus = await self.load_rows(
+            select(
+                Submenu.id, Submenu.menu_id, Submenu.title, Submenu.description
+            ).where(in_scope)
         )
-
-    async def save_dish_discount(
-        self,
-        dish_id: str,
-        dish_discount: str | Any | None,
-        redis_client: redis.Redis,
-    ) -> None:
-        if dish_discount is not None:
-            await redis_client.set(f"dish_discount_{dish_id}", dish_discount)  # type: ignore
-
-    async def delete_dish_discount(
-        self,
-        dish_id: str,
-        redis_client: redis.Redis,
-    ) -> None:
-        await redis_client.delete(f"dish_discount_{dish_id}")  # type: ignore
-
-    async def add_new_menu(self, menu_data: dict[str, str | list]) -> None:
-        menu_item = Menu(
-            title=menu_data["title"],
-            description=menu_data["description"],
-            id=menu_data["id"],
-            submenus=[],
+        old_dishes = await self.load_rows(
+            select(
+                Dish.id,
+                Dish.submenu_id,
+                Dish.title,
+                Dish.description,
+                Dish.price,
+                Dish.dish_discount,
+            )
+            .join(Dish.submenu)
+            .where(in_scope)
         )
-        self.session.add(menu_item)
 
-        for submenu in menu_data["submenus"]:
-            await self.add_new_submenu(submenu, menu_item)  # type: ignore
+        def menu_of(dish: dict[str, Any], submenus: Rows) -> uuid.UUID:
+            return submenus[dish["submenu_id"]]["menu_id"]
+
+        changed_menus = self.changed_rows(menus, old_menus)
+        changed_submenus = self.changed_rows(submenus, old_submenus)
+        changed_dishes = self.changed_rows(dishes, old_dishes)
+        removed_menus = old_menus.keys() - menus.keys()
+        removed_submenus = old_submenus.keys() - submenus.keys()
+        removed_dishes = old_dishes.keys() - dishes.keys()
+
+        self.changed_menu_ids.update(row["id"] for row in changed_menus)
+        self.changed_menu_ids.update(removed_menus)
+        for row in changed_submenus:
+            self.changed_menu_ids.add(row["menu_id"])
+            if row["id"] in old_submenus:
+                self.changed_menu_ids.add(old_submenus[row["id"]]["menu_id"])
+        for submenu_id in removed_submenus:
+            self.changed_menu_ids.add(old_submenus[submenu_id]["menu_id"])
+        for row in changed_dishes:
+            self.changed_menu_ids.add(menu_of(row, submenus))
+            if row["id"] in old_dishes:
+                self.changed_menu_ids.add(menu_of(old_dishes[row["id"]], old_submenus))
+        for dish_id in removed_dishes:
+            self.changed_menu_ids.add(menu_of(old_dishes[dish_id], old_submenus))
+
+        # сначала удаляются блюда, чтобы их названия можно было занять,
+        # подменю и меню - после переноса блюд и подменю из них
+        await self.delete_rows(Dish, removed_dishes)
+        await self.upsert_rows(Menu, changed_menus)
+        await self.upsert_rows(Submenu, changed_submenus)
+        await self.upsert_rows(Dish, changed_dishes)
+        await self.delete_rows(Submenu, removed_submenus)
+        await self.delete_rows(Menu, removed_menus)
+        await self.session.commit()
 
-    async def add_new_submenu(
-        self,
-        submenu_data: dict[str, str | list[Any]],
-        menu: Menu,
-    ) -> None:
-        submenu_item = Submenu(
-            title=submenu_data["title"],
-            description=submenu_data["description"],
-            id=submenu_data["id"],
-            dishes=[],
+        for dish_id in await self.sync_discounts(discounts, removed_dishes):
+            self.changed_menu_ids.add(menu_of(dishes[dish_id], submenus))
+        await self.update_cache()
+
+    async def update_cache(self) -> None:
+        """Обновление веток дерева и кэша только для измененных меню"""
+        if not self.changed_menu_ids:
+            return
+        cache_repo = CacheRepository(self.redis_client)
+        await patch_branches(cache_repo, *self.changed_menu_ids)
+        await cache_repo.invalidate(
+            tags=[menu_tag(menu_id) for menu_id in self.changed_menu_ids],
+            keys=[MENUS_KEY, ALL_BASE_KEY],
         )
-        menu.submenus.append(submenu_item)
 
-        for dish in submenu_data["dishes"]:
-            await self.add_new_dish(
-                dish,  # type: ignore
-                submenu_item,
-                self.redis_client,
+    def flatten(self, full_base: Iterable[dict]) -> tuple[Rows, Rows, Rows, dict]:
+        """Строки измененных меню, подменю и блюд из файла и скидки блюд"""
+        menus: Rows = {}
+        submenus: Rows = {}
+        dishes: Rows = {}
+        discounts: dict[uuid.UUID, Any] = {}
+        for menu in full_base:
+            menu_id = uuid.UUID(str(menu["id"]))
+            branch_hash = record_hash(menu)
+            self.branch_hashes[str(menu_id)] = branch_hash
+            if self.applied_branches.get(str(menu_id)) == branch_hash:
+                self.unchanged_menu_ids.add(menu_id)
+                continue
+            menus[menu_id] = {
+                "id": menu_id,
+                "title": menu["title"],
+                "description": menu["description"],
+            }
+            for submenu in menu["submenus"]:
+                submenu_id = uuid.UUID(str(submenu["id"]))
+                submenus[submenu_id] = {
+                    "id": submenu_id,
+                    "menu_id": menu_id,
+                    "title": submenu["title"],
+                    "description": submenu["description"],
+                }
+                for dish in submenu["dishes"]:
+                    dish_id = uuid.UUID(str(dish["id"]))
+                    dish_discount = dish.get("dish_discount")
+                    dishes[dish_id] = {
+                        "id": dish_id,
+                        "submenu_id": submenu_id,
+                        "title": dish["title"],
+                        "description": dish["description"],
+                        "price": Decimal(str(dish["price"])),
+                        "dish_discount": Decimal(str(dish_discount or 0)),
+                    }
+                    discounts[dish_id] = dish_discount
+        return menus, submenus, dishes, discounts
+
+    async def load_rows(self, stmt: Select) -> Rows:
+        """Существующие строки таблицы одним запросом"""
+        result = await self.session.execute(stmt)
+        return {row.id: dict(row._mapping) for row in result}
+
+    @staticmethod
+    def changed_rows(rows: Rows, old_rows: Rows) -> list[dict[str, Any]]:
+        """Новые строки и строки, отличающиеся от сохраненных"""
+        return [row for row_id, row in rows.items() if old_rows.get(row_id) != row]
+
+    async def upsert_rows(self, model: type[Base], rows: list[dict]) -> None:
+        for start in range(0, len(rows), WRITE_BATCH_SIZE):
+            stmt = insert(model).values(rows[start:start + WRITE_BATCH_SIZE])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[model.id],
+                set_={
+                    column: stmt.excluded[column]
+                    for column in rows[0]
+                    if column != "id"
+                },
+            )
+            await self.session.execute(stmt)
+
+    async def delete_rows(self, model: type[Base], ids: Iterable[uuid.UUID]) -> None:
+        ids = list(ids)
+        for start in range(0, len(ids), WRITE_BATCH_SIZE):
+            chunk = literal(ids[start:start + WRITE_BATCH_SIZE], ARRAY(model.id.type))
+            await self.session.execute(
+                delete(model).where(model.id == any_(chunk)),
+                execution_options={"synchronize_session": False},
             )
 
-    async def add_new_dish(
+    async def sync_discounts(
         self,
-        dish_data: dict[str, str | Any],
-        submenu: Submenu,
-        redis_client: redis.Redis,
-    ) -> None:
-        dish_item = Dish(
-            title=dish_data["title"],
-            description=dish_data["description"],
-            price=dish_data["price"],
-            id=dish_data["id"],
-            dish_discount=dish_data["dish_discount"],
-        )
-        submenu.dishes.append(dish_item)
-
-        await self.save_dish_discount(
-            dish_item.id,
-            dish_data.get("dish_discount"),
-            redis_client,
-        )
-
-    async def remove_menu_if_not_in_data(
-        self, full_base: list[dict[str, str | list]]
-    ) -> None:
-        menu_ids_from_data = [menu["id"] for menu in full_base]
-        menus_to_remove_query = select(Menu).filter(~Menu.id.in_(menu_ids_from_data))
-        result = await self.session.execute(menus_to_remove_query)
-        menus_to_remove = result.scalars().all()
-
-        for menu in menus_to_remove:
-            self.session.delete(menu)
-
-    async def remove_submenu_if_not_in_data(
-        self, menu: Menu, submenus_data: list[dict[str, str | list[Any]]]
-    ) -> None:
-        submenu_ids_from_data = [submenu["id"] for submenu in submenus_data]
-        submenus_to_remove_query = select(Submenu).filter(
-            (Submenu.menu_id == menu.id) & (~Submenu.id.in_(submenu_ids_from_data))
-        )
-        result = await self.session.execute(submenus_to_remove_query)
-        submenus_to_remove = result.scalars().all()
-
-        for submenu in submenus_to_remove:
-            self.session.delete(submenu)
-
-    async def remove_dish_if_not_in_data(
-        self, submenu: Submenu, dishes_data: list[dict[str, str | Any]]
-    ) -> None:
-        dish_ids_from_data = [dish["id"] for dish in dishes_data]
-        dishes_to_remove_query = select(Dish).filter(
-            (Dish.submenu_id == submenu.id) & (~Dish.id.in_(dish_ids_from_data))
-        )
-        result = await self.session.execute(dishes_to_remove_query)
-        dishes_to_remove = result.scalars().all()
-
-        for dish in dishes_to_remove:
-            self.session.delete(dish)
+        discounts: dict[uuid.UUID, Any],
+        removed_dish_ids: Iterable[uuid.UUID],
+    ) -> set[uuid.UUID]:
+        """Запись скидок в Redis пачками, возвращает блюда с новой скидкой"""
+        changed: set[uuid.UUID] = set()
+        dish_ids = list(discounts)
+        batch_size = GlobalConfig.discount_batch_size
+        for start in range(0, len(dish_ids), batch_size):
+            chunk = dish_ids[start:start + batch_size]
+            keys = [f"dish_discount_{dish_id}" for dish_id in chunk]
+            current = await self.redis_client.mget(keys)
+            async with self.redis_client.pipeline(transaction=False) as pipe:
+                for dish_id, key, raw_discount in zip(chunk, keys, current):
+                    # скидка хранится в Redis и тоже меняет цену блюда в дереве
+                    dish_discount = discounts[dish_id]
+                    if dish_discount is None:
+                        pipe.delete(key)
+                    else:
+                        pipe.set(
+                            key,
+                            dish_discount,
+                            ex=jittered(GlobalConfig.cache_ttl_discounts) or None,
+                        )
+                    if raw_discount != (
+                        None if dish_discount is None else str(dish_discount).encode()
+                    ):
+                        changed.add(dish_id)
+                await pipe.execute()
+        removed_keys = [f"dish_discount_{dish_id}" for dish_id in removed_dish_ids]
+        for start in range(0, len(removed_keys), batch_size):
+            await self.redis_client.delete(*removed_keys[start:start + batch_size])
+        return changed
@@ -0,0 +1,69 @@
+import hashlib
+import json
+import os
+from typing import Any
+
+import redis.asyncio as redis
+
+from core.redis.redis_helper import GlobalConfig
+
+# сколько байт файла читать за раз при подсчете хэша
+READ_CHUNK_SIZE = 1 << 20
+
+
+def file_stat(file_path: str) -> str:
+    """Отпечаток файла без чтения: время изменения и размер"""
+    stat = os.stat(file_path)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def file_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        while chunk := file.read(READ_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def record_hash(record: Any) -> str:
+    """Хэш записи файла вместе с вложенными подменю и блюдами"""
+    data = json.dumps(record, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class ImportState:
+    """Отпечаток файла и хэши веток меню, последними записанные в БД.
+
+    Хранится в Redis без срока жизни. Если скидки блюд истекают, состояние
+    истекает не позже них, чтобы следующая загрузка записала их заново.
+    """
+
+    def __init__(self, redis_client: redis.Redis, file_path: str) -> None:
+        self.redis_client = redis_client
+        self.key = f"import:{file_path}"
+        self.stat: str | None = None
+        self.digest: str | None = None
+        self.branches: dict[str, str] = {}
+
+    async def load(self) -> None:
+        stat, digest, branches = await self.redis_client.hmget(  # type: ignore
+            self.key, "stat", "digest", "branches"
+        )
+        self.stat = stat.decode() if stat is not None else None
+        self.digest = digest.decode() if digest is not None else None
+        self.branches = json.loads(branches) if branches is not None else {}
+
+    async def save(self, stat: str, digest: str, branches: dict[str, str]) -> None:
+        self.stat, self.digest, self.branches = stat, digest, branches
+        async with self.redis_client.pipeline(transaction=True) as pipe:  # type: ignore
+            pipe.hset(
+                self.key,
+                mapping={
+                    "stat": stat,
+                    "digest": digest,
+                    "branches": json.dumps(branches),
+                },
+            )
+            if GlobalConfig.cache_ttl_discounts:
+                pipe.expire(self.key, GlobalConfig.cache_ttl_discounts)
+            await pipe.execute()
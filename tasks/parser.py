@@ -1,58 +1,152 @@
+import csv
+import json
+from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
 import openpyxl
 
+# столбцов в строке блюда, самой длинной строке таблицы
+COLUMNS = 7
+
+# запись файла: номер строки, вид (menu, submenu или dish) и поля
+Record = tuple[int, str, dict[str, Any]]
+
+
+class MenuParser(ABC):
+    """Чтение меню из файла админки.
+
+    Форматы отличаются только чтением записей: iter_records отдает меню,
+    подменю и блюда в порядке файла, а iter_menus собирает из них меню
+    вместе с подменю и блюдами и отдает по одному, как только они закончены.
+    """
 
-class MenuParser:
     def __init__(self, file_path):
         self.file_path = file_path
 
-    def parse(self):
-        menu_data = []
-        workbook = openpyxl.load_workbook(self.file_path)
+    def parse(self) -> list[dict]:
+        return list(self.iter_menus())
+
+    @abstractmethod
+    def iter_records(self) -> Iterator[Record]:
+        """Записи файла в его порядке"""
+
+    def iter_menus(self) -> Iterator[dict]:
+        """Меню файла вместе с подменю и блюдами, по одному.
+
+        Запись неизвестного вида, подменю до меню и блюдо до подменю
+        этого меню - ошибка ValueError с номером строки.
+        """
+        current_menu = None
+        current_submenu = None
+        for line, kind, record in self.iter_records():
+            if kind == "menu":
+                if current_menu is not None:
+                    yield current_menu
+                current_menu = {**record, "submenus": []}
+                current_submenu = None
+            elif kind == "submenu":
+                if current_menu is None:
+                    raise ValueError(f"line {line}: submenu before its menu")
+                current_submenu = {**record, "dishes": []}
+                current_menu["submenus"].append(current_submenu)
+            elif kind == "dish":
+                if current_submenu is None:
+                    raise ValueError(f"line {line}: dish before its submenu")
+                current_submenu["dishes"].append(record)
+            else:
+                raise ValueError(f"line {line}: unknown record type {kind!r}")
+        if current_menu is not None:
+            yield current_menu
+
+
+def records_from_rows(rows: Iterable[tuple]) -> Iterator[Record]:
+    """Записи из строк таблицы, где подменю и блюдо сдвинуты на столбец.
+
+    Пустая скидка блюда - 0. Непустая строка, не похожая ни на одну
+    запись, - ошибка ValueError с номером строки.
+    """
+    for line, cells in enumerate(rows, start=1):
+        # пустые ячейки в конце строки могут не прийти
+        row = (*cells, *(None,) * (COLUMNS - len(cells)))
+        if row[0] and row[1] and row[2]:
+            yield line, "menu", {"title": row[1], "description": row[2], "id": row[0]}
+        elif row[1] and row[2] and row[3]:
+            yield line, "submenu", {
+                "title": row[2],
+                "description": row[3],
+                "id": row[1],
+            }
+        elif row[2] and row[3] and row[4] and row[5]:
+            yield line, "dish", {
+                "title": row[3],
+                "description": row[4],
+                "price": row[5],
+                "id": row[2],
+                "dish_discount": row[6] if row[6] is not None else 0,
+            }
+        elif any(cell is not None for cell in row):
+            raise ValueError(f"line {line}: unrecognized row")
+
+
+class XlsxMenuParser(MenuParser):
+    """Меню из xlsx, по умолчанию потоком (read_only), без модели книги"""
+
+    def __init__(self, file_path, read_only: bool = True):
+        super().__init__(file_path)
+        self.read_only = read_only
+
+    def iter_records(self) -> Iterator[Record]:
+        workbook = openpyxl.load_workbook(self.file_path, read_only=self.read_only)
         try:
-            sheet = workbook.active
-            current_menu = None
-            current_submenu = None
-
-            for row in sheet.iter_rows(values_only=True):
-                if row[0] and row[1] and row[2]:
-                    menu_id = row[0]
-                    menu_title = row[1]
-                    menu_description = row[2]
-                    current_menu = {
-                        "title": menu_title,
-                        "description": menu_description,
-                        "id": menu_id,
-                        "submenus": [],
-                    }
-                    menu_data.append(current_menu)
-
-                elif row[1] and row[2] and row[3]:
-                    submenu_id = row[1]
-                    submenu_title = row[2]
-                    submenu_description = row[3]
-                    current_submenu = {
-                        "title": submenu_title,
-                        "description": submenu_description,
-                        "id": submenu_id,
-                        "dishes": [],
-                    }
-                    current_menu["submenus"].append(current_submenu)
-
-                elif row[2] and row[3] and row[4] and row[5] and row[6]:
-                    dish_id = row[2]
-                    dish_title = row[3]
-                    dish_description = row[4]
-                    dish_price = row[5]
-                    dish_discount = row[6]
-                    dish = {
-                        "title": dish_title,
-                        "description": dish_description,
-                        "price": dish_price,
-                        "id": dish_id,
-                        "dish_discount": dish_discount,
-                    }
-                    current_submenu["dishes"].append(dish)
+            yield from records_from_rows(workbook.active.iter_rows(values_only=True))
         finally:
             workbook.close()
 
-        return menu_data
+
+def number(value: str) -> int | float:
+    """Число из ячейки CSV, как его прочитал бы openpyxl"""
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+class CsvMenuParser(MenuParser):
+    """Меню из CSV с теми же столбцами, что и в xlsx"""
+
+    def iter_records(self) -> Iterator[Record]:
+        with open(self.file_path, newline="", encoding="utf-8") as file:
+            rows = (tuple(cell or None for cell in row) for row in csv.reader(file))
+            for line, kind, record in records_from_rows(rows):
+                if kind == "dish":
+                    record["price"] = number(record["price"])
+                    record["dish_discount"] = number(record["dish_discount"])
+                yield line, kind, record
+
+
+class JsonLinesMenuParser(MenuParser):
+    """Меню из JSON Lines: по записи на строку, вид записи в поле type"""
+
+    def iter_records(self) -> Iterator[Record]:
+        with open(self.file_path, encoding="utf-8") as file:
+            for line, text in enumerate(file, start=1):
+                if text.strip():
+                    record = json.loads(text)
+                    yield line, record.pop("type", None), record
+
+
+# парсеры по расширению файла
+PARSERS: dict[str, type[MenuParser]] = {
+    ".xlsx": XlsxMenuParser,
+    ".csv": CsvMenuParser,
+    ".jsonl": JsonLinesMenuParser,
+}
+
+
+def get_parser(file_path) -> MenuParser:
+    suffix = Path(file_path).suffix.lower()
+    if suffix not in PARSERS:
+        raise ValueError(f"unsupported menu file format: {suffix}")
+    return PARSERS[suffix](file_path)
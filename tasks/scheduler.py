@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections.abc import AsyncGenerator, AsyncIterator, Awaitable, Callable
+from typing import Any
+
+import redis.asyncio as redis
+from redis.exceptions import WatchError
+from watchfiles import awatch
+
+from tasks.import_state import file_stat
+
+# как часто опрашивать файл, если изменения не приходят от inotify, сек
+IMPORT_POLL_INTERVAL = float(os.getenv("IMPORT_POLL_INTERVAL", 1))
+# опрашивать файл вместо inotify (тома, где inotify не работает)
+IMPORT_FORCE_POLLING = os.getenv("IMPORT_FORCE_POLLING", "false") == "true"
+# сколько файл должен не меняться перед загрузкой, сек
+IMPORT_DEBOUNCE = float(os.getenv("IMPORT_DEBOUNCE", 2))
+# наименьший промежуток между началами загрузок, сек
+IMPORT_MIN_INTERVAL = float(os.getenv("IMPORT_MIN_INTERVAL", 15))
+# время жизни блокировки, пока она взята, оно продлевается, сек
+IMPORT_LOCK_TTL = int(os.getenv("IMPORT_LOCK_TTL", 60))
+
+
+def current_stat(file_path: str) -> str | None:
+    try:
+        return file_stat(file_path)
+    except FileNotFoundError:
+        return None
+
+
+async def poll_changes(
+    file_path: str,
+    interval: float = IMPORT_POLL_INTERVAL,
+) -> AsyncIterator[None]:
+    """Изменения файла, найденные сравнением stat"""
+    last_stat = current_stat(file_path)
+    while True:
+        await asyncio.sleep(interval)
+        stat = current_stat(file_path)
+        if stat != last_stat:
+            last_stat = stat
+            yield
+
+
+async def inotify_changes(file_path: str) -> AsyncIterator[None]:
+    """Изменения файла от inotify.
+
+    Следим за папкой: редакторы часто сохраняют файл заменой, и слежка за
+    самим файлом на этом обрывается.
+    """
+    target = os.path.abspath(file_path)
+    async for changes in awatch(os.path.dirname(target)):
+        if any(os.path.abspath(path) == target for _, path in changes):
+            yield
+
+
+async def file_changes(
+    file_path: str,
+    poll_interval: float = IMPORT_POLL_INTERVAL,
+) -> AsyncGenerator[None, None]:
+    """Изменения файла от inotify, без него - опросом stat.
+
+    Если inotify недоступен (том без inotify, исчерпан лимит наблюдений),
+    наблюдение продолжается опросом.
+    """
+    if not IMPORT_FORCE_POLLING:
+        try:
+            async for _ in inotify_changes(file_path):
+                yield
+            return
+        except (OSError, RuntimeError) as error:
+            logging.warning(f"inotify failed for {file_path}, polling: {error!r}")
+        # изменение могло прийти, пока inotify отказывал
+        yield
+    async for _ in poll_changes(file_path, poll_interval):
+        yield
+
+
+async def settle(file_path: str, debounce: float = IMPORT_DEBOUNCE) -> str | None:
+    """Ждет, пока файл debounce сек не меняется, возвращает его stat"""
+    stat = current_stat(file_path)
+    while True:
+        await asyncio.sleep(debounce)
+        settled, stat = stat, current_stat(file_path)
+        if stat == settled:
+            return stat
+
+
+class SyncLock:
+    """Блокировка Redis, общая для всех воркеров.
+
+    Пока блокировка взята, ее время жизни продлевается, поэтому долгая
+    загрузка ее не теряет, а блокировка упавшего процесса истекает за ttl.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        key: str,
+        ttl: int = IMPORT_LOCK_TTL,
+    ) -> None:
+        self.redis_client = redis_client
+        self.key = key
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+        self.renewal: asyncio.Task | None = None
+
+    async def acquire(self) -> bool:
+        if not await self.redis_client.set(self.key, self.token, nx=True, ex=self.ttl):
+            return False
+        self.renewal = asyncio.create_task(self.renew())
+        return True
+
+    async def release(self) -> None:
+        if self.renewal is None:
+            return
+        self.renewal.cancel()
+        self.renewal = None
+        await self.if_owned(lambda pipe: pipe.unlink(self.key))
+
+    async def renew(self) -> None:
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            if not await self.if_owned(lambda pipe: pipe.expire(self.key, self.ttl)):
+                logging.error(f"lock {self.key} lost")
+                return
+
+    async def if_owned(self, command: Callable[[Any], Any]) -> bool:
+        """Команда над ключом блокировки, только если она еще наша"""
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(self.key)
+                if await pipe.get(self.key) != self.token.encode():
+                    return False
+                pipe.multi()
+                command(pipe)
+                await pipe.execute()
+                return True
+            except WatchError:
+                # блокировка истекла и перехвачена другим процессом
+                return False
+
+    async def __aenter__(self) -> bool:
+        return await self.acquire()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.release()
+
+
+def sync_lock(redis_client: redis.Redis, file_path: str) -> SyncLock:
+    return SyncLock(redis_client, f"import:lock:{file_path}")
+
+
+def watch_lock(redis_client: redis.Redis, file_path: str) -> SyncLock:
+    return SyncLock(redis_client, f"import:watch:{file_path}")
+
+
+class SyncScheduler:
+    """Загрузка файла меню при его изменении.
+
+    Изменения приходят от inotify (watchfiles) или опросом stat. Загрузка
+    начинается, когда файл debounce сек не меняется, не раньше min_interval
+    сек после начала прошлой и только под блокировкой Redis: если загрузку
+    ведет другой процесс, файл проверяется снова после нее. Загрузка с
+    ошибкой повторяется через min_interval.
+    """
+
+    def __init__(
+        self,
+        file_path: str,
+        sync: Callable[[], Awaitable[Any]],
+        lock: SyncLock,
+        debounce: float = IMPORT_DEBOUNCE,
+        min_interval: float = IMPORT_MIN_INTERVAL,
+        poll_interval: float = IMPORT_POLL_INTERVAL,
+    ) -> None:
+        self.file_path = file_path
+        self.sync = sync
+        self.lock = lock
+        self.debounce = debounce
+        self.min_interval = min_interval
+        self.poll_interval = poll_interval
+        self.pending = asyncio.Event()
+        self.started_at: float | None = None
+
+    async def watch(self) -> None:
+        async for _ in file_changes(self.file_path, self.poll_interval):
+            self.pending.set()
+
+    async def run(self) -> None:
+        """Загрузки до отмены, первая - сразу после запуска"""
+        watcher = asyncio.create_task(self.watch())
+        # файл мог измениться, пока за ним никто не следил
+        self.pending.set()
+        try:
+            while True:
+                await self.pending.wait()
+                if self.started_at is not None:
+                    await asyncio.sleep(
+                        self.started_at + self.min_interval - time.monotonic()
+                    )
+                # изменения за время ожидания покрывает settle ниже
+                self.pending.clear()
+                if await settle(self.file_path, self.debounce) is None:
+                    logging.warning(f"menu file {self.file_path} not found")
+                    continue
+                self.started_at = time.monotonic()
+                await self.run_once()
+        finally:
+            watcher.cancel()
+
+    async def run_once(self) -> None:
+        try:
+            async with self.lock as acquired:
+                if acquired:
+                    await self.sync()
+                    return
+        except Exception as error:
+            logging.error(error)
+        self.pending.set()
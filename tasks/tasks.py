@@ -1,6 +1,6 @@
 import asyncio
-import logging
 import os
+import uuid
 
 from celery import Celery
 from dotenv import load_dotenv
@@ -9,7 +9,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from core.models import db_helper
 from core.redis.redis_helper import REDIS_URL, get_async_redis_client
 from tasks.db_updater import DatabaseUpdater
-from tasks.parser import MenuParser
+from tasks.import_state import ImportState, file_digest, file_stat
+from tasks.parser import get_parser
+from tasks.scheduler import SyncScheduler, sync_lock, watch_lock
 
 load_dotenv()
 
@@ -18,7 +20,8 @@ RABBITMQ_DEFAULT_PASS = os.getenv("RABBITMQ_DEFAULT_PASS")
 RABBITMQ_DEFAULT_PORT = os.getenv("RABBITMQ_DEFAULT_PORT")
 RABBITMQ_HOST = os.getenv("RABBITMQ_HOST")
 
-CELERY_STATUS = os.getenv("CELERY_STATUS")
+# пропускать загрузку неизменившегося файла и неизменившихся веток меню
+IMPORT_CHANGE_DETECTION = os.getenv("IMPORT_CHANGE_DETECTION", "true") == "true"
 
 
 celery = Celery(
@@ -30,30 +33,80 @@ celery = Celery(
     backend=REDIS_URL,
 )
 
-FILE_PATH = "/menu_app_FastApi/admin/Menu.xlsx"
+# файл меню админки, формат (xlsx, csv или jsonl) выбирается по расширению
+FILE_PATH = os.getenv("MENU_FILE_PATH", "/menu_app_FastApi/admin/Menu.xlsx")
 
 
-async def update_db_async(session: AsyncSession):
-    menu_parser = MenuParser(FILE_PATH)
-    menu_data = menu_parser.parse()
+async def update_db_async(
+    session: AsyncSession,
+    file_path: str = FILE_PATH,
+) -> set[uuid.UUID]:
+    """Загрузка файла в БД, возвращает измененные меню.
 
+    Если файл не менялся с прошлой загрузки, он даже не читается, а ветки
+    меню, не изменившиеся в файле, не сравниваются с БД и не переписываются.
+    """
     redis_client = await get_async_redis_client()
-    loader = DatabaseUpdater(menu_data, session=session, redis_client=redis_client)
+    state = ImportState(redis_client, file_path)
+    if IMPORT_CHANGE_DETECTION:
+        await state.load()
+    stat = file_stat(file_path)
+    if stat == state.stat:
+        return set()
+    digest = file_digest(file_path)
+    if digest == state.digest:
+        await state.save(stat, digest, state.branches)
+        return set()
+
+    menu_parser = get_parser(file_path)
+    menu_data = menu_parser.iter_menus()
+    loader = DatabaseUpdater(
+        menu_data,
+        session=session,
+        redis_client=redis_client,
+        applied_branches=state.branches,
+    )
     await loader.add_menu_items(menu_data)
-    del menu_parser
+    await state.save(stat, digest, loader.branch_hashes)
+    return loader.changed_menu_ids
 
 
-@celery.task(
-    default_retry_delay=15,
-    max_retries=None,
-)
-def update_db():
+async def update_file_async(file_path: str) -> None:
+    async with db_helper.session_factory() as session:
+        await update_db_async(session, file_path)
+
+
+async def sync_file_async(file_path: str = FILE_PATH) -> bool:
+    """Загрузка файла под блокировкой, False - если загрузку ведет другой воркер"""
+    redis_client = await get_async_redis_client()
     try:
-        session = db_helper.get_scoped_session()
-        asyncio.get_event_loop().run_until_complete(update_db_async(session))
+        async with sync_lock(redis_client, file_path) as acquired:
+            if acquired:
+                await update_file_async(file_path)
+            return acquired
+    finally:
+        await redis_client.aclose()
 
-    except Exception as error:
-        logging.error(error)
-        raise error
+
+async def watch_file_async(file_path: str = FILE_PATH) -> bool:
+    """Загрузка файла при его изменениях, один наблюдатель на все процессы"""
+    redis_client = await get_async_redis_client()
+    try:
+        async with watch_lock(redis_client, file_path) as acquired:
+            if not acquired:
+                return False
+            scheduler = SyncScheduler(
+                file_path,
+                sync=lambda: update_file_async(file_path),
+                lock=sync_lock(redis_client, file_path),
+            )
+            await scheduler.run()
+            return True
     finally:
-        update_db.retry()
+        await redis_client.aclose()
+
+
+@celery.task
+def update_db():
+    """Разовая загрузка файла меню"""
+    asyncio.get_event_loop().run_until_complete(sync_file_async())
@@ -0,0 +1,10 @@
+import asyncio
+import logging
+
+from tasks.tasks import FILE_PATH, watch_file_async
+
+if __name__ == "__main__":
+    # наблюдатель работает отдельным процессом и не занимает воркер Celery
+    logging.basicConfig(level=logging.INFO)
+    if not asyncio.run(watch_file_async()):
+        logging.warning(f"menu file {FILE_PATH} is already watched")
@@ -0,0 +1,813 @@
+import asyncio
+import json
+import time
+import uuid
+from collections.abc import AsyncGenerator
+from decimal import Decimal
+
+import pytest
+from httpx import AsyncClient
+from redis.exceptions import ConnectionError
+
+from api_v1.dishes.views import create_dish, get_dish_by_id, get_dishes
+from api_v1.menus.views import (
+    create_menu,
+    delete_menu,
+    get_all_base,
+    get_menu_by_id,
+    get_menus,
+    update_menu_partial,
+)
+from api_v1.submenus.views import (
+    create_submenu,
+    get_submenu_bu_id,
+    get_submenus,
+    update_submenu_partial,
+)
+from core.models import Dish, db_helper
+from core.redis.cache_repository import (
+    ALL_BASE_KEY,
+    MENUS_KEY,
+    CacheRepository,
+    generation_key,
+    menu_tag,
+    refreshes,
+    submenu_tag,
+)
+from core.redis.local_cache import handle_invalidation, local_cache
+from core.redis.maintenance import KeyspaceMaintenance
+from core.redis.redis_helper import (
+    GlobalConfig,
+    get_async_redis_client,
+    redis_helper,
+)
+from core.redis.serializers import etag_of, variant_etag
+from core.redis.write_behind import WriteBatch, write_behind
+from tests.conftest import async_client
+from tests.dishes.fixtures import test_add_two_dishes
+from tests.menus.fixtures import test_add_and_get_one_menu
+from tests.service import reverse
+from tests.submenus.fixtures import test_add_and_get_one_submenu
+
+
+@pytest.fixture
+async def cache_repo() -> AsyncGenerator[CacheRepository, None]:
+    repo = CacheRepository(await get_async_redis_client())
+    yield repo
+    await repo.cacher.close()
+
+
+@pytest.fixture
+async def running_write_behind(
+    monkeypatch: pytest.MonkeyPatch,
+) -> AsyncGenerator[None, None]:
+    """Очередь записей в кэш, как в приложении: httpx не запускает lifespan"""
+    monkeypatch.setattr(GlobalConfig, "cache_write_behind", True)
+    write_behind.start()
+    yield
+    await write_behind.stop(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_invalidate_menu_by_tag(cache_repo: CacheRepository) -> None:
+    menu_id, other_menu_id, submenu_id = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+    menu_keys = [
+        f"/menus/{menu_id}/",
+        f"/menus/{menu_id}/submenus/",
+        f"/menus/{menu_id}/submenus/{submenu_id}/dishes/",
+    ]
+    other_key = f"/menus/{other_menu_id}/"
+    for key in menu_keys:
+        await cache_repo.set_entry(
+            key, b"1", menu_tag(menu_id), submenu_tag(menu_id, submenu_id)
+        )
+    await cache_repo.set_entry(other_key, b"1", menu_tag(other_menu_id))
+    await cache_repo.cacher.set(MENUS_KEY, b"1")
+    await cache_repo.cacher.set(ALL_BASE_KEY, b"1")
+
+    await cache_repo.invalidate_menu(menu_id)
+
+    assert (
+        await cache_repo.cacher.exists(*menu_keys, MENUS_KEY, ALL_BASE_KEY) == 0
+    ), "Ключи меню не удалены из кэша"
+    assert not await cache_repo.cacher.exists(
+        menu_tag(menu_id)
+    ), "Множество тегов меню не удалено"
+    assert await cache_repo.cacher.exists(other_key), "Удален ключ другого меню"
+
+
+@pytest.mark.asyncio
+async def test_delete_dish_invalidates_menu(cache_repo: CacheRepository) -> None:
+    menu_id, submenu_id = uuid.uuid4(), uuid.uuid4()
+    dishes_key = f"/menus/{menu_id}/submenus/{submenu_id}/dishes/"
+    await cache_repo.cacher.set(f"/menus/{menu_id}/", b"1")
+    await cache_repo.set_entry(
+        dishes_key, b"1", menu_tag(menu_id), submenu_tag(menu_id, submenu_id)
+    )
+
+    await cache_repo.delete_dish_from_cache(menu_id=menu_id, submenu_id=submenu_id)
+
+    assert (
+        await cache_repo.cacher.exists(f"/menus/{menu_id}/", dishes_key) == 0
+    ), "Кэш меню не инвалидирован после удаления блюда"
+
+
+@pytest.mark.asyncio
+async def test_get_dish_discounts_batched(cache_repo: CacheRepository) -> None:
+    dish_ids = [uuid.uuid4() for _ in range(3)]
+    await cache_repo.set_discount_to_cache(dish_ids[0], 0.25)
+
+    discounts = await cache_repo.get_dish_discounts_from_cache(dish_ids)
+
+    assert discounts == {
+        dish_ids[0]: 0.25,
+        dish_ids[1]: 0.0,
+        dish_ids[2]: 0.0,
+    }, "Скидки не соответствуют ожидаемым"
+
+
+@pytest.mark.asyncio
+async def test_entry_of_other_format_is_miss(cache_repo: CacheRepository) -> None:
+    legacy_key, old_version_key = f"/menus/{uuid.uuid4()}/", f"/menus/{uuid.uuid4()}/"
+    await cache_repo.cacher.set(legacy_key, b"\x80\x04pickled")
+    await cache_repo.cacher.hset(old_version_key, mapping={"v": b"0", "body": b"[]"})
+
+    assert await cache_repo.get_entry(legacy_key) is None, "Запись pickle не промах"
+    assert (
+        await cache_repo.get_entry(old_version_key) is None
+    ), "Запись старой версии не промах"
+
+    await cache_repo.set_entry(legacy_key, b"[]")
+    assert await cache_repo.get_entry(legacy_key) == b"[]", "Запись не обновлена"
+
+
+@pytest.mark.asyncio
+async def test_raw_cached_response_is_identical(
+    test_add_and_get_one_menu,
+    test_add_and_get_one_submenu,
+    cache_repo: CacheRepository,
+    async_client: AsyncClient,
+) -> None:
+    session = db_helper.get_scoped_session()
+    session.add(
+        Dish(
+            title="DISH1",
+            description="DISH1 DISH1",
+            price=Decimal("20.40"),
+            dish_discount=Decimal("0.00"),
+            submenu_id=test_add_and_get_one_submenu[0][0].id,
+        )
+    )
+    await session.commit()
+    await session.close()
+    await cache_repo.delete_all_base_cache()
+    assert GlobalConfig.cache_raw_response, "Режим готовых ответов выключен"
+
+    from_db = await async_client.get(reverse(get_all_base))
+    assert await cache_repo.get_all_base_cache() is not None, "Ответ не закэширован"
+    from_cache = await async_client.get(reverse(get_all_base))
+
+    assert from_cache.status_code == 200, "Статус ответа не 200"
+    assert from_cache.content == from_db.content, "Тело ответа из кэша отличается"
+    assert (
+        from_cache.headers["content-type"] == from_db.headers["content-type"]
+    ), "Тип ответа из кэша отличается"
+
+
+@pytest.mark.asyncio
+async def test_local_cache_until_invalidated(cache_repo: CacheRepository) -> None:
+    key = f"/menus/{uuid.uuid4()}/"
+    await cache_repo.set_entry(key, b"[]")
+    # удаление в обход инвалидации не видно кэшу в памяти
+    await cache_repo.cacher.unlink(key)
+    assert await cache_repo.get_entry(key) == b"[]", "Запись не из кэша в памяти"
+
+    await cache_repo.invalidate(keys=[key])
+
+    assert await cache_repo.get_entry(key) is None, "Запись не удалена из памяти"
+
+
+@pytest.mark.asyncio
+async def test_invalidation_is_published(cache_repo: CacheRepository) -> None:
+    menu_id = uuid.uuid4()
+    menu_key = f"/menus/{menu_id}/"
+    await cache_repo.set_entry(menu_key, b"{}", menu_tag(menu_id))
+
+    async with cache_repo.cacher.pubsub() as pubsub:
+        await pubsub.subscribe(GlobalConfig.cache_invalidation_channel)
+        await pubsub.get_message(timeout=1.0)
+        await cache_repo.invalidate_menu(menu_id)
+        message = await pubsub.get_message(timeout=1.0)
+
+    assert message is not None, "Сообщение об инвалидации не отправлено"
+    assert menu_key in json.loads(message["data"])["keys"], "Ключ меню не разослан"
+
+    # сообщение другого воркера чистит кэш в памяти этого процесса
+    local_cache.set(menu_key, b"{}")
+    handle_invalidation(json.dumps({"sender": "other", "keys": [menu_key]}))
+    assert local_cache.get(menu_key) is None, "Запись не удалена по сообщению"
+
+
+@pytest.mark.asyncio
+async def test_recompute_is_single_flight(cache_repo: CacheRepository) -> None:
+    key = f"/menus/{uuid.uuid4()}/"
+    loads = 0
+
+    async def load() -> bytes:
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.05)
+        return b"[]"
+
+    results = await asyncio.gather(
+        *(cache_repo.recompute(key, load) for _ in range(10))
+    )
+
+    assert loads == 1, "Значение пересчитано несколько раз"
+    assert results == [b"[]"] * 10, "Ожидающие получили другой результат"
+
+
+@pytest.mark.asyncio
+async def test_recompute_shares_error(cache_repo: CacheRepository) -> None:
+    key = f"/menus/{uuid.uuid4()}/"
+
+    async def load() -> bytes:
+        await asyncio.sleep(0.05)
+        raise LookupError(key)
+
+    results = await asyncio.gather(
+        *(cache_repo.recompute(key, load) for _ in range(3)),
+        return_exceptions=True,
+    )
+
+    assert all(
+        isinstance(result, LookupError) for result in results
+    ), "Ожидающие не получили ошибку пересчета"
+
+
+@pytest.mark.asyncio
+async def test_fill_lock_across_workers(
+    cache_repo: CacheRepository,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(GlobalConfig, "cache_fill_lock", True)
+    key = f"/menus/{uuid.uuid4()}/"
+    loads = 0
+
+    async def load() -> bytes:
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.1)
+        # запись в кэш снимает блокировку
+        await cache_repo.set_entry(key, b"[]")
+        return b"[]"
+
+    # recompute_locked минует single flight процесса, как другой воркер
+    results = await asyncio.gather(
+        *(cache_repo.recompute_locked(key, load) for _ in range(3))
+    )
+
+    assert loads == 1, "Значение пересчитано несколькими воркерами"
+    assert results == [b"[]"] * 3, "Воркеры получили другой результат"
+    assert not await cache_repo.cacher.exists(f"lock:{key}"), "Блокировка не снята"
+
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate(
+    cache_repo: CacheRepository,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(GlobalConfig, "cache_stale_while_revalidate", True)
+    menu_id = uuid.uuid4()
+    menu_key = f"/menus/{menu_id}/"
+    submenus_key = f"/menus/{menu_id}/submenus/"
+    await cache_repo.set_entry(menu_key, b"{}", menu_tag(menu_id))
+    await cache_repo.set_entry(submenus_key, b"old", menu_tag(menu_id))
+    loads = 0
+
+    async def load(session, background_tasks) -> bytes:
+        nonlocal loads
+        loads += 1
+        background_tasks.add_task(
+            cache_repo.set_entry, submenus_key, b"new", menu_tag(menu_id)
+        )
+        return b"new"
+
+    await cache_repo.invalidate_menu(menu_id)
+
+    assert await cache_repo.read_entry(submenus_key) == (
+        b"old",
+        True,
+    ), "Список подменю удален, а не помечен устаревшим"
+    assert not await cache_repo.cacher.exists(menu_key), "Объект меню не удален"
+    assert (
+        0 < await cache_repo.cacher.ttl(submenus_key) <= 30
+    ), "Не задан срок жизни устаревшей записи"
+
+    async with db_helper.session_factory() as session:
+        bodies = [
+            await cache_repo.fetch(submenus_key, load, session, WriteBatch())
+            for _ in range(3)
+        ]
+    await asyncio.gather(*refreshes.values())
+
+    assert bodies == [b"old"] * 3, "Устаревшая запись не отдана сразу"
+    assert loads == 1, "Запись обновлена несколько раз"
+    assert await cache_repo.read_entry(submenus_key) == (
+        b"new",
+        False,
+    ), "Запись не обновлена в фоне"
+    assert (
+        await cache_repo.cacher.ttl(submenus_key) > GlobalConfig.cache_stale_ttl_lists
+    ), "Обновленная запись истекает как устаревшая"
+
+
+@pytest.mark.usefixtures("test_add_and_get_one_menu")
+async def test_detail_reads_served_from_cache(
+    test_add_and_get_one_submenu,
+    test_add_two_dishes,
+    cache_repo: CacheRepository,
+    sql_statements: list[str],
+    async_client: AsyncClient,
+) -> None:
+    submenu = test_add_and_get_one_submenu[0][0]
+    dish = test_add_two_dishes[0][0]
+    await cache_repo.set_discount_to_cache(dish.id, 0.25)
+    urls = [
+        reverse(get_menu_by_id, menu_id=submenu.menu_id),
+        reverse(get_submenu_bu_id, menu_id=submenu.menu_id, submenu_id=submenu.id),
+        reverse(
+            get_dish_by_id,
+            menu_id=submenu.menu_id,
+            submenu_id=submenu.id,
+            dish_id=dish.id,
+        ),
+    ]
+    for url in urls:
+        await async_client.get(url)
+    sql_statements.clear()
+
+    responses = await asyncio.gather(
+        *(async_client.get(url) for _ in range(50) for url in urls)
+    )
+
+    assert all(
+        response.status_code == 200 for response in responses
+    ), "Статус ответа не 200"
+    assert not sql_statements, "Чтение по id из прогретого кэша обращается к БД"
+    menu, submenu_json, dish_json = (response.json() for response in responses[:3])
+    assert (menu["submenus_count"], menu["dishes_count"]) == (
+        1,
+        2,
+    ), "Количество подменю и блюд в меню из кэша неверно"
+    assert submenu_json["dishes_count"] == 2, "Количество блюд в подменю неверно"
+    assert Decimal(dish_json["price"]) == Decimal(
+        "8.16"
+    ), "Цена блюда из кэша без скидки"
+
+
+@pytest.mark.asyncio
+async def test_list_pages_invalidated(cache_repo: CacheRepository) -> None:
+    menu_id = uuid.uuid4()
+    for cursor in (None, "next"):
+        await cache_repo.set_list_submenus_cache(menu_id, b"[]", limit=2, cursor=cursor)
+        await cache_repo.set_list_menus_cache(b"[]", limit=2, cursor=cursor)
+
+    await cache_repo.delete_all_submenus_from_cache(menu_id)
+
+    for cursor in (None, "next"):
+        assert (
+            await cache_repo.get_list_submenus_cache(menu_id, limit=2, cursor=cursor)
+            is None
+        ), "Страница подменю не удалена"
+        assert (
+            await cache_repo.get_list_menus_cache(limit=2, cursor=cursor) == b"[]"
+        ), "Удалена страница другого списка"
+
+    await cache_repo.invalidate_menu(menu_id)
+
+    assert (
+        await cache_repo.get_list_menus_cache(limit=2, cursor="next") is None
+    ), "Страница меню не удалена"
+
+
+@pytest.mark.usefixtures("test_add_and_get_one_submenu")
+async def test_etag_not_modified(
+    cache_repo: CacheRepository,
+    async_client: AsyncClient,
+) -> None:
+    await cache_repo.delete_all_base_cache()
+    url = reverse(get_all_base)
+
+    response = await async_client.get(url)
+    etag = response.headers["etag"]
+    assert etag == etag_of(response.content), "ETag не соответствует телу ответа"
+    assert (await cache_repo.get_variant(ALL_BASE_KEY))[
+        0
+    ] == etag, "ETag не сохранен в кэше"
+
+    not_modified = await async_client.get(url, headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304, "Статус ответа не 304"
+    assert not_modified.content == b"", "Ответ 304 с телом"
+    assert not_modified.headers["etag"] == etag, "Ответ 304 без ETag"
+
+    await cache_repo.delete_all_base_cache()
+    changed = await async_client.get(
+        url, headers={"If-None-Match": f'W/{etag}, "other"'}
+    )
+    assert changed.status_code == 200, "После инвалидации ответ не 200"
+
+
+@pytest.mark.usefixtures("test_add_and_get_one_submenu")
+async def test_precompressed_variants(
+    cache_repo: CacheRepository,
+    async_client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(GlobalConfig, "cache_precompress", True)
+    monkeypatch.setattr(GlobalConfig, "cache_precompress_min_size", 0)
+    await cache_repo.delete_all_base_cache()
+    url = reverse(get_all_base)
+
+    identity = await async_client.get(url, headers={"Accept-Encoding": "identity"})
+    etag, variant = await cache_repo.get_variant(ALL_BASE_KEY, "gzip")
+    assert etag is not None, "Запись не сохранена в кэше"
+    assert variant is not None, "Сжатый вариант не сохранен в кэше"
+
+    preferred = await async_client.get(url, headers={"Accept-Encoding": "gzip, br"})
+    assert preferred.headers["content-encoding"] == "br", "Ответ не сжат brotli"
+    assert preferred.content == identity.content, "Вариант br не совпадает с телом"
+    assert preferred.headers["etag"] == variant_etag(
+        etag, "br"
+    ), "ETag варианта br не отличается"
+
+    compressed = await async_client.get(
+        url, headers={"Accept-Encoding": "br;q=0, gzip"}
+    )
+    assert compressed.headers["content-encoding"] == "gzip", "Ответ не сжат"
+    assert compressed.headers["vary"] == "Accept-Encoding", "Ответ без Vary"
+    assert compressed.content == identity.content, "Вариант не совпадает с телом"
+    gzip_etag = compressed.headers["etag"]
+    assert gzip_etag == variant_etag(etag, "gzip"), "ETag варианта не отличается"
+
+    not_modified = await async_client.get(
+        url, headers={"Accept-Encoding": "gzip", "If-None-Match": gzip_etag}
+    )
+    assert not_modified.status_code == 304, "Статус ответа не 304"
+
+    plain = await async_client.get(
+        url, headers={"Accept-Encoding": "gzip;q=0", "If-None-Match": gzip_etag}
+    )
+    assert plain.status_code == 200, "ETag варианта подошел к исходному телу"
+    assert "content-encoding" not in plain.headers, "Ответ сжат без запроса"
+    assert plain.headers["etag"] == etag, "ETag исходного тела изменен"
+
+
+@pytest.mark.usefixtures("test_add_and_get_one_menu")
+async def test_tree_snapshot_patched_on_write(
+    test_add_and_get_one_submenu,
+    cache_repo: CacheRepository,
+    sql_statements: list[str],
+    async_client: AsyncClient,
+) -> None:
+    submenu = test_add_and_get_one_submenu[0][0]
+    await cache_repo.delete_all_base_cache()
+    url = reverse(get_all_base)
+    other_menu = await async_client.post(
+        reverse(create_menu),
+        json={"title": "OTHER MENU", "description": ""},
+    )
+    await async_client.get(url)
+    assert (await cache_repo.get_snapshot())[1] is not None, "Снимок не записан"
+
+    dish = await async_client.post(
+        reverse(create_dish, menu_id=submenu.menu_id, submenu_id=submenu.id),
+        json={"title": "DISH", "description": "", "price": "10.50", "dish_discount": 0},
+    )
+    assert dish.status_code == 201, "Блюдо не создано"
+    deleted = await async_client.delete(
+        reverse(delete_menu, menu_id=other_menu.json()["id"]),
+    )
+    assert deleted.status_code == 200, "Меню не удалено"
+    sql_statements.clear()
+    tree = (await async_client.get(url)).json()
+
+    assert not sql_statements, "Дерево после записи загружено из БД"
+    assert [menu["id"] for menu in tree] == [
+        str(submenu.menu_id)
+    ], "Удаленное меню осталось в дереве"
+    assert (tree[0]["submenus_count"], tree[0]["dishes_count"]) == (
+        1,
+        1,
+    ), "Ветка меню не обновлена"
+    assert tree[0]["submenus"][0]["dishes"][0]["title"] == "DISH", "Блюда нет в ветке"
+
+
+@pytest.mark.parametrize("cache_generations", [False, True])
+@pytest.mark.usefixtures("test_add_and_get_one_menu", "running_write_behind")
+async def test_no_stale_read_after_write(
+    cache_generations: bool,
+    test_add_and_get_one_submenu,
+    cache_repo: CacheRepository,
+    async_client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(GlobalConfig, "cache_generations", cache_generations)
+    submenu = test_add_and_get_one_submenu[0][0]
+    menu_url = reverse(get_menu_by_id, menu_id=submenu.menu_id)
+    submenu_url = reverse(
+        get_submenu_bu_id, menu_id=submenu.menu_id, submenu_id=submenu.id
+    )
+    urls = [menu_url, submenu_url, reverse(get_menus), reverse(get_all_base)]
+    writing = True
+
+    async def read_all_the_time() -> None:
+        while writing:
+            await asyncio.gather(*(async_client.get(url) for url in urls))
+
+    readers = [asyncio.create_task(read_all_the_time()) for _ in range(3)]
+    try:
+        for i in range(5):
+            menu_title, submenu_title = f"MENU {i}", f"SUBMENU {i}"
+            await async_client.patch(
+                reverse(update_menu_partial, menu_id=submenu.menu_id),
+                json={"title": menu_title, "description": ""},
+            )
+            await async_client.patch(
+                reverse(
+                    update_submenu_partial,
+                    menu_id=submenu.menu_id,
+                    submenu_id=submenu.id,
+                ),
+                json={"title": submenu_title, "description": ""},
+            )
+            menu, submenu_json, menus, tree = [
+                (await async_client.get(url)).json() for url in urls
+            ]
+
+            assert menu["title"] == menu_title, "Меню из кэша устарело"
+            assert submenu_json["title"] == submenu_title, "Подменю устарело"
+            assert menus[0]["title"] == menu_title, "Список меню устарел"
+            assert (tree[0]["title"], tree[0]["submenus"][0]["title"]) == (
+                menu_title,
+                submenu_title,
+            ), "Дерево меню устарело"
+    finally:
+        writing = False
+        await asyncio.gather(*readers)
+
+    if not cache_generations:
+        return
+    # записи чтений еще могут стоять в очереди
+    assert write_behind.queue is not None
+    await write_behind.queue.join()
+    counter = generation_key(f"/menus/{submenu.menu_id}/")
+    expires_in = local_cache.entries[counter][0] - time.monotonic()
+    assert (
+        expires_in <= GlobalConfig.local_cache_generation_ttl
+    ), "Поколение хранится в памяти воркера дольше LOCAL_CACHE_GENERATION_TTL"
+    assert not await cache_repo.cacher.exists(
+        menu_tag(submenu.menu_id)
+    ), "Запись зарегистрирована в тегах"
+    entry_key = await cache_repo.versioned(f"/menus/{submenu.menu_id}/")
+    assert (
+        await cache_repo.cacher.ttl(entry_key) > 0
+    ), "Запись поколения без времени жизни"
+
+
+@pytest.mark.asyncio
+async def test_tags_not_evictable(cache_repo: CacheRepository) -> None:
+    menu_id, submenu_id = uuid.uuid4(), uuid.uuid4()
+    key = f"/menus/{menu_id}/submenus/{submenu_id}/dishes/"
+    tags = (menu_tag(menu_id), submenu_tag(menu_id, submenu_id))
+    await cache_repo.set_entry(key, b"[]", *tags)
+    await cache_repo.cacher.expire(tags[0], 60)
+
+    assert await cache_repo.cacher.ttl(key) > 0, "Запись без времени жизни"
+    assert await cache_repo.cacher.ttl(tags[1]) == -1, "Тег можно вытеснить"
+
+    await KeyspaceMaintenance(cache_repo.cacher, reclaim=True).run()
+
+    assert await cache_repo.cacher.ttl(tags[0]) == -1, "Срок тега не снят"
+
+
+async def test_keyspace_bounded_under_churn(
+    cache_repo: CacheRepository,
+    async_client: AsyncClient,
+) -> None:
+    sizes = []
+    for i in range(5):
+        menu = await async_client.post(
+            reverse(create_menu),
+            json={"title": f"MENU {i}", "description": ""},
+        )
+        menu_id = menu.json()["id"]
+        submenu = await async_client.post(
+            reverse(create_submenu, menu_id=menu_id),
+            json={"title": f"SUBMENU {i}", "description": ""},
+        )
+        submenu_id = submenu.json()["id"]
+        for j in range(2):
+            await async_client.post(
+                reverse(create_dish, menu_id=menu_id, submenu_id=submenu_id),
+                json={
+                    "title": f"DISH {i} {j}",
+                    "description": "",
+                    "price": "10.50",
+                    "dish_discount": 0,
+                },
+            )
+        urls = [
+            reverse(get_menu_by_id, menu_id=menu_id),
+            reverse(get_submenus, menu_id=menu_id),
+            reverse(get_submenu_bu_id, menu_id=menu_id, submenu_id=submenu_id),
+            reverse(get_dishes, menu_id=menu_id, submenu_id=submenu_id),
+            reverse(get_menus),
+            reverse(get_all_base),
+        ]
+        for url in urls:
+            assert (await async_client.get(url)).status_code == 200, url
+        deleted = await async_client.delete(reverse(delete_menu, menu_id=menu_id))
+        assert deleted.status_code == 200, "Меню не удалено"
+        for url in urls[-2:]:
+            await async_client.get(url)
+        sizes.append(await cache_repo.cacher.dbsize())
+
+    assert len(set(sizes)) == 1, f"Ключи удаленных меню остаются в кэше: {sizes}"
+
+
+async def test_maintenance_reclaims_orphans(cache_repo: CacheRepository) -> None:
+    menu_id = uuid.uuid4()
+    entry_key = f"/menus/{menu_id}/"
+    orphans = [
+        f"/menu/{menu_id}/",
+        f"/menus/{uuid.uuid4()}/",
+        f"dish_discount_{uuid.uuid4()}",
+        f"lock:{entry_key}",
+        "tag:/menus/orphan/",
+    ]
+    await cache_repo.cacher.set(orphans[0], b"\x80\x04pickled")
+    await cache_repo.cacher.set(orphans[1], b"\x80\x04pickled")
+    await cache_repo.cacher.set(orphans[2], 0.25)
+    await cache_repo.cacher.set(orphans[3], b"token")
+    await cache_repo.cacher.sadd(orphans[4], "/menus/missing/")
+    await cache_repo.set_entry(entry_key, b"{}", menu_tag(menu_id))
+    await cache_repo.cacher.sadd(menu_tag(menu_id), "/menus/missing/")
+    await cache_repo.cacher.persist(entry_key)
+    await cache_repo.cacher.set("celery-task-meta-1", b"{}")
+
+    report = await KeyspaceMaintenance(cache_repo.cacher).run()
+    assert await cache_repo.cacher.exists(*orphans) == len(
+        orphans
+    ), "Отчет удалил ключи"
+    stats = report.stats()
+    for family in ("legacy", "entries", "discounts", "locks", "tags"):
+        assert stats[family]["orphans"] >= 1, f"Сироты {family} не найдены"
+    assert stats["other"]["orphans"] == 0, "Чужие ключи посчитаны сиротами"
+
+    await KeyspaceMaintenance(cache_repo.cacher, reclaim=True).run()
+
+    assert not await cache_repo.cacher.exists(*orphans), "Сироты не удалены"
+    assert await cache_repo.get_entry(entry_key) == b"{}", "Удалена живая запись"
+    assert await cache_repo.cacher.ttl(entry_key) > 0, "Записи не назначен срок"
+    assert await cache_repo.cacher.smembers(menu_tag(menu_id)) == {
+        entry_key.encode()
+    }, "Отсутствующий ключ не удален из тега"
+    assert await cache_repo.cacher.exists("celery-task-meta-1"), "Удален чужой ключ"
+
+
+@pytest.mark.usefixtures("test_add_and_get_one_menu")
+async def test_write_behind_queue_drained_on_stop(
+    cache_repo: CacheRepository,
+    async_client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(GlobalConfig, "cache_write_behind", True)
+    monkeypatch.setattr(write_behind, "retry_delay", 0)
+    await cache_repo.delete_all_menus_from_cache()
+    calls: list[str] = []
+
+    async def flaky() -> None:
+        calls.append("flaky")
+        if calls.count("flaky") == 1:
+            raise ConnectionError("connection reset")
+
+    async def broken() -> None:
+        raise LookupError("broken")
+
+    async def after() -> None:
+        calls.append("after")
+
+    batch = WriteBatch()
+    for func in (flaky, broken, after):
+        batch.add_task(func)
+    before = write_behind.stats()
+
+    write_behind.start()
+    try:
+        response = await async_client.get(reverse(get_menus), params={"limit": 2})
+        assert response.status_code == 200, "Статус ответа не 200"
+        await write_behind.submit(batch)
+    finally:
+        await write_behind.stop(timeout=5)
+
+    stats = write_behind.stats()
+    assert not stats["running"] and stats["depth"] == 0, "Очередь не дописана"
+    assert (
+        await cache_repo.get_list_menus_cache(limit=2, cursor=None) is not None
+    ), "Список меню не записан в кэш через очередь"
+    assert calls == ["flaky", "flaky", "after"], "Записи запроса нарушены ошибкой"
+    assert stats["flushed"] - before["flushed"] == 2, "Не все запросы записаны"
+    assert stats["retried"] - before["retried"] == 1, "Ошибка Redis не повторена"
+    assert stats["failed"] - before["failed"] == 1, "Ошибка записи не посчитана"
+
+
+@pytest.mark.usefixtures("test_add_and_get_one_menu", "running_write_behind")
+async def test_write_behind_read_after_write(
+    test_add_and_get_one_submenu,
+    async_client: AsyncClient,
+) -> None:
+    menu_id = test_add_and_get_one_submenu[0][0].menu_id
+    urls = [reverse(get_menu_by_id, menu_id=menu_id), reverse(get_menus)]
+
+    for i in range(5):
+        # заполнение кэша чтением стоит в очереди перед инвалидацией
+        await asyncio.gather(*(async_client.get(url) for url in urls))
+        response = await async_client.patch(
+            reverse(update_menu_partial, menu_id=menu_id),
+            json={"title": f"MENU {i}", "description": ""},
+        )
+        assert response.status_code == 200, "Статус ответа не 200"
+        menu, menus = [(await async_client.get(url)).json() for url in urls]
+
+        assert menu["title"] == f"MENU {i}", "Меню из кэша устарело"
+        assert menus[0]["title"] == f"MENU {i}", "Список меню устарел"
+
+
+@pytest.mark.usefixtures("running_write_behind")
+async def test_write_behind_merges_fills(cache_repo: CacheRepository) -> None:
+    keys = [f"/menus/{uuid.uuid4()}/" for _ in range(4)]
+    found: list[int] = []
+
+    async def invalidate() -> None:
+        found.append(await cache_repo.cacher.exists(*keys))
+
+    batches = []
+    for i, key in enumerate(keys):
+        if i == 2:
+            batches.append(WriteBatch(changes_data=True))
+            batches[-1].add_task(invalidate)
+        batches.append(WriteBatch())
+        batches[-1].add_task(cache_repo.set_entry, key, b"{}")
+    before = write_behind.stats()
+
+    # очередь не получает управление, пока все запросы не поставлены
+    for batch in batches:
+        await write_behind.submit(batch)
+    assert write_behind.queue is not None
+    await write_behind.queue.join()
+
+    stats = write_behind.stats()
+    assert found == [2], "Инвалидация выполнена не после ранних заполнений"
+    assert stats["merged"] - before["merged"] == 4, "Заполнения не собраны вместе"
+    assert stats["flushes"] - before["flushes"] == 1, "Запросы записаны не одной пачкой"
+    assert await cache_repo.cacher.exists(*keys) == 4, "Заполнения не записаны"
+
+
+@pytest.mark.usefixtures("test_add_and_get_one_menu")
+async def test_inline_cache_write_error_logged(
+    test_add_and_get_one_menu,
+    async_client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    menu_id = test_add_and_get_one_menu[0][0].id
+
+    async def unavailable(*args, **kwargs) -> None:
+        raise ConnectionError("connection refused")
+
+    monkeypatch.setattr(CacheRepository, "update_menu_cache", unavailable)
+    response = await async_client.patch(
+        reverse(update_menu_partial, menu_id=menu_id),
+        json={"title": "MENU NEW", "description": ""},
+    )
+
+    assert response.status_code == 200, "Ошибка Redis после записи в БД вернула 500"
+    assert response.json()["title"] == "MENU NEW", "Меню не обновлено"
+
+
+@pytest.mark.asyncio
+async def test_redis_pool_stats() -> None:
+    client = redis_helper.get_client()
+    await client.ping()
+    acquired = redis_helper.stats()["acquired"]
+    async with client.pipeline() as pipe:
+        # WATCH закрепляет соединение за pipeline до его сброса
+        await pipe.watch("pool:stats")
+        stats = redis_helper.stats()
+        assert stats["in_use"] == 1, "Занятое соединение не учтено"
+        assert stats["idle"] == 0, "Занятое соединение учтено как свободное"
+
+    stats = redis_helper.stats()
+    assert stats["in_use"] == 0, "Соединение не возвращено в пул"
+    assert stats["idle"] == 1, "Свободное соединение не учтено"
+    assert stats["acquired"] == acquired + 1, "Число выдач соединения не соответствует"
@@ -2,9 +2,13 @@ from typing import AsyncGenerator
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from core.models.db_helper import db_helper
+from core.redis.cache_repository import CacheRepository
+from core.redis.local_cache import local_cache
+from core.redis.redis_helper import redis_helper
 from main import app
 
 
@@ -15,6 +19,38 @@ async def prepare_database() -> None:
         await db_helper.create_all(conn)
 
 
+@pytest.fixture(scope="function", autouse=True)
+async def drop_tree_snapshot() -> None:
+    # фикстуры пишут в БД напрямую, мимо обновления веток снимка дерева
+    await CacheRepository(redis_helper.get_client()).delete_snapshot()
+
+
+@pytest.fixture(scope="function", autouse=True)
+async def reset_redis_pool() -> AsyncGenerator[None, None]:
+    # у каждого теста свой event loop, соединения пула к нему привязаны
+    yield
+    await redis_helper.disconnect()
+
+
+@pytest.fixture(scope="function", autouse=True)
+def clear_local_cache() -> None:
+    # база пересоздается для каждого теста, записи в памяти процесса тоже
+    local_cache.clear()
+
+
+@pytest.fixture
+def sql_statements() -> list[str]:
+    """Запросы, отправленные в БД во время теста"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany) -> None:
+        statements.append(statement)
+
+    event.listen(db_helper.engine.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(db_helper.engine.sync_engine, "before_cursor_execute", record)
+
+
 async def override_scoped_session_dependency() -> AsyncSession:
     session = db_helper.get_scoped_session()
     try:
@@ -1,10 +1,15 @@
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import insert
 
+from api_v1.menus import crud
 from api_v1.menus.schemas import Menu
 from api_v1.menus.views import get_menu_by_id
 from api_v1.submenus.schemas import Submenu
 from api_v1.submenus.views import get_submenu_bu_id
+from core.models import Menu as MenuModel
+from core.models import Submenu as SubmenuModel
+from core.models import db_helper
 from tests.dishes.fixtures import test_add_two_dishes
 from tests.menus.fixtures import test_add_and_get_one_menu, test_get_one_menu_by_id
 from tests.service import reverse
@@ -73,3 +78,53 @@ async def test_get_submenu_by_id(
     assert response.json()["dishes_count"] == len(
         submenu.dishes
     ), "Количество блюд не соответствует ожидаемому"
+
+
+@pytest.mark.usefixtures("test_add_two_dishes")
+async def test_get_menus_counts(
+    test_add_and_get_one_menu: Menu,
+) -> None:
+    menu = test_add_and_get_one_menu[0][0]
+    session = db_helper.get_scoped_session()
+    await session.execute(
+        insert(SubmenuModel).values(
+            title="EMPTY SUBMENU", description="", menu_id=menu.id
+        )
+    )
+    await session.execute(insert(MenuModel).values(title="EMPTY", description=""))
+    await session.commit()
+
+    menus = await crud.get_menus(session=session)
+    await session.close()
+
+    counts = {menu.title: (menu.submenus_count, menu.dishes_count) for menu in menus}
+    assert counts == {
+        "MENU1": (2, 2),
+        "EMPTY": (0, 0),
+    }, "Количество подменю и блюд не соответствует ожидаемому"
+
+
+@pytest.mark.usefixtures("test_add_two_dishes")
+async def test_get_menu_by_id_single_query(
+    test_add_and_get_one_menu: Menu,
+    sql_statements: list[str],
+    async_client: AsyncClient,
+) -> None:
+    menu = test_add_and_get_one_menu[0][0]
+    url = reverse(get_menu_by_id, menu_id=menu.id)
+    sql_statements.clear()
+
+    response = await async_client.get(url)
+
+    assert response.status_code == 200, "Статус ответа не 200"
+    assert (
+        response.json()["submenus_count"],
+        response.json()["dishes_count"],
+    ) == (1, 2), "Количество подменю и блюд не соответствует ожидаемому"
+    assert len(sql_statements) == 1, "Меню со счетчиками загружено не одним запросом"
+
+    sql_statements.clear()
+    cached = await async_client.get(url)
+
+    assert cached.json() == response.json(), "Ответ из кэша отличается"
+    assert not sql_statements, "Меню из кэша запрошено в БД"
@@ -26,6 +26,7 @@ async def post_dish() -> dict[str, Any]:
         "title": "DISH1",
         "description": "DISH1 DISH1 DISH1 DISH1 DISH1",
         "price": 20.4,
+        "dish_discount": 0,
     }
 
 
@@ -40,12 +41,14 @@ async def test_add_two_dishes(
             "description": "DISH1DISH1DISH1DISH1",
             "submenu_id": submenu.id,
             "price": 10.88,
+            "dish_discount": 0,
         },
         {
             "title": "DISH2",
             "description": "DISH2DISH2DISH2DISH2",
             "submenu_id": submenu.id,
             "price": 15.99,
+            "dish_discount": 0,
         },
     ]
 
@@ -75,6 +78,7 @@ async def test_add_and_get_one_dish(
         description="DISH1DISH1DISH1DISH1",
         submenu_id=submenu.id,
         price=10.88,
+        dish_discount=0,
     )
     await session.execute(stmt)
     await session.commit()
@@ -117,4 +121,5 @@ async def update_dish() -> dict[str, Any]:
         "title": "NEW DISH",
         "description": "NEW DISH NEW DISH NEW DISH NEW DISH",
         "price": 40,
+        "dish_discount": 0,
     }
@@ -1,9 +1,12 @@
+import uuid
 from decimal import Decimal
 from typing import Any
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import insert
 
+from api_v1.dishes.crud import select_dishes
 from api_v1.dishes.schemas import Dish
 from api_v1.dishes.views import (
     create_dish,
@@ -14,8 +17,11 @@ from api_v1.dishes.views import (
 )
 from api_v1.menus.schemas import Menu
 from api_v1.submenus.schemas import Submenu
+from core.models import Dish as DishModel
+from core.models import Submenu as SubmenuModel
+from core.models import db_helper
 from tests.menus.fixtures import test_add_and_get_one_menu
-from tests.service import reverse
+from tests.service import explain, reverse
 from tests.submenus.fixtures import test_add_and_get_one_submenu
 
 from .fixtures import (
@@ -190,3 +196,39 @@ async def test_delete_dish(
 
     assert response.status_code == 200, "Статус ответа не 200"
     assert response.json() is None, "Сообщение об удалении не соответствует ожидаемому"
+
+
+@pytest.mark.asyncio
+async def test_list_dishes_uses_index(test_add_and_get_one_menu: Menu) -> None:
+    menu = test_add_and_get_one_menu[0][0]
+    session = db_helper.get_scoped_session()
+    submenu_ids = [uuid.uuid4() for _ in range(50)]
+    await session.execute(
+        insert(SubmenuModel),
+        [
+            {"id": submenu_id, "title": f"SUBMENU{i}", "menu_id": menu.id}
+            for i, submenu_id in enumerate(submenu_ids)
+        ],
+    )
+    await session.execute(
+        insert(DishModel),
+        [
+            {
+                "title": f"DISH{i}.{j}",
+                "description": "",
+                "price": 10,
+                "dish_discount": 0,
+                "submenu_id": submenu_id,
+            }
+            for i, submenu_id in enumerate(submenu_ids)
+            for j in range(100)
+        ],
+    )
+    await session.commit()
+
+    plan = await explain(
+        session, select_dishes(menu_id=menu.id, submenu_id=submenu_ids[0])
+    )
+    await session.close()
+
+    assert "ix_dishes_submenu_id" in plan, "Блюда подменю выбираются без индекса"
@@ -1,7 +1,9 @@
+import uuid
 from decimal import Decimal
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import insert
 
 from api_v1.dishes.schemas import Dish
 from api_v1.menus.schemas import Menu
@@ -13,7 +15,15 @@ from api_v1.menus.views import (
     get_menus,
     update_menu_partial,
 )
+from api_v1.pagination import NEXT_CURSOR_HEADER
 from api_v1.submenus.schemas import Submenu
+from core.config import settings
+from core.models import Dish as DishModel
+from core.models import Menu as MenuModel
+from core.models import Submenu as SubmenuModel
+from core.models import db_helper
+from core.redis.cache_repository import CacheRepository
+from core.redis.redis_helper import redis_helper
 from tests.conftest import async_client
 from tests.dishes.fixtures import test_add_and_get_one_dish, test_get_one_dish_by_id
 from tests.service import reverse
@@ -75,6 +85,55 @@ async def test_get_menus(async_client: AsyncClient) -> None:
     assert response.json() != [], "В ответе пустой список"
 
 
+@pytest.mark.asyncio
+async def test_get_menus_by_pages(
+    async_client: AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    session = db_helper.get_scoped_session()
+    titles = [f"MENU{i}" for i in range(5)]
+    await session.execute(insert(MenuModel), [{"title": title} for title in titles])
+    await session.commit()
+    await session.close()
+    # меню добавлены мимо API, список из прошлых тестов может быть в кэше
+    await CacheRepository(redis_helper.get_client()).delete_all_menus_from_cache()
+
+    # второй проход читает страницы из кэша
+    for _ in range(2):
+        pages, cursor = [], None
+        while True:
+            params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+            response = await async_client.get(reverse(get_menus), params=params)
+            assert response.status_code == 200, "Статус ответа не 200"
+            pages.append([menu["title"] for menu in response.json()])
+            cursor = response.headers.get(NEXT_CURSOR_HEADER)
+            if cursor is None:
+                break
+
+        assert pages == [
+            ["MENU0", "MENU1"],
+            ["MENU2", "MENU3"],
+            ["MENU4"],
+        ], "Страницы меню не соответствуют ожидаемым"
+
+    response = await async_client.get(reverse(get_menus))
+    assert len(response.json()) == 5, "Список без limit обрезан"
+    assert NEXT_CURSOR_HEADER not in response.headers, "Курсор у полного списка"
+
+    monkeypatch.setattr(settings, "page_size", 2)
+    first = await async_client.get(reverse(get_menus), params={"limit": 1})
+    response = await async_client.get(
+        reverse(get_menus), params={"cursor": first.headers[NEXT_CURSOR_HEADER]}
+    )
+    assert [menu["title"] for menu in response.json()] == [
+        "MENU1",
+        "MENU2",
+    ], "Курсор без limit не отдает страницу размера по умолчанию"
+
+    response = await async_client.get(reverse(get_menus), params={"cursor": "bad"})
+    assert response.status_code == 422, "Неверный курсор не отклонен"
+
+
 @pytest.mark.asyncio
 async def test_get_menu_by_id(
     test_add_and_get_one_menu: Menu,
@@ -191,3 +250,73 @@ async def test_get_all_menus(
     assert dish_response["price"] == str(
         Decimal(dish.price).quantize(Decimal("0.00"))  # type: ignore
     ), "Цена не соответствует ожидаемому"
+
+
+@pytest.mark.asyncio
+async def test_get_all_menus_stream(
+    test_add_and_get_one_menu: Menu,
+    test_add_and_get_one_submenu: Submenu,
+    test_add_and_get_one_dish: Dish,
+    async_client: AsyncClient,
+) -> None:
+    submenu = test_add_and_get_one_submenu[0][0]
+    dish = test_add_and_get_one_dish[0][0]
+    # порядок id обратен порядку названий: сортировка по id их переставит
+    ids = sorted(uuid.uuid4() for _ in range(4))
+    session = db_helper.get_scoped_session()
+    await session.execute(insert(MenuModel).values(title="EMPTY MENU"))
+    await session.execute(
+        insert(SubmenuModel),
+        [
+            {"id": ids[0], "title": "SUBMENU3", "menu_id": submenu.menu_id},
+            {"id": ids[1], "title": "SUBMENU2", "menu_id": submenu.menu_id},
+        ],
+    )
+    await session.execute(
+        insert(DishModel),
+        [
+            {
+                "id": ids[2],
+                "title": "DISH3",
+                "price": 1,
+                "dish_discount": 0,
+                "submenu_id": ids[1],
+            },
+            {
+                "id": ids[3],
+                "title": "DISH2",
+                "price": 1,
+                "dish_discount": 0,
+                "submenu_id": ids[1],
+            },
+        ],
+    )
+    await session.commit()
+    await session.close()
+    cache_repo = CacheRepository(redis_helper.get_client())
+    await cache_repo.set_discount_to_cache(dish.id, 0.5)
+    await cache_repo.delete_all_base_cache()
+
+    response = await async_client.get(reverse(get_all_base), params={"stream": True})
+    expected = await async_client.get(reverse(get_all_base))
+
+    assert response.status_code == 200, "Статус ответа не 200"
+    assert response.headers["content-type"] == "application/json", "Тип ответа не JSON"
+    assert response.json() == expected.json(), "Потоковое дерево меню отличается"
+    assert [menu["title"] for menu in response.json()] == [
+        "EMPTY MENU",
+        "MENU1",
+    ], "Меню без подменю пропущено"
+    submenus = response.json()[1]["submenus"]
+    assert [submenu["title"] for submenu in submenus] == [
+        submenu.title,
+        "SUBMENU2",
+        "SUBMENU3",
+    ], "Подменю не упорядочены по названию"
+    assert [dish["title"] for dish in submenus[1]["dishes"]] == [
+        "DISH2",
+        "DISH3",
+    ], "Блюда не упорядочены по названию"
+    assert (
+        Decimal(submenus[0]["dishes"][0]["price"]) == Decimal(dish.price) / 2
+    ), "Скидка не применена"
@@ -1,5 +1,9 @@
 from typing import Callable
 
+from sqlalchemy import Select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
 from main import app
 
 
@@ -15,3 +19,14 @@ def reverse(foo: Callable, routes: dict[str, str] = get_routes(), **kwargs) -> s
     """Получение url адресу"""
     path = routes[foo.__name__]
     return path.format(**kwargs)
+
+
+async def explain(session: AsyncSession, stmt: Select) -> str:
+    """План выполнения запроса в PostgreSQL"""
+    await session.execute(text("ANALYZE"))
+    compiled = stmt.compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={"literal_binds": True},
+    )
+    result = await session.execute(text(f"EXPLAIN {compiled}"))
+    return "\n".join(result.scalars())
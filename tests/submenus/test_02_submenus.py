@@ -1,9 +1,12 @@
+import uuid
 from typing import Any
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import insert
 
 from api_v1.menus.schemas import Menu
+from api_v1.submenus.crud import select_submenus
 from api_v1.submenus.schemas import Submenu
 from api_v1.submenus.views import (
     create_submenu,
@@ -12,8 +15,11 @@ from api_v1.submenus.views import (
     get_submenus,
     update_submenu_partial,
 )
+from core.models import Menu as MenuModel
+from core.models import Submenu as SubmenuModel
+from core.models import db_helper
 from tests.menus.fixtures import test_add_and_get_one_menu
-from tests.service import reverse
+from tests.service import explain, reverse
 
 from .fixtures import (
     get_empty_submenus,
@@ -158,3 +164,27 @@ async def test_delete_submenu(
 
     assert response.status_code == 200, "Статус ответа не 200"
     assert response.json() is None, "Сообщение об удалении не соответствует ожидаемому"
+
+
+@pytest.mark.asyncio
+async def test_list_submenus_uses_index() -> None:
+    session = db_helper.get_scoped_session()
+    menu_ids = [uuid.uuid4() for _ in range(200)]
+    await session.execute(
+        insert(MenuModel),
+        [{"id": menu_id, "title": f"MENU{i}"} for i, menu_id in enumerate(menu_ids)],
+    )
+    await session.execute(
+        insert(SubmenuModel),
+        [
+            {"title": f"SUBMENU{i}.{j}", "menu_id": menu_id}
+            for i, menu_id in enumerate(menu_ids)
+            for j in range(10)
+        ],
+    )
+    await session.commit()
+
+    plan = await explain(session, select_submenus(menu_id=menu_ids[0]))
+    await session.close()
+
+    assert "ix_submenus_menu_id" in plan, "Подменю меню выбираются без индекса"
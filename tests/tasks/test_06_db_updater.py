@@ -0,0 +1,375 @@
+import asyncio
+import csv
+import json
+import os
+import time
+import uuid
+from decimal import Decimal
+from pathlib import Path
+
+import openpyxl
+import pytest
+from sqlalchemy import select
+
+from core.models import Dish, Menu, Submenu, db_helper
+from core.redis.redis_helper import get_async_redis_client
+from tasks import scheduler as scheduler_module
+from tasks.db_updater import DatabaseUpdater
+from tasks.parser import XlsxMenuParser, get_parser
+from tasks.scheduler import SyncScheduler, file_changes, sync_lock
+from tasks.tasks import update_db_async
+
+
+def workbook_menu(title: str, dishes: int) -> dict:
+    """Меню из файла с одним подменю и dishes блюдами"""
+    return {
+        "id": str(uuid.uuid4()),
+        "title": title,
+        "description": "",
+        "submenus": [
+            {
+                "id": str(uuid.uuid4()),
+                "title": f"{title} SUBMENU",
+                "description": "",
+                "dishes": [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "title": f"{title} DISH {i}",
+                        "description": "",
+                        "price": "10.50",
+                        "dish_discount": 0.1,
+                    }
+                    for i in range(dishes)
+                ],
+            }
+        ],
+    }
+
+
+async def update_db(full_base: list[dict]) -> set[uuid.UUID]:
+    async with db_helper.session_factory() as session:
+        redis_client = await get_async_redis_client()
+        updater = DatabaseUpdater(full_base, session=session, redis_client=redis_client)
+        await updater.add_menu_items(full_base)
+        await redis_client.aclose()
+        return updater.changed_menu_ids
+
+
+@pytest.mark.asyncio
+async def test_statements_do_not_grow_with_dishes(sql_statements: list[str]) -> None:
+    small, large = workbook_menu("SMALL", 2), workbook_menu("LARGE", 40)
+
+    await update_db([small])
+    small_statements = len(sql_statements)
+    sql_statements.clear()
+    changed = await update_db([small, large])
+
+    assert changed == {uuid.UUID(large["id"])}, "Изменено не только новое меню"
+    assert (
+        len(sql_statements) == small_statements
+    ), "Число запросов растет с числом блюд"
+
+
+@pytest.mark.asyncio
+async def test_update_moves_and_removes_rows() -> None:
+    first, second = workbook_menu("FIRST", 2), workbook_menu("SECOND", 1)
+    await update_db([first, second])
+    assert await update_db([first, second]) == set(), "Изменений нет, а меню есть"
+
+    moved = first["submenus"][0]["dishes"].pop()
+    moved["price"] = "12.00"
+    second["submenus"][0]["dishes"].append(moved)
+    removed_submenu = first["submenus"].pop()
+    # название удаленного блюда занимает новое блюдо
+    reused = dict(removed_submenu["dishes"][0], id=str(uuid.uuid4()))
+    second["submenus"][0]["dishes"].append(reused)
+
+    changed = await update_db([first, second])
+
+    assert changed == {
+        uuid.UUID(first["id"]),
+        uuid.UUID(second["id"]),
+    }, "Измененные меню определены неверно"
+    async with db_helper.session_factory() as session:
+        submenus = (await session.scalars(select(Submenu))).all()
+        dishes = {dish.id: dish for dish in await session.scalars(select(Dish))}
+        menus = (await session.scalars(select(Menu))).all()
+    assert len(menus) == 2, "Меню удалено"
+    assert [submenu.id for submenu in submenus] == [
+        uuid.UUID(second["submenus"][0]["id"])
+    ], "Подменю не удалено"
+    assert set(dishes) == {
+        uuid.UUID(dish["id"]) for dish in second["submenus"][0]["dishes"]
+    }, "Блюда не перенесены"
+    assert dishes[uuid.UUID(moved["id"])].price == Decimal("12.00"), "Цена не обновлена"
+
+    redis_client = await get_async_redis_client()
+    removed_dish_id = removed_submenu["dishes"][0]["id"]
+    assert not await redis_client.exists(
+        f"dish_discount_{removed_dish_id}"
+    ), "Скидка удаленного блюда осталась"
+    await redis_client.aclose()
+
+
+def workbook_rows(full_base: list[dict]) -> list[list]:
+    """Строки таблицы в формате admin/Menu.xlsx"""
+    rows = []
+    for menu in full_base:
+        rows.append([menu["id"], menu["title"], menu["title"]])
+        for submenu in menu["submenus"]:
+            rows.append([None, submenu["id"], submenu["title"], submenu["title"]])
+            for dish in submenu["dishes"]:
+                rows.append(
+                    [
+                        None,
+                        None,
+                        dish["id"],
+                        dish["title"],
+                        dish["title"],
+                        float(dish["price"]),
+                        dish["dish_discount"],
+                    ]
+                )
+    return rows
+
+
+def save_workbook(file_path: Path, full_base: list[dict]) -> None:
+    workbook = openpyxl.Workbook()
+    for row in workbook_rows(full_base):
+        workbook.active.append(row)
+    workbook.save(file_path)
+
+
+@pytest.mark.asyncio
+async def test_unchanged_workbook_skipped(
+    tmp_path: Path,
+    sql_statements: list[str],
+) -> None:
+    file_path = tmp_path / "Menu.xlsx"
+    first, second = workbook_menu("FIRST", 2), workbook_menu("SECOND", 2)
+    save_workbook(file_path, [first, second])
+
+    async def import_workbook() -> set[uuid.UUID]:
+        async with db_helper.session_factory() as session:
+            return await update_db_async(session, str(file_path))
+
+    assert await import_workbook() == {
+        uuid.UUID(first["id"]),
+        uuid.UUID(second["id"]),
+    }, "Файл не загружен"
+
+    sql_statements.clear()
+    assert await import_workbook() == set(), "Неизменный файл загружен"
+    os.utime(file_path, ns=(0, 0))
+    assert await import_workbook() == set(), "Файл с тем же содержимым загружен"
+    assert not sql_statements, "Загрузка неизменного файла обращается к БД"
+
+    redis_client = await get_async_redis_client()
+    skipped_discount = f"dish_discount_{first['submenus'][0]['dishes'][0]['id']}"
+    await redis_client.set(skipped_discount, "0.5")
+    second["submenus"][0]["dishes"][0]["price"] = "20.00"
+    save_workbook(file_path, [first, second])
+
+    assert await import_workbook() == {
+        uuid.UUID(second["id"])
+    }, "Загружена неизменная ветка"
+    assert (
+        await redis_client.get(skipped_discount) == b"0.5"
+    ), "Скидки неизменной ветки переписаны"
+    await redis_client.aclose()
+
+
+def test_streaming_parser_matches_workbook_model(tmp_path: Path) -> None:
+    file_path = tmp_path / "Menu.xlsx"
+    full_base = [workbook_menu("FIRST", 2), workbook_menu("SECOND", 0)]
+    save_workbook(file_path, full_base)
+
+    menus = XlsxMenuParser(file_path).iter_menus()
+
+    assert next(menus)["id"] == full_base[0]["id"], "Первое меню не отдано сразу"
+    assert [next(menus), *menus] == XlsxMenuParser(file_path, read_only=False).parse()[
+        1:
+    ], "Потоковое чтение отличается от чтения книги"
+
+
+def test_csv_and_jsonl_parsed_like_xlsx(tmp_path: Path) -> None:
+    full_base = [workbook_menu("FIRST", 2), workbook_menu("SECOND", 1)]
+    save_workbook(tmp_path / "Menu.xlsx", full_base)
+    with open(tmp_path / "Menu.csv", "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows(workbook_rows(full_base))
+    with open(tmp_path / "Menu.jsonl", "w", encoding="utf-8") as file:
+        for _, kind, record in XlsxMenuParser(tmp_path / "Menu.xlsx").iter_records():
+            file.write(json.dumps({"type": kind, **record}) + "\n")
+
+    menus = [
+        get_parser(tmp_path / f"Menu.{suffix}").parse()
+        for suffix in ("xlsx", "csv", "jsonl")
+    ]
+
+    assert menus[0] == menus[1], "CSV прочитан не так, как xlsx"
+    assert menus[0] == menus[2], "JSON Lines прочитан не так, как xlsx"
+    with pytest.raises(ValueError):
+        get_parser(tmp_path / "Menu.xls")
+
+
+@pytest.mark.parametrize(
+    "records, error",
+    [
+        (
+            [{"type": "menu"}, {"type": "drink"}],
+            "line 2: unknown record type 'drink'",
+        ),
+        ([{"type": "submenu"}], "line 1: submenu before its menu"),
+        (
+            [{"type": "menu"}, {"type": "submenu"}, {"type": "menu"}, {"type": "dish"}],
+            "line 4: dish before its submenu",
+        ),
+    ],
+)
+def test_malformed_menu_file_rejected(
+    tmp_path: Path,
+    records: list[dict],
+    error: str,
+) -> None:
+    file_path = tmp_path / "Menu.jsonl"
+    with open(file_path, "w", encoding="utf-8") as file:
+        for record in records:
+            file.write(json.dumps({**record, "id": str(uuid.uuid4())}) + "\n")
+
+    with pytest.raises(ValueError, match=error):
+        get_parser(file_path).parse()
+
+
+def test_csv_orphan_dish_rejected(tmp_path: Path) -> None:
+    file_path = tmp_path / "Menu.csv"
+    rows = workbook_rows([workbook_menu("FIRST", 1)])
+    with open(file_path, "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows([rows[0], rows[2]])
+
+    with pytest.raises(ValueError, match="line 2: dish before its submenu"):
+        get_parser(file_path).parse()
+
+
+@pytest.mark.asyncio
+async def test_zero_discount_dishes_imported(tmp_path: Path) -> None:
+    menu = workbook_menu("FIRST", 3)
+    dishes = menu["submenus"][0]["dishes"]
+    dishes[0]["dish_discount"], dishes[1]["dish_discount"] = 0, None
+    save_workbook(tmp_path / "Menu.xlsx", [menu])
+    with open(tmp_path / "Menu.csv", "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows(workbook_rows([menu]))
+
+    menus = [
+        get_parser(tmp_path / f"Menu.{suffix}").parse() for suffix in ("xlsx", "csv")
+    ]
+
+    assert menus[0] == menus[1], "CSV прочитан не так, как xlsx"
+    assert [dish["dish_discount"] for dish in menus[0][0]["submenus"][0]["dishes"]] == [
+        0,
+        0,
+        0.1,
+    ], "Блюда без скидки пропущены"
+    async with db_helper.session_factory() as session:
+        await update_db_async(session, str(tmp_path / "Menu.xlsx"))
+        imported = await session.scalars(select(Dish.id))
+        assert set(imported) == {
+            uuid.UUID(dish["id"]) for dish in dishes
+        }, "Блюда без скидки не загружены"
+
+
+def test_unrecognized_row_rejected(tmp_path: Path) -> None:
+    file_path = tmp_path / "Menu.csv"
+    rows = workbook_rows([workbook_menu("FIRST", 1)])
+    # у блюда нет цены
+    rows[2][5] = None
+    with open(file_path, "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows(rows)
+
+    with pytest.raises(ValueError, match="line 3: unrecognized row"):
+        get_parser(file_path).parse()
+
+
+@pytest.mark.asyncio
+async def test_scheduler_syncs_settled_changes_one_at_a_time(tmp_path: Path) -> None:
+    file_path = str(tmp_path / "Menu.csv")
+    Path(file_path).write_text("menu")
+    redis_client = await get_async_redis_client()
+    started = time.monotonic()
+    runs: list[tuple[int, float]] = []
+    running = 0
+    overlapped = False
+
+    def scheduler(number: int) -> SyncScheduler:
+        async def sync() -> None:
+            nonlocal running, overlapped
+            running += 1
+            overlapped = overlapped or running > 1
+            runs.append((number, time.monotonic() - started))
+            await asyncio.sleep(0.1)
+            running -= 1
+
+        return SyncScheduler(
+            file_path,
+            sync,
+            lock=sync_lock(redis_client, file_path),
+            debounce=0.05,
+            min_interval=0.2,
+            poll_interval=0.01,
+        )
+
+    workers = [asyncio.create_task(scheduler(number).run()) for number in (1, 2)]
+    await asyncio.sleep(0.6)
+    initial_runs = len(runs)
+    # файл дописывается частями: загрузка ждет, пока он перестанет меняться
+    for part in range(15):
+        with open(file_path, "a") as file:
+            file.write(f"dish {part}\n")
+        await asyncio.sleep(0.02)
+    changed_at = time.monotonic() - started
+    await asyncio.sleep(0.8)
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    await redis_client.aclose()
+
+    assert not overlapped, "Загрузки шли одновременно"
+    assert {number for number, _ in runs[:initial_runs]} == {
+        1,
+        2,
+    }, "Нет загрузки при запуске"
+    assert all(
+        at < changed_at - 0.3 or at > changed_at for _, at in runs
+    ), "Загрузка начата, пока файл менялся"
+    assert {number for number, at in runs if at > changed_at} == {
+        1,
+        2,
+    }, "Изменение файла не загружено"
+    for number in (1, 2):
+        starts = [at for run, at in runs if run == number]
+        assert all(
+            later - earlier >= 0.2 for earlier, later in zip(starts, starts[1:])
+        ), "Загрузки чаще min_interval"
+
+
+@pytest.mark.asyncio
+async def test_file_changes_fall_back_to_polling(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    file_path = tmp_path / "Menu.csv"
+    file_path.write_text("menu")
+
+    async def no_inotify(path: str):
+        raise OSError(28, "inotify watch limit reached")
+        yield
+
+    monkeypatch.setattr(scheduler_module, "awatch", no_inotify)
+    changes = file_changes(str(file_path), poll_interval=0.01)
+
+    # после отказа inotify изменение отдается сразу, файл мог уже измениться
+    await asyncio.wait_for(anext(changes), 1)
+    change = asyncio.ensure_future(anext(changes))
+    await asyncio.sleep(0.05)
+    file_path.write_text("menu\ndish")
+    await asyncio.wait_for(change, 1)
+    await changes.aclose()